@@ -0,0 +1,98 @@
+from optparse import make_option
+import math
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, int(math.ceil(fraction * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Replays recorded search queries against the search api and reports the latency.\n\n"
+            "The file holds one query string per line, as sent by the search page, e.g.\n"
+            "    q=roads&type__in=layer&limit=20&offset=0\n"
+            "Queries run against the haystack connection configured in the settings, point\n"
+            "HAYSTACK_CONNECTIONS to a local Whoosh index or Elasticsearch node and run\n"
+            "rebuild_index before benchmarking.")
+
+    args = 'queries_file'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '-u',
+            '--user',
+            dest="user",
+            default=None,
+            help="Username the queries are run as, anonymous by default"),
+        make_option(
+            '-p',
+            '--password',
+            dest="password",
+            default=None,
+            help="Password of the user"),
+        make_option(
+            '-r',
+            '--repeat',
+            dest='repeat',
+            type='int',
+            default=1,
+            help='Number of times every query is replayed'),
+        make_option(
+            '-w',
+            '--warmup',
+            dest='warmup',
+            type='int',
+            default=0,
+            help='Number of queries run before measuring'),
+        make_option(
+            '--resource',
+            dest='resource',
+            default='base',
+            help='Api resource searched (base, layers, maps or documents)'),
+    )
+
+    def handle(self, *args, **options):
+        if not settings.HAYSTACK_SEARCH:
+            raise CommandError('HAYSTACK_SEARCH is disabled, there is no search api to benchmark.')
+        if len(args) != 1:
+            raise CommandError('Please pass the file with the recorded queries.')
+
+        with open(args[0]) as f:
+            queries = [line.strip().lstrip('?') for line in f if line.strip() and not line.startswith('#')]
+        if not queries:
+            raise CommandError('No queries found in %s' % args[0])
+
+        client = Client()
+        if options.get('user') and not client.login(username=options.get('user'),
+                                                     password=options.get('password')):
+            raise CommandError('Could not log in as %s' % options.get('user'))
+
+        url = reverse('api_get_search', kwargs={'api_name': 'api',
+                                                'resource_name': options.get('resource')})
+
+        for query in queries[:options.get('warmup')]:
+            client.get('%s?%s' % (url, query))
+
+        timings = []
+        errors = 0
+        for i in range(options.get('repeat')):
+            for query in queries:
+                start = time.time()
+                response = client.get('%s?%s' % (url, query))
+                timings.append((time.time() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        timings.sort()
+        print "%d queries, %d errors" % (len(timings), errors)
+        print "mean %.1f ms" % (sum(timings) / len(timings))
+        for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p95', 0.95), ('p99', 0.99)):
+            print "%s  %.1f ms" % (label, percentile(timings, fraction))
+        print "max  %.1f ms" % timings[-1]
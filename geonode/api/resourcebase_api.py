@@ -1,15 +1,16 @@
 import re
+import hashlib
+import urllib
 from django.db.models import Q
 from django.http import HttpResponse
 from django.conf import settings
+from django.core.cache import cache
 
 from tastypie.constants import ALL, ALL_WITH_RELATIONS
 from tastypie.resources import ModelResource
 from tastypie import fields
 from tastypie.utils import trailing_slash
 
-from guardian.shortcuts import get_objects_for_user
-
 from django.conf.urls import url
 from django.core.paginator import Paginator, InvalidPage
 from django.http import Http404
@@ -22,6 +23,7 @@ from geonode.layers.models import Layer
 from geonode.maps.models import Map
 from geonode.documents.models import Document
 from geonode.base.models import ResourceBase
+from geonode.security.models import get_user_principals
 
 from .authorization import GeoNodeAuthorization
 
@@ -286,41 +288,45 @@ class CommonModelApi(ModelResource):
         # Get the list of objects that matches the filter
         sqs = self.build_haystack_filters(request.GET)
 
-        if not settings.SKIP_PERMS_FILTER:
-            # Get the list of objects the user has access to
-            filter_set = set(
-                get_objects_for_user(
-                    request.user,
-                    'base.view_resourcebase').values_list(
-                    'id',
-                    flat=True))
-
-            # Do the query using the filterset and the query term. Facet the
-            # results
-            if len(filter_set) > 0:
-                sqs = sqs.filter(oid__in=filter_set).facet('type').facet('subtype').facet('owner').facet('keywords')\
-                    .facet('category')
-            else:
-                sqs = None
-        else:
+        if not settings.SKIP_PERMS_FILTER and not request.user.is_superuser:
+            # Let the search backend drop the objects the user has no access
+            # to, the ACL of every object is stored in the index.
+            sqs = sqs.filter(acl__in=get_user_principals(request.user))
+
+        # Anonymous users all see the same facets for a query, they can be
+        # reused for a little while instead of being computed again.
+        facets = None
+        facets_cache_key = None
+        if settings.HAYSTACK_FACET_CACHE_TIME and not request.user.is_authenticated():
+            facets_cache_key = self.get_facets_cache_key(request.GET)
+            facets = cache.get(facets_cache_key)
+
+        if facets is None:
             sqs = sqs.facet('type').facet('subtype').facet(
                 'owner').facet('keywords').facet('category')
 
-        if sqs:
+        limit = int(request.GET.get('limit'))
+        page_number = int(request.GET.get('offset')) / int(request.GET.get('limit'), 0) + 1
+
+        # Fetching the page runs the search, the backend sends the total count
+        # and the facets along with the results so they are not asked again.
+        results = sqs[(page_number - 1) * limit:page_number * limit]
+        total_count = sqs.count()
+
+        if total_count:
             # Build the Facet dict
-            facets = {}
-            for facet in sqs.facet_counts()['fields']:
-                facets[facet] = {}
-                for item in sqs.facet_counts()['fields'][facet]:
-                    facets[facet][item[0]] = item[1]
+            if facets is None:
+                facets = {}
+                for facet, items in sqs.facet_counts().get('fields', {}).items():
+                    facets[facet] = dict(items)
+                if facets_cache_key is not None:
+                    cache.set(facets_cache_key, facets, settings.HAYSTACK_FACET_CACHE_TIME)
 
             # Paginate the results
-            paginator = Paginator(sqs, request.GET.get('limit'))
+            paginator = Paginator(sqs, limit)
 
             try:
-                page = paginator.page(
-                    int(request.GET.get('offset')) /
-                    int(request.GET.get('limit'), 0) + 1)
+                page = paginator.page(page_number)
             except InvalidPage:
                 raise Http404("Sorry, no results on that page.")
 
@@ -332,12 +338,10 @@ class CommonModelApi(ModelResource):
                 next_page = page.next_page_number()
             else:
                 next_page = 1
-            total_count = sqs.count()
-            objects = page.object_list
+            objects = results
         else:
             next_page = 0
             previous_page = 0
-            total_count = 0
             facets = {}
             objects = []
 
@@ -354,6 +358,18 @@ class CommonModelApi(ModelResource):
         self.log_throttled_access(request)
         return self.create_response(request, object_list)
 
+    def get_facets_cache_key(self, parameters):
+        """
+        Cache key of the facets of a search, paging and sorting do not
+        change the facets.
+        """
+        params = sorted((key.encode('utf-8'), [value.encode('utf-8') for value in values])
+                        for key, values in parameters.iterlists()
+                        if key not in ('offset', 'limit', 'order_by'))
+        return 'search_facets_%s_%s' % (
+            self._meta.resource_name,
+            hashlib.md5(urllib.urlencode(params, doseq=True)).hexdigest())
+
     def get_list(self, request, **kwargs):
         """
         Returns a serialized list of resources.
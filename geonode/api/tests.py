@@ -1,6 +1,8 @@
+from django.http import QueryDict
 from django.core.urlresolvers import reverse
 from tastypie.test import ResourceTestCase
 
+from geonode.api.resourcebase_api import LayerResource
 from geonode.base.populate_test_data import create_models, all_public
 from geonode.layers.models import Layer
 
@@ -185,3 +187,10 @@ class SearchApiTests(ResourceTestCase):
         resp = self.api_client.get(filter_url)
         self.assertValidJSONResponse(resp)
         self.assertEquals(len(self.deserialize(resp)['objects']), 4)
+
+    def test_facets_cache_key(self):
+        """Test the facets cache key of non ascii searches"""
+        resource = LayerResource()
+        key = resource.get_facets_cache_key(QueryDict(u'q=caf\xe9&limit=10'.encode('utf-8')))
+        self.assertEquals(key, resource.get_facets_cache_key(QueryDict(u'q=caf\xe9&offset=20'.encode('utf-8'))))
+        self.assertNotEquals(key, resource.get_facets_cache_key(QueryDict('q=cafe')))
@@ -0,0 +1,81 @@
+from optparse import make_option
+from multiprocessing.pool import ThreadPool
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from geonode.base.models import ResourceBase
+from geonode.base.thumbnails import get_thumbnail_generator
+
+
+class Command(BaseCommand):
+    help = ("Regenerates the thumbnails of layers, maps and documents.\n\n"
+            "Resources whose thumbnail is up to date are skipped unless --force is given.")
+
+    args = '[resource_id ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '-j',
+            '--jobs',
+            dest='jobs',
+            type='int',
+            default=4,
+            help='Number of thumbnails rendered at the same time.'),
+        make_option(
+            '-t',
+            '--type',
+            dest='type',
+            default=None,
+            help='Only regenerate thumbnails for this type of resource (layer, map or document).'),
+        make_option(
+            '-f',
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Regenerate thumbnails even if nothing changed.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity'))
+        force = options.get('force')
+        jobs = max(1, options.get('jobs'))
+
+        resources = ResourceBase.objects.polymorphic_queryset()
+        if args:
+            resources = resources.filter(id__in=args)
+        if options.get('type'):
+            resources = resources.filter(
+                polymorphic_ctype__model=options.get('type'))
+
+        def regenerate(resource):
+            try:
+                get_thumbnail_generator(resource)(resource, force=force)
+            except Exception:
+                return resource, traceback.format_exc()
+            finally:
+                # Every thread opens its own database connection.
+                connection.close()
+            return resource, None
+
+        targets = [r for r in resources if get_thumbnail_generator(r) is not None]
+
+        pool = ThreadPool(jobs)
+        failed = 0
+        try:
+            for resource, error in pool.imap_unordered(regenerate, targets):
+                if error is not None:
+                    failed += 1
+                    print 'Failed to regenerate thumbnail for %s (%s)' % (resource, resource.id)
+                    if verbosity > 1:
+                        print error
+                elif verbosity > 0:
+                    print 'Processed thumbnail for %s (%s)' % (resource, resource.id)
+        finally:
+            pool.close()
+            pool.join()
+
+        if verbosity > 0:
+            print '%d thumbnails processed, %d failed' % (len(targets), failed)
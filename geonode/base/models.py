@@ -8,6 +8,7 @@ from django.db import models
 from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ValidationError
+from django.db.models.fields import FieldDoesNotExist
 from django.core.files.base import ContentFile
 from django.conf import settings
 from django.contrib.staticfiles.templatetags import staticfiles
@@ -20,6 +21,7 @@ from mptt.models import MPTTModel, TreeForeignKey
 from polymorphic import PolymorphicModel, PolymorphicManager
 from agon_ratings.models import OverallRating
 
+from geonode.base.signals import depends_on
 from geonode.base.enumerations import ALL_LANGUAGES, \
     HIERARCHY_LEVELS, UPDATE_FREQUENCIES, \
     DEFAULT_SUPPLEMENTAL_INFORMATION, LINK_TYPES
@@ -361,6 +363,71 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin):
     detail_url = models.CharField(max_length=255, null=True, blank=True)
     rating = models.IntegerField(default=0, null=True)
 
+    def __init__(self, *args, **kwargs):
+        super(ResourceBase, self).__init__(*args, **kwargs)
+        self._loaded_values = self._field_values()
+        self._marked_changes = set()
+
+    def _field_values(self):
+        # Deferred fields are not in __dict__ until they are read.
+        return dict((f.attname, self.__dict__[f.attname])
+                    for f in self._meta.concrete_fields if f.attname in self.__dict__)
+
+    def mark_changed(self, *names):
+        """
+        Record a change of data saved apart from the fields, e.g. 'keywords',
+        so the handlers depending on it run on the next save.
+        """
+        self._marked_changes.update(names)
+
+    def changed_fields(self):
+        """
+        Returns the attribute names of the fields changed since the resource
+        was loaded or saved, and the names marked as changed. None for a
+        resource not saved yet.
+        """
+        if self._state.adding or self.pk is None:
+            return None
+        changed = set(self._marked_changes)
+        for name, value in self._loaded_values.items():
+            if self.__dict__.get(name, value) != value:
+                changed.add(name)
+        return changed
+
+    def _attnames(self, names):
+        attnames = set()
+        for name in names:
+            try:
+                attnames.add(self._meta.get_field(name).attname)
+            except FieldDoesNotExist:
+                attnames.add(name)
+        return attnames
+
+    def has_changed(self, *names):
+        changed = self.changed_fields()
+        if changed is None:
+            return True
+        return bool(changed & self._attnames(names))
+
+    def save(self, *args, **kwargs):
+        # What changed in this save, see geonode.base.signals.depends_on.
+        previous = getattr(self, '_save_changes', None)
+        self._save_changes = self.changed_fields()
+        try:
+            super(ResourceBase, self).save(*args, **kwargs)
+        finally:
+            self._save_changes = previous
+        self._loaded_values = self._field_values()
+        self._marked_changes = set()
+
+    def _save_table(self, *args, **kwargs):
+        # The pre_save handlers ran, add the fields they changed, like the
+        # bounding box GeoServer sends back, for the post_save handlers. A
+        # save without changes still synchronizes everything.
+        if getattr(self, '_save_changes', None):
+            self._save_changes = self.changed_fields()
+        return super(ResourceBase, self)._save_table(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         super(ResourceBase, self).delete(*args, **kwargs)
         resourcebase_post_delete(self)
@@ -592,6 +659,7 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin):
         ContactRole.objects.filter(role='pointOfContact', resource=self).delete()
         # create the new assignation
         ContactRole.objects.create(role='pointOfContact', resource=self, contact=poc)
+        self.mark_changed('poc')
 
     def _get_poc(self):
         try:
@@ -607,6 +675,7 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin):
         ContactRole.objects.filter(role='author', resource=self).delete()
         # create the new assignation
         ContactRole.objects.create(role='author', resource=self, contact=metadata_author)
+        self.mark_changed('metadata_author')
 
     def _get_metadata_author(self):
         try:
@@ -681,6 +750,7 @@ def resourcebase_post_delete(instance):
         instance.thumbnail.delete()
 
 
+@depends_on('thumbnail', 'owner', 'name', 'typename', 'poc', 'metadata_author')
 def resourcebase_post_save(instance, *args, **kwargs):
     """
     Used to fill any additional fields after the save.
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Views of the detail pages, counted in popular_count.
+
+Views are added up in memory by every process and written every
+POPULAR_COUNT_FLUSH_INTERVAL seconds, or once POPULAR_COUNT_FLUSH_SIZE of
+them are waiting, with one UPDATE per distinct number of views. Neither
+save() nor any signal is involved.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+POPULAR_COUNT_FLUSH_INTERVAL = getattr(settings, 'POPULAR_COUNT_FLUSH_INTERVAL', 60)
+POPULAR_COUNT_FLUSH_SIZE = getattr(settings, 'POPULAR_COUNT_FLUSH_SIZE', 100)
+
+_views = {}
+_pending = [0]
+_flushed = [time.time()]
+_lock = threading.Lock()
+
+
+def count_view(resource):
+    """Counts a view of the detail page of a resource"""
+    with _lock:
+        _views[resource.id] = _views.get(resource.id, 0) + 1
+        _pending[0] += 1
+        due = (_pending[0] >= POPULAR_COUNT_FLUSH_SIZE or
+               time.time() - _flushed[0] >= POPULAR_COUNT_FLUSH_INTERVAL)
+    if due:
+        flush_views()
+
+
+def flush_views():
+    """Adds the views counted so far to popular_count"""
+    from geonode.base.models import ResourceBase
+
+    with _lock:
+        views = dict(_views)
+        _views.clear()
+        _pending[0] = 0
+        _flushed[0] = time.time()
+    if not views:
+        return
+
+    by_count = {}
+    for resource_id, count in views.items():
+        by_count.setdefault(count, []).append(resource_id)
+    try:
+        for count, ids in by_count.items():
+            ResourceBase.objects.filter(id__in=ids).update(popular_count=F('popular_count') + count)
+            for resource_id in ids:
+                del views[resource_id]
+    except Exception:
+        # Keep what was not written for the next flush.
+        logger.exception('Could not write the views of %d resources', len(views))
+        with _lock:
+            for resource_id, count in views.items():
+                _views[resource_id] = _views.get(resource_id, 0) + count
+                _pending[0] += count
+
+
+atexit.register(flush_views)
@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+
+from django.db import transaction
+
+_coalesced = local()
+
+
+def saves_coalesced():
+    """True while the post_save handlers of resources wait for the end of a coalesce_saves block.
+    """
+    return getattr(_coalesced, 'pending', None) is not None
+
+
+def needs_sync(instance, fields=(), exclude=()):
+    """True if a save of instance has to run a handler depending on fields,
+       or on anything but exclude when no field is given.
+
+       New resources, resources saved without any change (an explicit
+       request to synchronize them) and signals sent without a save always
+       run their handlers.
+    """
+    changes = getattr(instance, '_save_changes', None)
+    if not changes:
+        return True
+    if fields:
+        return bool(changes & instance._attnames(fields))
+    return bool(changes - instance._attnames(exclude))
+
+
+def depends_on(*fields, **options):
+    """Run a pre_save or post_save handler of a resource only when it has to.
+
+       The handler runs when one of the fields changed, or any field but
+       the excluded ones when no field is given. Resources can mark related
+       data as changed too, like 'keywords' or 'poc', see
+       ResourceBase.mark_changed. Inside a coalesce_saves block post_save
+       handlers run once per resource when the block ends.
+    """
+    exclude = options.get('exclude', ())
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(instance, sender, **kwargs):
+            if not needs_sync(instance, fields, exclude):
+                return
+            if 'created' in kwargs and saves_coalesced():
+                key = (handler, sender, instance.pk)
+                if key in _coalesced.pending:
+                    previous = _coalesced.pending[key][2]
+                    kwargs['created'] = kwargs['created'] or previous['created']
+                _coalesced.pending[key] = (handler, instance, dict(kwargs, sender=sender))
+                if key not in _coalesced.order:
+                    _coalesced.order.append(key)
+                return
+            return handler(instance=instance, sender=sender, **kwargs)
+        wrapper.fields = fields
+        wrapper.exclude = exclude
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def coalesce_saves():
+    """Synchronize the resources saved in the block once, when it ends.
+
+       The block runs in a transaction. The post_save handlers declared
+       with depends_on run once per resource and handler, with the
+       resource as it was last saved, after the transaction is committed.
+       Nothing is synchronized if the block fails. Inside an outer
+       transaction the block only ends at a savepoint, the handlers then
+       run before the outer transaction commits.
+    """
+    if saves_coalesced():
+        yield
+        return
+
+    _coalesced.pending = {}
+    _coalesced.order = []
+    try:
+        with transaction.atomic():
+            yield
+        pending, order = _coalesced.pending, _coalesced.order
+    finally:
+        _coalesced.pending = _coalesced.order = None
+
+    for key in order:
+        handler, instance, kwargs = pending[key]
+        handler(instance=instance, **kwargs)
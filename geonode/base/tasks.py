@@ -0,0 +1,8 @@
+from celery.task import task
+
+from geonode.base.thumbnails import generate_thumbnail
+
+
+@task(name='geonode.base.tasks.create_thumbnail', ignore_result=True)
+def create_thumbnail(resource_id, force=False):
+    generate_thumbnail(resource_id, force=force)
@@ -1,5 +1,13 @@
+import threading
+
 from django.test import TestCase
+from django.db.models.signals import post_save, pre_save
+from geonode.base import popularity
+from geonode.base.signals import coalesce_saves, depends_on
 from geonode.base.models import ResourceBase
+from geonode.base.thumbnails import (_generators, generate_thumbnail, queue_thumbnail,
+                                     register_thumbnail_generator)
+from geonode.utils import thread_http_client
 
 
 class ThumbnailTests(TestCase):
@@ -16,3 +24,136 @@ class ThumbnailTests(TestCase):
         self.assertFalse(self.rb.has_thumbnail())
         missing = self.rb.get_thumbnail_url()
         self.assertEquals('/static/geonode/img/missing_thumb.png', missing)
+
+    def test_thread_http_client(self):
+        # Thumbnails are rendered by several threads, each one has its own client
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(thread_http_client()))
+        thread.start()
+        thread.join()
+        self.assertTrue(thread_http_client() is thread_http_client())
+        self.assertFalse(clients[0] is thread_http_client())
+
+
+class ThumbnailQueueTests(TestCase):
+
+    def setUp(self):
+        self.rb = ResourceBase.objects.create()
+        self.rendered = []
+        register_thumbnail_generator(
+            ResourceBase,
+            lambda instance, force=False: self.rendered.append((instance.id, force)))
+
+    def tearDown(self):
+        _generators.pop(ResourceBase, None)
+
+    def test_synchronous_fallback(self):
+        with self.settings(USE_QUEUE=False):
+            queue_thumbnail(self.rb, force=True)
+        self.assertEquals([(self.rb.id, True)], self.rendered)
+
+    def test_generate_removed_resource(self):
+        resource_id = self.rb.id
+        self.rb.delete()
+        generate_thumbnail(resource_id)
+        self.assertEquals([], self.rendered)
+
+
+class PopularityTests(TestCase):
+
+    def setUp(self):
+        self.rb = ResourceBase.objects.create()
+        popularity.flush_views()
+
+    def test_views_are_flushed_together(self):
+        other = ResourceBase.objects.create()
+        saved = []
+
+        def on_save(sender, instance, **kwargs):
+            saved.append(instance.id)
+        post_save.connect(on_save)
+        try:
+            for i in range(3):
+                popularity.count_view(self.rb)
+            popularity.count_view(other)
+            popularity.flush_views()
+        finally:
+            post_save.disconnect(on_save)
+
+        self.assertEquals([], saved)
+        self.assertEquals(3, ResourceBase.objects.get(id=self.rb.id).popular_count)
+        self.assertEquals(1, ResourceBase.objects.get(id=other.id).popular_count)
+
+        popularity.flush_views()
+        self.assertEquals(3, ResourceBase.objects.get(id=self.rb.id).popular_count)
+
+
+class ChangeTrackingTests(TestCase):
+
+    def setUp(self):
+        self.rb = ResourceBase.objects.create(title='roads')
+        self.synced = []
+
+        @depends_on('title', 'keywords')
+        def sync_title(instance, sender, **kwargs):
+            self.synced.append((instance.id, instance.title))
+        self.handler = sync_title
+        post_save.connect(self.handler, sender=ResourceBase)
+
+    def tearDown(self):
+        post_save.disconnect(self.handler, sender=ResourceBase)
+
+    def test_changed_fields(self):
+        self.assertEquals(None, ResourceBase(title='new').changed_fields())
+        rb = ResourceBase.objects.get(id=self.rb.id)
+        self.assertEquals(set(), rb.changed_fields())
+        rb.title = 'rivers'
+        rb.mark_changed('keywords')
+        self.assertEquals(set(['title', 'keywords']), rb.changed_fields())
+        self.assertTrue(rb.has_changed('abstract', 'title'))
+        self.assertFalse(rb.has_changed('abstract'))
+        rb.save()
+        self.assertEquals(set(), rb.changed_fields())
+
+    def test_handlers_depend_on_fields(self):
+        self.rb.abstract = 'only the abstract'
+        self.rb.save()
+        self.assertEquals([], self.synced)
+
+        self.rb.title = 'rivers'
+        self.rb.save()
+        self.assertEquals([(self.rb.id, 'rivers')], self.synced)
+
+        # Saving without changes synchronizes everything.
+        self.rb.save()
+        self.assertEquals(2, len(self.synced))
+
+    def test_changes_made_by_pre_save_handlers(self):
+        def refresh_title(instance, sender, **kwargs):
+            instance.title = 'from the backend'
+        pre_save.connect(refresh_title, sender=ResourceBase)
+        try:
+            self.rb.abstract = 'only the abstract'
+            self.rb.save()
+        finally:
+            pre_save.disconnect(refresh_title, sender=ResourceBase)
+        self.assertEquals([(self.rb.id, 'from the backend')], self.synced)
+
+    def test_coalesce_saves(self):
+        with coalesce_saves():
+            self.rb.title = 'rivers'
+            self.rb.save()
+            self.rb.title = 'lakes'
+            self.rb.save()
+            self.assertEquals([], self.synced)
+        self.assertEquals([(self.rb.id, 'lakes')], self.synced)
+
+    def test_coalesce_saves_failed(self):
+        with self.assertRaises(ValueError):
+            with coalesce_saves():
+                self.rb.title = 'rivers'
+                self.rb.save()
+                raise ValueError()
+        # Rolled back and not synchronized
+        self.assertEquals([], self.synced)
+        self.assertEquals('roads', ResourceBase.objects.get(id=self.rb.id).title)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Thumbnail generation for GeoNode resources.
+
+Thumbnails are rendered by whatever owns the resource (GeoServer for layers
+and maps, PIL or wand for documents). Each of them registers a generator for
+its model and saving a resource only asks for the thumbnail to be built.
+When settings.USE_QUEUE is enabled the work is handed to a celery worker,
+otherwise the generator is called right away.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# How long a queued thumbnail blocks new requests for the same resource.
+THUMBNAIL_QUEUE_TIMEOUT = getattr(settings, 'THUMBNAIL_QUEUE_TIMEOUT', 300)
+
+_generators = {}
+
+
+def register_thumbnail_generator(model, generator):
+    """Render the thumbnails of ``model`` with ``generator(instance, force=False)``
+    """
+    _generators[model] = generator
+
+
+def get_thumbnail_generator(instance):
+    for klass in type(instance).__mro__:
+        if klass in _generators:
+            return _generators[klass]
+    return None
+
+
+def _pending_key(resource_id):
+    return 'thumbnail_pending_%s' % resource_id
+
+
+def queue_thumbnail(instance, force=False):
+    """Ask for the thumbnail of ``instance`` to be (re)generated.
+
+    Requests for a resource that already has a thumbnail waiting in the
+    queue are dropped, the worker always renders the latest saved state.
+    """
+    generator = get_thumbnail_generator(instance)
+    if generator is None:
+        return
+
+    if not settings.USE_QUEUE:
+        generator(instance, force=force)
+        return
+
+    resource_id = instance.get_self_resource().id
+    if cache.add(_pending_key(resource_id), True, THUMBNAIL_QUEUE_TIMEOUT):
+        from geonode.base.tasks import create_thumbnail
+        create_thumbnail.delay(resource_id, force=force)
+    else:
+        logger.debug('Thumbnail for resource %s is already queued', resource_id)
+
+
+def generate_thumbnail(resource_id, force=False):
+    """Build the thumbnail of the resource with id ``resource_id`` now.
+    """
+    from geonode.base.models import ResourceBase
+
+    # Release the lock first, saves happening while we render queue again.
+    cache.delete(_pending_key(resource_id))
+
+    try:
+        instance = ResourceBase.objects.polymorphic_queryset().get(id=resource_id)
+    except ResourceBase.DoesNotExist:
+        logger.debug('Resource %s was removed before its thumbnail was built', resource_id)
+        return
+
+    generator = get_thumbnail_generator(instance)
+    if generator is not None:
+        generator(instance, force=force)
@@ -23,13 +23,22 @@ import logging
 from django.conf import settings
 from django.db.models import signals
 from geonode.layers.models import Layer
+from geonode.layers.signals import layer_finished
+from geonode.layers.utils import post_processing_deferred
 from geonode.documents.models import Document
 from geonode.catalogue import get_catalogue
 from geonode.base.models import Link, ResourceBase
+from geonode.base.signals import depends_on
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Fields that are not part of the metadata record, or are derived from it.
+CATALOGUE_IGNORED_FIELDS = ('popular_count', 'share_count', 'rating', 'featured', 'thumbnail',
+                            'thumbnail_url', 'detail_url', 'metadata_xml', 'csw_anytext',
+                            'csw_wkt_geometry', 'csw_insert_date', 'distribution_url',
+                            'distribution_description')
+
 
 def catalogue_pre_delete(instance, sender, **kwargs):
     """Removes the layer from the catalogue
@@ -38,9 +47,26 @@ def catalogue_pre_delete(instance, sender, **kwargs):
     catalogue.remove_record(instance.uuid)
 
 
+@depends_on(exclude=CATALOGUE_IGNORED_FIELDS)
 def catalogue_post_save(instance, sender, **kwargs):
     """Get information from catalogue
     """
+    # The record is created later on for bulk imports.
+    if post_processing_deferred():
+        return
+
+    create_catalogue_record(instance)
+
+
+def catalogue_layer_finished(instance, sender, **kwargs):
+    """Create the catalogue record deferred by a bulk import.
+    """
+    create_catalogue_record(instance)
+
+
+def create_catalogue_record(instance):
+    """Create the catalogue record of a resource and its metadata links.
+    """
     try:
         catalogue = get_catalogue()
         catalogue.create_record(instance)
@@ -84,6 +110,7 @@ def catalogue_post_save(instance, sender, **kwargs):
     resources.update(csw_anytext=csw_anytext)
 
 
+@depends_on(exclude=CATALOGUE_IGNORED_FIELDS)
 def catalogue_pre_save(instance, sender, **kwargs):
     """Send information to catalogue
     """
@@ -122,6 +149,7 @@ def catalogue_pre_save(instance, sender, **kwargs):
 if 'geonode.catalogue' in settings.INSTALLED_APPS:
     signals.pre_save.connect(catalogue_pre_save, sender=Layer)
     signals.post_save.connect(catalogue_post_save, sender=Layer)
+    layer_finished.connect(catalogue_layer_finished, sender=Layer)
     signals.pre_delete.connect(catalogue_pre_delete, sender=Layer)
     signals.pre_save.connect(catalogue_pre_save, sender=Document)
     signals.post_save.connect(catalogue_post_save, sender=Document)
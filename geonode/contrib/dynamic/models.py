@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 import keyword
+import logging
 import re
 
 from django.utils.datastructures import SortedDict
@@ -11,10 +12,14 @@ from django.contrib.gis import admin
 from django.core.exceptions import ValidationError
 from django import db
 
+from geonode.base.signals import depends_on
 from geonode.layers.models import Layer
+from geonode.datastore import vacuum
 
 from .postgis import file2pgtable
 
+logger = logging.getLogger(__name__)
+
 DYNAMIC_DATASTORE = 'datastore'
 
 
@@ -366,6 +371,7 @@ def get_field_type(connection, table_name, row):
     return field_type, field_params, field_notes
 
 
+@depends_on('name', 'charset', 'upload_session')
 def pre_save_layer(instance, sender, **kwargs):
     """Save to postgis if there is a datastore.
     """
@@ -402,7 +408,15 @@ def pre_save_layer(instance, sender, **kwargs):
                       )
     lm.save()
 
+    # Fresh statistics for the planner now that the table is loaded,
+    # file2pgtable created the table with the name in lower case.
+    try:
+        vacuum([instance.name.lower()], using=DYNAMIC_DATASTORE)
+    except Exception:
+        logger.exception('Could not vacuum the table of layer %s', instance.name)
+
 
+@depends_on('name')
 def post_save_layer(instance, sender, **kwargs):
     """Assign layer instance to the dynamic model.
     """
@@ -18,10 +18,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Opencarto.  If not, see <http://www.gnu.org/licenses/>.
 #
-from django import db
 from django.contrib.gis.gdal import DataSource, SpatialReference, OGRGeometry
 from django.utils.text import slugify
 
+from geonode import datastore
+from geonode.datastore import quote_ident
+
 
 def get_model_field_name(field):
     """Get the field name usable without quotes.
@@ -143,12 +145,10 @@ def file2pgtable(infile, table_name, srid=4326):
             or infile.endswith('.MIF') or infile.endswith('.mif')):
         geo_type = 'POLYGON'
 
-    sql = 'BEGIN;'
-
     # Drop table if exists
-    sql += 'DROP TABLE IF EXISTS %s;' % (table_name)
+    sql = 'DROP TABLE IF EXISTS %s;' % quote_ident(table_name)
 
-    sql += "CREATE TABLE %s(" % (table_name)
+    sql += "CREATE TABLE %s(" % quote_ident(table_name)
     first_feature = True
     # Mapping from postgis table to shapefile fields.
     mapping = {}
@@ -189,32 +189,22 @@ def file2pgtable(infile, table_name, srid=4326):
     sql += ','.join(fields)
     sql += ');'
 
-    sql += "SELECT AddGeometryColumn('public','%s','geom',%d,'%s',%d);" % \
-           (table_name, srid, geo_type, coord_dim)
-
-    sql += 'END;'
+    sql += "SELECT AddGeometryColumn('public',%s,'geom',%s,%s,%s);"
 
     # la table est créée il faut maintenant injecter les données
     fieldnames.append('geom')
     mapping['geom'] = geo_type
 
-    # Running the sql
-    execute(sql)
+    # Running the sql, the whole script is a single transaction
+    execute(sql, [table_name, srid, geo_type, coord_dim])
 
     return mapping
 
 
-def execute(sql):
-    """Turns out running plain SQL within Django is very hard.
-       The following code is really weak but gets the job done.
+def execute(sql, params=None):
+    """Run a statement on the datastore, in its own transaction.
     """
-    cursor = db.connections['datastore'].cursor()
-    try:
-        cursor.execute(sql)
-    except:
-        raise
-    finally:
-        cursor.close()
+    datastore.execute(sql, params, using='datastore')
 
 # Obtained from
 # http://www.postgresql.org/docs/9.2/static/sql-keywords-appendix.html
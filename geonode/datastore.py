@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Access to the PostGIS database vector layers are stored in.
+
+The database is one of settings.DATABASES, 'datastore' unless told
+otherwise. Connections come from a pool shared by the threads of the
+process, a thread waits for one when they are all in use. Table and
+column names are always quoted and values are always passed as query
+parameters.
+"""
+
+import logging
+import os
+import threading
+
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATASTORE = 'datastore'
+
+# Connections kept open to each datastore by a process.
+DATASTORE_POOL_SIZE = getattr(settings, 'DATASTORE_POOL_SIZE', 5)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def quote_ident(name):
+    """Quote a table or column name to be used in a statement"""
+    return '"%s"' % name.replace('"', '""')
+
+
+def _pool(using):
+    import psycopg2.pool
+
+    key = (os.getpid(), using)
+    with _pools_lock:
+        if key not in _pools:
+            # Connections can not be shared with a forked process,
+            # every process gets its own pool.
+            db = settings.DATABASES[using]
+            params = dict(database=db['NAME'], user=db['USER'], password=db['PASSWORD'])
+            if db.get('HOST'):
+                params['host'] = db['HOST']
+            if db.get('PORT'):
+                params['port'] = db['PORT']
+            # getconn raises when every connection is in use, the
+            # semaphore makes the threads wait for one instead.
+            _pools[key] = (psycopg2.pool.ThreadedConnectionPool(1, DATASTORE_POOL_SIZE, **params),
+                           threading.BoundedSemaphore(DATASTORE_POOL_SIZE))
+        return _pools[key]
+
+
+@contextmanager
+def connection(using=None):
+    """
+    A pooled connection to the datastore. What is done in the block is
+    committed at the end, or rolled back if it fails.
+    """
+    pool, available = _pool(using or DEFAULT_DATASTORE)
+    available.acquire()
+    try:
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+    finally:
+        available.release()
+
+
+def execute(sql, params=None, using=None):
+    with connection(using) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            cursor.close()
+
+
+def fetchone(sql, params=None, using=None):
+    with connection(using) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
+
+def drop_tables(table_names, using=None):
+    """
+    Drop PostGIS tables and their geometry columns in a single
+    transaction. A table that can not be dropped is logged and skipped.
+    Returns the names of the tables dropped.
+    """
+    dropped = []
+    with connection(using) as conn:
+        cursor = conn.cursor()
+        for table_name in table_names:
+            cursor.execute('SAVEPOINT drop_table')
+            try:
+                cursor.execute('SELECT DropGeometryTable(%s)', [table_name])
+            except Exception as e:
+                cursor.execute('ROLLBACK TO SAVEPOINT drop_table')
+                logger.error(
+                    "Error deleting PostGIS table %s:%s",
+                    table_name,
+                    str(e))
+            else:
+                cursor.execute('RELEASE SAVEPOINT drop_table')
+                dropped.append(table_name)
+        cursor.close()
+    return dropped
+
+
+def analyze(table_names, using=None):
+    """Update the planner statistics of tables, e.g. after loading them"""
+    with connection(using) as conn:
+        cursor = conn.cursor()
+        for table_name in table_names:
+            cursor.execute('ANALYZE %s' % quote_ident(table_name))
+        cursor.close()
+
+
+def vacuum(table_names, analyze=True, using=None):
+    """Reclaim the space of tables after bulk loads or deletes"""
+    statement = 'VACUUM ANALYZE %s' if analyze else 'VACUUM %s'
+    with connection(using) as conn:
+        # VACUUM can not run inside a transaction.
+        conn.autocommit = True
+        try:
+            cursor = conn.cursor()
+            for table_name in table_names:
+                cursor.execute(statement % quote_ident(table_name))
+            cursor.close()
+        finally:
+            conn.autocommit = False
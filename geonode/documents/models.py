@@ -13,6 +13,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from geonode.layers.models import Layer
 from geonode.base.models import ResourceBase, Thumbnail, Link, resourcebase_post_save
+from geonode.base.thumbnails import queue_thumbnail, register_thumbnail_generator
 from geonode.maps.signals import map_changed_signal
 from geonode.maps.models import Map
 
@@ -151,6 +152,15 @@ def create_thumbnail(sender, instance, created, **kwargs):
     if not created:
         return
 
+    queue_thumbnail(instance)
+
+
+def render_document_thumbnail(instance, force=False):
+    thumb_spec = 'Rendered:%s' % (instance.doc_file.name if instance.doc_file else instance.doc_url)
+
+    if not force and instance.has_thumbnail() and instance.thumbnail.thumb_spec == thumb_spec:
+        return
+
     if instance.has_thumbnail():
         instance.thumbnail.thumb_file.delete()
     else:
@@ -162,7 +172,7 @@ def create_thumbnail(sender, instance, created, **kwargs):
         'doc-%s-thumb.png' %
         instance.id,
         ContentFile(image))
-    instance.thumbnail.thumb_spec = 'Rendered'
+    instance.thumbnail.thumb_spec = thumb_spec
     instance.thumbnail.save()
     Link.objects.get_or_create(
         resource=instance.get_self_resource(),
@@ -172,6 +182,10 @@ def create_thumbnail(sender, instance, created, **kwargs):
             extension='png',
             mime='image/png',
             link_type='image',))
+    ResourceBase.objects.filter(id=instance.id).update(
+        thumbnail=instance.thumbnail,
+        thumbnail_url=instance.get_thumbnail_url()
+    )
 
 
 def update_documents_extent(sender, **kwargs):
@@ -185,3 +199,4 @@ signals.pre_save.connect(pre_save_document, sender=Document)
 signals.post_save.connect(create_thumbnail, sender=Document)
 signals.post_save.connect(resourcebase_post_save, sender=Document)
 map_changed_signal.connect(update_documents_extent)
+register_thumbnail_generator(Document, render_document_thumbnail)
@@ -1,5 +1,4 @@
 import json
-import ast
 
 from django.shortcuts import render_to_response, get_object_or_404
 from django.http import HttpResponse, HttpResponseRedirect
@@ -12,14 +11,14 @@ from django.core.exceptions import PermissionDenied
 from django_downloadview.response import DownloadResponse
 from django.views.generic.edit import UpdateView, CreateView
 from geonode.utils import resolve_object
-from geonode.security.views import _perms_info_json
 from geonode.people.forms import ProfileForm
 from geonode.base.forms import CategoryForm
 from geonode.base.models import TopicCategory
+from geonode.base.popularity import count_view
+from geonode.base.signals import coalesce_saves
 from geonode.documents.models import Document
 from geonode.documents.forms import DocumentForm, DocumentCreateForm, DocumentReplaceForm
 from geonode.documents.models import IMGTYPES
-from guardian.utils import get_anonymous_user
 
 ALLOWED_DOC_TYPES = settings.ALLOWED_DOCUMENT_TYPES
 
@@ -59,21 +58,16 @@ def document_detail(request, docid):
     except:
         related = ''
 
-    document.popular_count += 1
-    document.save()
-    all_perms=ast.literal_eval(_perms_info_json(document))
-    user = request.user.username if request.user.is_authenticated() else get_anonymous_user().username
-    perms_dict=all_perms['users'][user]
+    count_view(document)
     return render_to_response(
         "documents/document_detail.html",
         RequestContext(
             request,
             {
-                'permissions_json': _perms_info_json(document),
                 'resource': document,
                 'imgtypes': IMGTYPES,
                 'related': related,
-                'perms_dict': perms_dict}))
+                'perms_dict': document.get_user_perms(request.user)}))
 
 
 def document_download(request, docid):
@@ -185,12 +179,15 @@ def document_metadata(
                 new_author = author_form.save()
 
         if new_poc is not None and new_author is not None:
-            the_document = document_form.save()
-            the_document.poc = new_poc
-            the_document.metadata_author = new_author
-            the_document.keywords.add(*new_keywords)
-            the_document.category = new_category
-            the_document.save()
+            # The form saves the document too, it is synchronized once.
+            with coalesce_saves():
+                the_document = document_form.save()
+                the_document.poc = new_poc
+                the_document.metadata_author = new_author
+                the_document.keywords.add(*new_keywords)
+                the_document.mark_changed('keywords')
+                the_document.category = new_category
+                the_document.save()
             return HttpResponseRedirect(
                 reverse(
                     'document_detail',
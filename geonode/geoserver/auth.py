@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Authentication of the Basic credentials GeoServer calls back with.
+
+GeoServer asks GeoNode who the user of every OGC request is, and checking a
+password runs the slow password hasher. Credentials that were accepted are
+remembered by the process for GEOSERVER_AUTH_CACHE_TTL seconds, under an
+HMAC of the username and password so they are never kept in clear. An entry
+also holds a fingerprint of the password hash of the user, changing the
+password makes it worthless at once.
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.utils.crypto import constant_time_compare
+
+# Seconds accepted credentials are trusted without checking the password, 0 disables it.
+GEOSERVER_AUTH_CACHE_TTL = getattr(settings, 'GEOSERVER_AUTH_CACHE_TTL', 300)
+GEOSERVER_AUTH_CACHE_SIZE = getattr(settings, 'GEOSERVER_AUTH_CACHE_SIZE', 1000)
+
+_accepted = {}
+_lock = threading.Lock()
+
+
+def _digest(*values):
+    message = '\0'.join(v.encode('utf-8') if isinstance(v, unicode) else v for v in values)
+    return hmac.new(settings.SECRET_KEY, message, hashlib.sha256).hexdigest()
+
+
+def _remember(key, user):
+    with _lock:
+        if len(_accepted) >= GEOSERVER_AUTH_CACHE_SIZE:
+            now = time.time()
+            for k in [k for k, v in _accepted.items() if v[0] <= now]:
+                del _accepted[k]
+            if len(_accepted) >= GEOSERVER_AUTH_CACHE_SIZE:
+                _accepted.clear()
+        _accepted[key] = (time.time() + GEOSERVER_AUTH_CACHE_TTL, user.pk, _digest(user.password),
+                          getattr(user, 'backend', None))
+
+
+def forget():
+    """Drops all the accepted credentials"""
+    with _lock:
+        _accepted.clear()
+
+
+def authenticate_basic(username, password):
+    """
+    Returns the active user of the credentials or None, like authenticate
+    does, without checking the password again if it was accepted recently.
+    """
+    if not GEOSERVER_AUTH_CACHE_TTL:
+        return authenticate(username=username, password=password)
+
+    key = _digest(username, password)
+    with _lock:
+        entry = _accepted.get(key)
+    if entry is not None:
+        expires, user_id, fingerprint, backend = entry
+        if expires > time.time():
+            try:
+                user = get_user_model().objects.get(pk=user_id)
+            except get_user_model().DoesNotExist:
+                user = None
+            if user is not None and user.is_active and constant_time_compare(_digest(user.password), fingerprint):
+                user.backend = backend
+                return user
+        with _lock:
+            _accepted.pop(key, None)
+
+    user = authenticate(username=username, password=password)
+    if user is not None and user.is_active:
+        _remember(key, user)
+    return user
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""GeoServer REST catalog client used by GeoNode.
+
+gsconfig reads every resource, layer, store and style through Catalog.get_xml
+and keeps the responses for five seconds, but it throws all of them away on
+any write. GeoNodeCatalog keeps its own response cache instead:
+
+* responses live for OGC_SERVER['CATALOG_CACHE_TTL'] seconds, the expired
+  ones are dropped whenever a new one is kept,
+* identical reads running at the same time share a single request,
+* a write only drops the responses of the object it changed, anything else
+  than an update of an existing object drops them all,
+* the number of requests made by the current thread is counted, see stats.
+"""
+
+import logging
+import threading
+import time
+
+from xml.etree.ElementTree import XML
+from xml.parsers.expat import ExpatError
+
+from geoserver.catalog import Catalog, FailedRequestError
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRead(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.content = None
+        self.error = None
+
+
+class _TrackingHttp(object):
+
+    """
+    Wraps the http client of the catalog to see every request it makes.
+    """
+
+    def __init__(self, http, catalog):
+        self._http = http
+        self._catalog = catalog
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+    def request(self, uri, method='GET', *args, **kwargs):
+        if method == 'GET':
+            self._catalog._count('reads')
+            return self._http.request(uri, method, *args, **kwargs)
+
+        self._catalog._count('writes')
+        try:
+            return self._http.request(uri, method, *args, **kwargs)
+        finally:
+            self._catalog.invalidate(uri, method)
+
+
+class GeoNodeCatalog(Catalog):
+
+    def __init__(self, service_url, username="admin", password="geoserver", cache_ttl=5, **kwargs):
+        super(GeoNodeCatalog, self).__init__(service_url, username, password, **kwargs)
+        self.http = _TrackingHttp(self.http, self)
+        self.cache_ttl = cache_ttl
+        self._responses = {}
+        self._pending = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _count(self, key):
+        stats = self.stats()
+        stats[key] = stats.get(key, 0) + 1
+
+    def stats(self):
+        """
+        Returns the REST requests made by this thread since reset_stats:
+        reads sent to GeoServer, reads answered from the cache or by a
+        concurrent request, and writes.
+        """
+        if not hasattr(self._local, 'stats'):
+            self.reset_stats()
+        return self._local.stats
+
+    def reset_stats(self):
+        self._local.stats = dict(reads=0, cached=0, coalesced=0, writes=0)
+
+    def invalidate(self, uri=None, method=None):
+        """
+        Drops the cached responses a write to uri may have changed, or all
+        of them when no uri is given.
+        """
+        path = uri.split('?')[0] if uri else None
+        with self._lock:
+            self._generation += 1
+            if path and method == 'PUT' and path.endswith('.xml'):
+                # An update of an existing object, only the object and what
+                # is below it are affected.
+                prefix = path[:-len('.xml')]
+                for key in [k for k in self._responses if k.startswith(prefix)]:
+                    del self._responses[key]
+            else:
+                self._responses.clear()
+
+    def reload(self):
+        response = super(GeoNodeCatalog, self).reload()
+        self.invalidate()
+        return response
+
+    def _get(self, rest_url):
+        with self._lock:
+            cached = self._responses.get(rest_url)
+            if cached is not None and time.time() - cached[0] < self.cache_ttl:
+                self._count('cached')
+                return cached[1]
+
+            pending = self._pending.get(rest_url)
+            owner = pending is None
+            if owner:
+                pending = self._pending[rest_url] = _PendingRead()
+                generation = self._generation
+
+        if not owner:
+            # Somebody is already asking for it, wait for the answer.
+            pending.event.wait()
+            self._count('coalesced')
+            if pending.error is not None:
+                raise pending.error
+            return pending.content
+
+        try:
+            response, content = self.http.request(rest_url)
+            if response.status != 200:
+                raise FailedRequestError(
+                    "Tried to make a GET request to %s but got a %d status code: \n%s" %
+                    (rest_url, response.status, content))
+            pending.content = content
+            with self._lock:
+                # Do not keep what was read while a write was going on.
+                if self.cache_ttl > 0 and generation == self._generation:
+                    now = time.time()
+                    for key in [k for k, v in self._responses.items() if now - v[0] >= self.cache_ttl]:
+                        del self._responses[key]
+                    self._responses[rest_url] = (now, content)
+            return content
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(rest_url, None)
+            pending.event.set()
+
+    def get_xml(self, rest_url):
+        logger.debug("GET %s", rest_url)
+        content = self._get(rest_url)
+        try:
+            return XML(content)
+        except (ExpatError, SyntaxError) as e:
+            msg = "GeoServer gave non-XML response for [GET %s]: %s" % (rest_url, content)
+            raise Exception(msg, e)
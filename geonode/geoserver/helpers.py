@@ -27,20 +27,22 @@ import time
 import errno
 import uuid
 import datetime
-from bs4 import BeautifulSoup
+import hashlib
 import geoserver
 import httplib2
 
 from urlparse import urlparse
 from urlparse import urlsplit
 from threading import local
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from collections import namedtuple
 
 from itertools import cycle, izip
 from lxml import etree
 import xml.etree.ElementTree as ET
 
-from owslib.wcs import WebCoverageService
+from owslib.coverage.wcs100 import WebCoverageService_1_0_0
 from owslib.util import http_post
 
 from django.core.exceptions import ImproperlyConfigured
@@ -48,6 +50,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.db.models.signals import pre_delete
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.core.cache import cache
 
 from dialogos.models import Comment
 from agon_ratings.models import OverallRating
@@ -62,8 +65,12 @@ from geoserver.catalog import ConflictingDataError
 from geoserver.resource import FeatureType, Coverage
 
 from geonode import GeoNodeException
+from geonode import datastore
 from geonode.layers.utils import layer_type, get_files
 from geonode.layers.models import Layer, Attribute, Style
+from geonode.geoserver import schema
+from geonode.geoserver.catalog import GeoNodeCatalog
+from geonode.geoserver.pool import HTTPConnectionPool
 from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
 
 
@@ -220,6 +227,20 @@ def fixup_style(cat, resource, style):
 
 
 def cascading_delete(cat, layer_name):
+    reload_needed, table = _cascading_delete(cat, layer_name)
+    if reload_needed:
+        cat.reload()  # this preservers the integrity of geoserver
+    if table is not None:
+        delete_from_postgis(table)
+
+
+def _cascading_delete(cat, layer_name):
+    """
+    Removes a layer, its styles and its store when empty from GeoServer.
+
+    Returns whether the catalog has to be reloaded and the PostGIS table
+    left to drop, if any.
+    """
     resource = None
     try:
         if layer_name.find(':') != -1:
@@ -228,7 +249,7 @@ def cascading_delete(cat, layer_name):
             if ws is None:
                 logger.debug(
                     'cascading delete was called on a layer where the workspace was not found')
-                return
+                return False, None
             resource = cat.get_resource(name, workspace=workspace)
         else:
             resource = cat.get_resource(layer_name)
@@ -239,7 +260,7 @@ def cascading_delete(cat, layer_name):
                        ogc_server_settings.LOCATION, layer_name)
                    )
             logger.warn(msg, e)
-            return None
+            return False, None
         else:
             raise e
 
@@ -249,9 +270,10 @@ def cascading_delete(cat, layer_name):
             # Let's return and make a note in the log.
         logger.debug(
             'cascading_delete was called with a non existent resource')
-        return
+        return False, None
     resource_name = resource.name
     lyr = cat.get_layer(resource_name)
+    reload_needed = False
     if(lyr is not None):  # Already deleted
         store = resource.store
         styles = lyr.styles + [lyr.default_style]
@@ -269,15 +291,15 @@ def cascading_delete(cat, layer_name):
         try:
             cat.delete(resource)  # This will fail
         except:
-            cat.reload()  # this preservers the integrity of geoserver
+            reload_needed = True
 
         if store.resource_type == 'dataStore' and 'dbtype' in store.connection_parameters and \
                 store.connection_parameters['dbtype'] == 'postgis':
-            delete_from_postgis(resource_name)
+            return reload_needed, resource_name
         elif store.type and store.type.lower() == 'geogit':
             # Prevent the entire store from being removed when the store is a
             # GeoGIT repository.
-            return
+            pass
         else:
             try:
                 if not store.get_resources():
@@ -285,38 +307,62 @@ def cascading_delete(cat, layer_name):
             except FailedRequestError as e:
                 # Catch the exception and log it.
                 logger.debug(e)
+    return reload_needed, None
+
+
+# Layers removed from GeoServer at the same time by cascading_delete_layers.
+CASCADING_DELETE_WORKERS = getattr(settings, 'CASCADING_DELETE_WORKERS', 4)
+
+_delete_catalogs = local()
+
+
+def _cascading_delete_worker(layer_name):
+    # gsconfig catalogs can not be shared between threads.
+    if not hasattr(_delete_catalogs, 'catalog'):
+        _delete_catalogs.catalog = Catalog(ogc_server_settings.internal_rest, _user, _password)
+    try:
+        return _cascading_delete(_delete_catalogs.catalog, layer_name)
+    except Exception:
+        logger.exception('Error removing %s from GeoServer', layer_name)
+        return False, None
 
 
-def delete_from_postgis(resource_name):
+def cascading_delete_layers(layer_names):
     """
-    Delete a table from PostGIS (because Geoserver won't do it yet);
-    to be used after deleting a layer from the system.
+    Removes many layers from GeoServer at once.
+
+    The REST requests of several layers run in parallel, the catalog is
+    reloaded at most once at the end and the PostGIS tables are dropped
+    in a single transaction.
     """
-    import psycopg2
-    db = ogc_server_settings.datastore_db
-    conn = psycopg2.connect(
-        "dbname='" +
-        db['NAME'] +
-        "' user='" +
-        db['USER'] +
-        "'  password='" +
-        db['PASSWORD'] +
-        "' port=" +
-        db['PORT'] +
-        " host='" +
-        db['HOST'] +
-        "'")
+    pool = ThreadPool(CASCADING_DELETE_WORKERS)
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT DropGeometryTable ('%s')" % resource_name)
-        conn.commit()
-    except Exception as e:
-        logger.error(
-            "Error deleting PostGIS table %s:%s",
-            resource_name,
-            str(e))
+        results = pool.map(_cascading_delete_worker, layer_names)
     finally:
-        conn.close()
+        pool.close()
+        pool.join()
+
+    if any(reload_needed for reload_needed, table in results):
+        gs_catalog.reload()
+    else:
+        # The layers were removed behind the back of the shared catalog.
+        gs_catalog.invalidate()
+
+    tables = [table for reload_needed, table in results if table is not None]
+    if tables:
+        delete_from_postgis(*tables)
+
+
+def delete_from_postgis(*resource_names):
+    """
+    Delete tables from PostGIS (because Geoserver won't do it yet);
+    to be used after deleting layers from the system.
+    """
+    if not ogc_server_settings.datastore_db:
+        logger.error("Can not delete the PostGIS tables %s, DATASTORE is not a database",
+                     ', '.join(resource_names))
+        return
+    datastore.drop_tables(resource_names, using=ogc_server_settings.DATASTORE)
 
 
 def gs_slurp(
@@ -399,6 +445,7 @@ def gs_slurp(
         'deleted_layers': []
     }
     start = datetime.datetime.now()
+    schemas = fetch_attribute_maps(resources)
     for i, resource in enumerate(resources):
         name = resource.name
         the_store = resource.store
@@ -418,9 +465,10 @@ def gs_slurp(
             layer.bbox_x1 = float(resource.native_bbox[1])
             layer.bbox_y0 = float(resource.native_bbox[2])
             layer.bbox_y1 = float(resource.native_bbox[3])
-            layer.save()
-            # recalculate the layer statistics
-            set_attributes(layer, overwrite=True)
+            with schema.prefetched(schemas):
+                layer.save()
+                # recalculate the layer statistics
+                set_attributes(layer, overwrite=True, stamp=schema.resource_stamp(resource))
 
         except Exception as e:
             if ignore_errors:
@@ -555,6 +603,61 @@ def gs_slurp(
     return output
 
 
+def fetch_attribute_maps(resources):
+    """
+    Describe the attributes of many GeoServer resources with as few
+    requests as possible. Returns the attribute maps keyed by typename.
+    """
+    feature_types = []
+    coverages = []
+    stamps = {}
+    for resource in resources:
+        typename = "%s:%s" % (resource.store.workspace.name, resource.name)
+        if resource.resource_type == Coverage.resource_type:
+            coverages.append(typename)
+        else:
+            feature_types.append(typename)
+        stamps[typename] = schema.resource_stamp(resource)
+
+    # Only ask for the ones that changed since they were last described.
+    schemas = {}
+    for typename, stamp in stamps.items():
+        attribute_map = schema.cached_schema(typename, stamp)
+        if attribute_map is not None:
+            schemas[typename] = attribute_map
+    feature_types = [t for t in feature_types if t not in schemas]
+    coverages = [t for t in coverages if t not in schemas]
+
+    fetched = schema.fetch_schemas(
+        re.sub("\/wms\/?$", "/", ogc_server_settings.LOCATION) + "wfs",
+        ogc_server_settings.LOCATION + "wcs",
+        feature_types,
+        coverages)
+    for typename, attribute_map in fetched.items():
+        schema.store_schema(typename, stamps[typename], attribute_map)
+    schemas.update(fetched)
+    return schemas
+
+
+def fetch_remote_attribute_maps(service_url, layers):
+    """
+    Describe the attributes of many layers of a remote WMS service at once,
+    with a GetFeatureInfo for the ones its WFS does not describe. layers
+    are (typename, bbox) pairs. Returns the attribute maps keyed by typename,
+    the layers that could not be described have an empty one.
+    """
+    bboxes = dict(layers)
+    schemas = schema.fetch_schemas(
+        re.sub("\/wms\/?$", "/", service_url) + "wfs",
+        None,
+        bboxes.keys(),
+        wms_url=service_url,
+        bboxes=bboxes)
+    for typename in bboxes:
+        schemas.setdefault(typename, [])
+    return schemas
+
+
 def get_stores(store_type=None):
     cat = Catalog(ogc_server_settings.internal_rest, _user, _password)
     stores = cat.get_stores()
@@ -569,10 +672,30 @@ def get_stores(store_type=None):
     return store_list
 
 
-def set_attributes(layer, overwrite=False):
+def set_attributes(layer, overwrite=False, stamp=None):
     """
     Retrieve layer attribute names & types from Geoserver,
     then store in GeoNode database using Attribute model
+
+    stamp identifies the version of the GeoServer resource, see
+    geonode.geoserver.schema.resource_stamp, when given the attributes
+    are only fetched again after the resource changed.
+    """
+    attribute_map = schema.cached_schema(layer.typename, stamp)
+    if attribute_map is None:
+        attribute_map = get_attribute_map(layer)
+        if attribute_map:
+            schema.store_schema(layer.typename, stamp, attribute_map)
+
+    if not attribute_map:
+        logger.debug("No attributes found")
+
+    reconcile_attributes(layer, attribute_map, overwrite)
+
+
+def get_attribute_map(layer):
+    """
+    Ask the service of the layer for its attribute names & types
     """
     attribute_map = []
     server_url = ogc_server_settings.LOCATION if layer.storeType != "remoteStore" else layer.service.base_url
@@ -580,8 +703,7 @@ def set_attributes(layer, overwrite=False):
     if layer.storeType == "remoteStore" and layer.service.ptype == "gxp_arcrestsource":
         dft_url = server_url + ("%s?f=json" % layer.typename)
         try:
-            # The code below will fail if http_client cannot be imported
-            body = json.loads(http_client.request(dft_url)[1])
+            body = json.loads(schema.schema_http(dft_url).request(dft_url)[1])
             attribute_map = [[n["name"], _esri_types[n["type"]]]
                              for n in body["fields"] if n.get("name") and n.get("type")]
         except Exception:
@@ -596,9 +718,8 @@ def set_attributes(layer, overwrite=False):
                                                                   "typename": layer.typename.encode('utf-8'),
                                                                   })
         try:
-            # The code below will fail if http_client cannot be imported  or
-            # WFS not supported
-            body = http_client.request(dft_url)[1]
+            # The code below will fail if WFS is not supported
+            body = schema.schema_http(dft_url).request(dft_url)[1]
             doc = etree.fromstring(body)
             path = ".//{xsd}extension/{xsd}sequence/{xsd}element".format(
                 xsd="{http://www.w3.org/2001/XMLSchema}")
@@ -608,30 +729,10 @@ def set_attributes(layer, overwrite=False):
         except Exception:
             attribute_map = []
             # Try WMS instead
-            dft_url = server_url + "?" + urllib.urlencode({
-                "service": "wms",
-                "version": "1.0.0",
-                "request": "GetFeatureInfo",
-                "bbox": ','.join([str(x) for x in layer.bbox]),
-                "LAYERS": layer.typename.encode('utf-8'),
-                "QUERY_LAYERS": layer.typename.encode('utf-8'),
-                "feature_count": 1,
-                "width": 1,
-                "height": 1,
-                "srs": "EPSG:4326",
-                "info_format": "text/html",
-                "x": 1,
-                "y": 1
-            })
+            dft_url = schema.feature_info_url(server_url, layer.typename, layer.bbox[:4])
             try:
-                body = http_client.request(dft_url)[1]
-                soup = BeautifulSoup(body)
-                for field in soup.findAll('th'):
-                    if(field.string is None):
-                        field_name = field.contents[0].string
-                    else:
-                        field_name = field.string
-                    attribute_map.append([field_name, "xsd:string"])
+                body = schema.schema_http(dft_url).request(dft_url)[1]
+                attribute_map = schema.parse_feature_info(body)
             except Exception:
                 attribute_map = []
 
@@ -643,7 +744,7 @@ def set_attributes(layer, overwrite=False):
             "identifiers": layer.typename.encode('utf-8')
         })
         try:
-            response, body = http_client.request(dc_url)
+            response, body = schema.schema_http(dc_url).request(dc_url)
             doc = etree.fromstring(body)
             path = ".//{wcs}Axis/{wcs}AvailableKeys/{wcs}Key".format(
                 wcs="{http://www.opengis.net/wcs/1.1.1}")
@@ -651,55 +752,81 @@ def set_attributes(layer, overwrite=False):
         except Exception:
             attribute_map = []
 
-    attributes = layer.attribute_set.all()
-    # Delete existing attributes if they no longer exist in an updated layer
-    for la in attributes:
-        lafound = False
-        for field, ftype in attribute_map:
-            if field == la.attribute:
-                lafound = True
-        if overwrite or not lafound:
+    return attribute_map
+
+
+def reconcile_attributes(layer, attribute_map, overwrite=False):
+    """
+    Update the Attribute rows of a layer to match a list of
+    (name, type) pairs, keeping the labels, order and visibility
+    set by users for the attributes that are still there. The
+    visibility of an attribute whose type changed is reset.
+
+    With overwrite the data of the layer was replaced and the statistics
+    of all its attributes are refreshed.
+    """
+    existing = {}
+    removed = []
+    for la in layer.attribute_set.all():
+        if la.attribute in existing:
+            removed.append(la.id)
+        else:
+            existing[la.attribute] = la
+
+    fields = dict((field, ftype) for field, ftype in attribute_map if field is not None)
+    for field, la in existing.items():
+        if field not in fields:
             logger.debug(
                 "Going to delete [%s] for [%s]",
-                la.attribute,
+                field,
                 layer.name.encode('utf-8'))
-            la.delete()
-
-    # Add new layer attributes if they don't already exist
-    if attribute_map is not None:
-        iter = len(Attribute.objects.filter(layer=layer)) + 1
-        for field, ftype in attribute_map:
-            if field is not None:
-                la, created = Attribute.objects.get_or_create(
-                    layer=layer, attribute=field, attribute_type=ftype)
-                if created:
-                    if is_layer_attribute_aggregable(
-                            layer.storeType,
-                            field,
-                            ftype):
-                        logger.debug("Generating layer attribute statistics")
-                        result = get_attribute_statistics(layer.name, field)
-                        if result is not None:
-                            la.count = result['Count']
-                            la.min = result['Min']
-                            la.max = result['Max']
-                            la.average = result['Average']
-                            la.median = result['Median']
-                            la.stddev = result['StandardDeviation']
-                            la.sum = result['Sum']
-                            la.unique_values = result['unique_values']
-                            la.last_stats_updated = datetime.datetime.now()
-                    la.attribute_label = field.title()
-                    la.visible = ftype.find("gml:") != 0
-                    la.display_order = iter
-                    la.save()
-                    iter += 1
-                    logger.debug(
-                        "Created [%s] attribute for [%s]",
-                        field,
-                        layer.name.encode('utf-8'))
-    else:
-        logger.debug("No attributes found")
+            removed.append(la.id)
+            del existing[field]
+    if removed:
+        Attribute.objects.filter(id__in=removed).delete()
+
+    # New attributes go after the ones that are kept.
+    display_order = max([la.display_order for la in existing.values()] + [0]) + 1
+    created = []
+    retyped = {}
+    refresh = []
+    for field, ftype in attribute_map:
+        if field is None or field not in fields:
+            continue
+        del fields[field]
+
+        la = existing.get(field)
+        if la is None:
+            created.append(Attribute(
+                layer=layer,
+                attribute=field,
+                attribute_type=ftype,
+                attribute_label=field.title(),
+                visible=ftype.find("gml:") != 0,
+                display_order=display_order))
+            display_order += 1
+            logger.debug(
+                "Created [%s] attribute for [%s]",
+                field,
+                layer.name.encode('utf-8'))
+        elif la.attribute_type != ftype:
+            retyped.setdefault(ftype, []).append(la.id)
+        elif not overwrite:
+            continue
+
+        # New and changed attributes, and all of them when the data was
+        # overwritten, need fresh statistics.
+        if is_layer_attribute_aggregable(layer.storeType, field, ftype):
+            refresh.append(field)
+
+    if created:
+        Attribute.objects.bulk_create(created)
+    for ftype, ids in retyped.items():
+        Attribute.objects.filter(id__in=ids).update(attribute_type=ftype, visible=ftype.find("gml:") != 0)
+
+    if refresh:
+        logger.debug("Generating layer attribute statistics")
+        queue_attribute_statistics(layer, refresh)
 
 
 def set_styles(layer, gs_catalog):
@@ -714,19 +841,135 @@ def set_styles(layer, gs_catalog):
     for alt_style in alt_styles:
         style_set.append(save_style(alt_style))
 
-    layer.styles = style_set
+    if layer.pk is not None:
+        Layer.objects.filter(pk=layer.pk).exclude(
+            default_style=layer.default_style).update(default_style=layer.default_style)
+
+        # Only add and remove what changed
+        current = set(layer.styles.values_list('id', flat=True))
+        wanted = set(style.id for style in style_set)
+        if current - wanted:
+            layer.styles.remove(*(current - wanted))
+        if wanted - current:
+            layer.styles.add(*(wanted - current))
+    else:
+        layer.styles = style_set
     return layer
 
 
+# How long the SLD of a GeoServer style is trusted without a dateModified.
+STYLE_SYNC_TIMEOUT = getattr(settings, 'STYLE_SYNC_TIMEOUT', 60 * 60 * 24)
+
+_SLD = '{http://www.opengis.net/sld}'
+
+
+def _style_sync_key(gs_style):
+    return 'geoserver_style_sync_%s' % hashlib.md5(gs_style.fqn.encode('utf-8')).hexdigest()
+
+
+def style_stamp(gs_style):
+    """The dateModified of a GeoServer style, None if GeoServer does not tell"""
+    try:
+        if gs_style.dom is None:
+            gs_style.fetch()
+    except FailedRequestError:
+        return None
+    modified = gs_style.dom.find('dateModified')
+    return modified.text if modified is not None and modified.text else None
+
+
 def save_style(gs_style):
-    style, created = Style.objects.get_or_create(name=gs_style.sld_name)
-    style.sld_title = gs_style.sld_title
-    style.sld_body = gs_style.sld_body
-    style.sld_url = gs_style.body_href()
-    style.save()
+    """
+    Copy a GeoServer style to the Style model.
+
+    The SLD is only fetched when GeoServer reports a modification since
+    the last sync, or always when it does not report modification dates,
+    and the row is only written when the SLD changed.
+    """
+    key = _style_sync_key(gs_style)
+    stamp = style_stamp(gs_style)
+    if stamp is not None:
+        synced = cache.get(key)
+        if synced is not None and synced[0] == stamp:
+            try:
+                return Style.objects.get(id=synced[1])
+            except Style.DoesNotExist:
+                pass
+
+    sld_url = gs_style.body_href()
+    sld_body = gs_style.catalog.http.request(sld_url)[1]
+    sld_name, sld_title = gs_style.name, None
+    try:
+        user_style = ET.fromstring(sld_body).find(_SLD + 'NamedLayer/' + _SLD + 'UserStyle')
+        if user_style is not None:
+            name_node = user_style.find(_SLD + 'Name')
+            title_node = user_style.find(_SLD + 'Title')
+            sld_name = name_node.text if name_node is not None else gs_style.name
+            sld_title = title_node.text if title_node is not None else None
+    except ET.ParseError:
+        logger.debug('GeoServer returned an invalid SLD for style %s', gs_style.name)
+
+    try:
+        style = Style.objects.get(name=sld_name)
+    except Style.DoesNotExist:
+        style = Style(name=sld_name)
+    if style.pk is None or (style.sld_title, style.sld_url) != (sld_title, sld_url) or \
+            _sld_hash(style.sld_body) != _sld_hash(sld_body):
+        style.sld_title = sld_title
+        style.sld_body = sld_body
+        style.sld_url = sld_url
+        style.save()
+
+    if stamp is not None:
+        cache.set(key, (stamp, style.id), STYLE_SYNC_TIMEOUT)
     return style
 
 
+def _sld_hash(sld_body):
+    if sld_body is None:
+        return None
+    if isinstance(sld_body, unicode):
+        sld_body = sld_body.encode('utf-8')
+    return hashlib.md5(sld_body).hexdigest()
+
+
+# The list of GeoServer styles is refreshed after this many seconds.
+STYLE_INDEX_REFRESH = getattr(settings, 'STYLE_INDEX_REFRESH', 300)
+_STYLE_INDEX_KEY = 'geoserver_style_index'
+
+
+def get_style_names():
+    """
+    The names of all the styles in GeoServer, from a cached index.
+
+    An outdated index is still served while it is refreshed by a celery
+    worker when settings.USE_QUEUE is enabled.
+    """
+    index = cache.get(_STYLE_INDEX_KEY)
+    if index is None:
+        return refresh_style_index()
+
+    refreshed, names = index
+    if time.time() - refreshed > STYLE_INDEX_REFRESH:
+        if not settings.USE_QUEUE:
+            return refresh_style_index()
+        if cache.add(_STYLE_INDEX_KEY + '_pending', True, STYLE_INDEX_REFRESH):
+            from geonode.geoserver.tasks import refresh_style_index as task
+            task.delay()
+    return names
+
+
+def refresh_style_index():
+    names = [style.name for style in gs_catalog.get_styles()]
+    cache.set(_STYLE_INDEX_KEY, (time.time(), names), STYLE_INDEX_REFRESH * 100)
+    cache.delete(_STYLE_INDEX_KEY + '_pending')
+    return names
+
+
+def invalidate_style_index():
+    cache.delete(_STYLE_INDEX_KEY)
+
+
 def is_layer_attribute_aggregable(store_type, field_name, field_type):
     """
     Decipher whether layer attribute is suitable for statistical derivation
@@ -761,36 +1004,244 @@ def get_attribute_statistics(layer_name, field):
         logger.exception('Error generating layer aggregate statistics')
 
 
+def get_layer_attribute_statistics(layer, fields):
+    """
+    Generate the statistics of several attributes of a layer at once.
+
+    Layers stored in the DATASTORE are aggregated by the database in a
+    single pass over the table, the others go through the WPS.
+    Returns a dictionary of statistics keyed by attribute name.
+    """
+    if ogc_server_settings.datastore_db and layer.store == ogc_server_settings.DATASTORE:
+        try:
+            return datastore_attribute_statistics(layer.name, fields)
+        except Exception:
+            logger.exception('Error aggregating attributes of %s in the datastore, trying the WPS', layer.name)
+
+    statistics = {}
+    for field in fields:
+        result = get_attribute_statistics(layer.name, field)
+        if result is not None:
+            statistics[field] = result
+    return statistics
+
+
+def update_attribute_statistics(layer, fields=None, max_age=None):
+    """
+    Refresh the statistics of the aggregable attributes of a layer.
+
+    Only the attributes in fields are refreshed when it is given, and only
+    those computed longer than max_age (a timedelta) ago when that is given.
+    """
+    attributes = [la for la in layer.attribute_set.all() if is_layer_attribute_aggregable(
+        layer.storeType, la.attribute, la.attribute_type)]
+    if fields is not None:
+        attributes = [la for la in attributes if la.attribute in fields]
+    if max_age is not None:
+        outdated = datetime.datetime.now() - max_age
+        attributes = [la for la in attributes if la.last_stats_updated < outdated]
+    if not attributes:
+        return
+
+    statistics = get_layer_attribute_statistics(layer, [la.attribute for la in attributes])
+    now = datetime.datetime.now()
+    for la in attributes:
+        result = statistics.get(la.attribute)
+        if result is None:
+            continue
+        Attribute.objects.filter(id=la.id).update(
+            count=result['Count'],
+            min=result['Min'],
+            max=result['Max'],
+            average=result['Average'],
+            median=result['Median'],
+            stddev=result['StandardDeviation'],
+            sum=result['Sum'],
+            unique_values=result['unique_values'],
+            last_stats_updated=now)
+
+
+def queue_attribute_statistics(layer, fields=None):
+    """
+    Compute attribute statistics in a celery worker when settings.USE_QUEUE
+    is enabled, right away otherwise.
+    """
+    if not settings.USE_QUEUE:
+        update_attribute_statistics(layer, fields)
+        return
+
+    from geonode.geoserver.tasks import update_attribute_statistics as task
+    task.delay(layer.id, fields)
+
+
+# Seconds the WCS capabilities of GeoServer are shared by the layers looking them up.
+WCS_CAPABILITIES_TIMEOUT = getattr(settings, 'WCS_CAPABILITIES_TIMEOUT', 60)
+
+_wcs_capabilities = None
+
+
+def _wcs_request(request, **params):
+    params.update(service='WCS', version='1.0.0', request=request)
+    url = ogc_server_settings.LOCATION + 'wcs?' + urllib.urlencode(params)
+    response, body = http_client.request(url)
+    if response.status != 200:
+        raise GeoNodeException('WCS %s failed with %s: %s' % (request, response.status, body))
+    return body
+
+
+class GeoServerWCS(WebCoverageService_1_0_0):
+
+    """
+    The WCS of GeoServer, read with the GeoServer credentials so coverages
+    are described whatever their permissions are.
+    """
+
+    def __init__(self, url, xml, cookies=None):
+        super(GeoServerWCS, self).__init__(url, xml, cookies)
+        # owslib keeps the descriptions on the class, for ever.
+        self._describeCoverage = {}
+
+    def getDescribeCoverage(self, identifier):
+        if identifier not in self._describeCoverage:
+            self._describeCoverage[identifier] = etree.fromstring(
+                _wcs_request('DescribeCoverage', coverage=identifier))
+        return self._describeCoverage[identifier]
+
+
+def get_wcs_service(refresh=False):
+    """
+    Returns the WCS 1.0.0 service of GeoServer. Its capabilities are read
+    once for all the layers looking them up in WCS_CAPABILITIES_TIMEOUT
+    seconds.
+    """
+    global _wcs_capabilities
+    cached = _wcs_capabilities
+    if refresh or cached is None or time.time() - cached[0] > WCS_CAPABILITIES_TIMEOUT:
+        cached = _wcs_capabilities = (time.time(), _wcs_request('GetCapabilities'))
+    return GeoServerWCS(ogc_server_settings.LOCATION + 'wcs', cached[1])
+
+
 def get_wcs_record(instance, retry=True):
-    wcs = WebCoverageService(ogc_server_settings.public_url + 'wcs', '1.0.0')
     key = instance.workspace + ':' + instance.name
+    wcs = get_wcs_service()
+    if key not in wcs.contents and retry:
+        # The coverage may be newer than the shared capabilities.
+        logger.debug("Layer '%s' was not in the WCS capabilities, reading them again.", key)
+        wcs = get_wcs_service(refresh=True)
     if key in wcs.contents:
         return wcs.contents[key]
-    else:
-        msg = ("Layer '%s' was not found in WCS service at %s." %
-               (key, ogc_server_settings.public_url)
-               )
-        if retry:
-            logger.debug(
-                msg +
-                ' Waiting a couple of seconds before trying again.')
-            time.sleep(2)
-            return get_wcs_record(instance, retry=False)
-        else:
-            raise GeoNodeException(msg)
+    msg = ("Layer '%s' was not found in WCS service at %s." %
+           (key, ogc_server_settings.LOCATION)
+           )
+    raise GeoNodeException(msg)
 
 
-def get_coverage_grid_extent(instance):
+def get_coverage_grid_extent(instance, record=None):
     """
         Returns a list of integers with the size of the coverage
         extent in pixels
     """
-    instance_wcs = get_wcs_record(instance)
+    instance_wcs = record or get_wcs_record(instance)
     grid = instance_wcs.grid
     return [(int(h) - int(l) + 1) for
             h, l in zip(grid.highlimits, grid.lowlimits)]
 
 
+# Seconds the names of the GeoServer layers are kept to tell local map layers apart.
+GEOSERVER_LAYER_NAMES_TIMEOUT = getattr(settings, 'GEOSERVER_LAYER_NAMES_TIMEOUT', 300)
+
+_layer_names = None
+
+# The names missing from the GeoServer layer names, by the time they were.
+_layer_name_misses = {}
+
+
+def geoserver_layer_names(refresh=False, qualified=True):
+    """
+    Returns the names of the layers published by GeoServer, as listed by
+    GeoServer or without their workspace. They are read with a single
+    request and shared for GEOSERVER_LAYER_NAMES_TIMEOUT seconds.
+    """
+    global _layer_names
+    cached = _layer_names
+    if refresh or cached is None or time.time() - cached[0] > GEOSERVER_LAYER_NAMES_TIMEOUT:
+        names = set(layer.name for layer in gs_catalog.get_layers())
+        cached = _layer_names = (time.time(), names, set(name.split(':')[-1] for name in names))
+    return cached[1] if qualified else cached[2]
+
+
+def local_layer_names(names):
+    """
+    Returns the names served by the local GeoServer. GeoNode layers not
+    coming from a remote service are, others are looked up in the names of
+    the GeoServer layers, in the same workspace when the name has one.
+    The names are read again once if some are missing, the layers may be
+    newer than the shared names. The names still missing then, e.g. base
+    layers, are not read again for GEOSERVER_LAYER_NAMES_TIMEOUT seconds.
+    """
+    names = set(name for name in names if name)
+    if not names:
+        return set()
+    found = set(Layer.objects.filter(typename__in=names, service__isnull=True)
+                .values_list('typename', flat=True))
+
+    def published(refresh=False):
+        return set(name for name in names - found
+                   if name in geoserver_layer_names(refresh=refresh, qualified=':' in name))
+
+    cached = _layer_names
+    found |= published()
+    now = time.time()
+    unknown = set(name for name in names - found
+                  if now - _layer_name_misses.get(name, 0) > GEOSERVER_LAYER_NAMES_TIMEOUT)
+    if unknown and _layer_names is cached:
+        logger.debug("Layers %s were not in the GeoServer layer names, reading them again.",
+                     ', '.join(sorted(unknown)))
+        found |= published(refresh=True)
+    if unknown - found:
+        for name, missed in _layer_name_misses.items():
+            if now - missed > GEOSERVER_LAYER_NAMES_TIMEOUT:
+                del _layer_name_misses[name]
+        _layer_name_misses.update((name, now) for name in unknown - found)
+    return found
+
+
+_local_layers = local()
+
+
+@contextmanager
+def local_layers(names):
+    """
+    Tell the local layers among names apart at once for the map layers
+    saved in the block, instead of once for each of them. When GeoServer
+    cannot be reached they are left to the map layers.
+    """
+    previous = getattr(_local_layers, 'resolved', None)
+    try:
+        found = local_layer_names(names)
+    except EnvironmentError as e:
+        if e.errno != errno.ECONNREFUSED:
+            raise
+        logger.warn('Could not connect to catalog to verify which map layers were local: %s', e)
+        found = None
+    if found is not None:
+        _local_layers.resolved = dict((name, name in found) for name in names)
+    try:
+        yield
+    finally:
+        _local_layers.resolved = previous
+
+
+def is_local_layer(name):
+    """
+    True if the layer is served by the local GeoServer, see local_layer_names.
+    """
+    resolved = getattr(_local_layers, 'resolved', None) or {}
+    if name in resolved:
+        return resolved[name]
+    return name in local_layer_names([name])
+
+
 GEOSERVER_LAYER_TYPES = {
     'vector': FeatureType.resource_type,
     'raster': Coverage.resource_type,
@@ -1250,6 +1701,8 @@ class OGC_Servers_Handler(object):
         server.setdefault('PASSWORD', 'geoserver')
         server.setdefault('DATASTORE', str())
         server.setdefault('GEOGIT_DATASTORE_DIR', str())
+        # Seconds GeoServer REST responses are reused, 0 disables the cache.
+        server.setdefault('CATALOG_CACHE_TTL', 5)
 
         for option in ['MAPFISH_PRINT_ENABLED', 'PRINT_NG_ENABLED', 'GEONODE_SECURITY_ENABLED',
                        'BACKEND_WRITE_ENABLED']:
@@ -1301,6 +1754,59 @@ def get_wms():
     return _wms
 
 
+# Unique values are only collected below this number of features.
+UNIQUE_VALUES_MAX_COUNT = 10000
+
+_STATISTICS = ('Min', 'Max', 'Average', 'Median', 'StandardDeviation', 'Sum')
+
+
+def _statistic(value):
+    return 'NA' if value is None else str(value)
+
+
+def datastore_attribute_statistics(layer_name, fields):
+    """Derive aggregate statistics of several fields from the DATASTORE
+
+    All fields are aggregated by the same query, the unique values of the
+    fields with few enough features are collected by a second one.
+    """
+    using = ogc_server_settings.DATASTORE
+    qn = datastore.quote_ident
+    table = qn(layer_name)
+
+    columns = []
+    for field in fields:
+        column = qn(field)
+        columns.extend([
+            'COUNT(%s)' % column,
+            'MIN(%s)' % column,
+            'MAX(%s)' % column,
+            'AVG(%s)' % column,
+            'PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY %s)' % column,
+            'STDDEV(%s)' % column,
+            'SUM(%s)' % column,
+        ])
+
+    row = datastore.fetchone('SELECT %s FROM %s' % (', '.join(columns), table), using=using)
+
+    result = {}
+    for i, field in enumerate(fields):
+        values = row[i * 7:(i + 1) * 7]
+        result[field] = dict(zip(_STATISTICS, [_statistic(v) for v in values[1:]]))
+        result[field]['Count'] = values[0] or 0
+        result[field]['unique_values'] = 'NA'
+
+    few = [f for f in fields if result[f]['Count'] < UNIQUE_VALUES_MAX_COUNT]
+    if few:
+        row = datastore.fetchone('SELECT %s FROM %s' % (
+            ', '.join(["ARRAY_TO_STRING(ARRAY_AGG(DISTINCT %s ORDER BY %s), ',')" % (qn(f), qn(f))
+                       for f in few]), table), using=using)
+        for field, values in zip(few, row):
+            result[field]['unique_values'] = _statistic(values)
+
+    return result
+
+
 def wps_execute_layer_attribute_statistics(layer_name, field):
     """Derive aggregate statistics from WPS endpoint"""
 
@@ -1322,7 +1828,7 @@ def wps_execute_layer_attribute_statistics(layer_name, field):
 
     result = {}
 
-    for f in ['Min', 'Max', 'Average', 'Median', 'StandardDeviation', 'Sum']:
+    for f in _STATISTICS:
         fr = exml.find(f)
         if fr is not None:
             result[f] = fr.text
@@ -1338,7 +1844,7 @@ def wps_execute_layer_attribute_statistics(layer_name, field):
     result['unique_values'] = 'NA'
 
     # TODO: find way of figuring out threshold better
-    if result['Count'] < 10000:
+    if result['Count'] < UNIQUE_VALUES_MAX_COUNT:
         request = render_to_string('layers/wps_execute_gs_unique.xml', {
                                    'layer_name': 'geonode:%s' % layer_name,
                                    'field': field
@@ -1347,6 +1853,11 @@ def wps_execute_layer_attribute_statistics(layer_name, field):
         response = http_post(url, request, timeout=ogc_server_settings.TIMEOUT)
 
         exml = etree.fromstring(response)
+        values = [v.text for v in exml.xpath("//*[local-name()='value']") if v.text]
+        if values:
+            result['unique_values'] = ','.join(values)
+
+    return result
 
 
 def style_update(request, url):
@@ -1360,8 +1871,25 @@ def style_update(request, url):
     In case of a POST or PUT, we need to parse the xml from
     request.body, which is in this format:
     """
-    if request.method in ('POST', 'PUT'):  # we need to parse xml
-        tree = ET.ElementTree(ET.fromstring(request.body))
+    sync_style(request.method, request.body, request.path, url)
+
+
+def queue_style_update(request, url):
+    """
+    Run style_update in a celery worker when settings.USE_QUEUE is
+    enabled, so the request is not held up by it.
+    """
+    if not settings.USE_QUEUE:
+        style_update(request, url)
+        return
+
+    from geonode.geoserver.tasks import sync_style as task
+    task.delay(request.method, request.body, request.path, url)
+
+
+def sync_style(method, body, path, url):
+    if method in ('POST', 'PUT'):  # we need to parse xml
+        tree = ET.ElementTree(ET.fromstring(body))
         elm_namedlayer_name = tree.findall(
             './/{http://www.opengis.net/sld}Name')[0]
         elm_user_style_name = tree.findall(
@@ -1372,15 +1900,15 @@ def style_update(request, url):
             elm_user_style_title = elm_user_style_name
         layer_name = elm_namedlayer_name.text
         style_name = elm_user_style_name.text
-        sld_body = '<?xml version="1.0" encoding="UTF-8"?>%s' % request.body
+        sld_body = '<?xml version="1.0" encoding="UTF-8"?>%s' % body
         # add style in GN and associate it to layer
-        if request.method == 'POST':
+        if method == 'POST':
             style = Style(name=style_name, sld_body=sld_body, sld_url=url)
             style.save()
             layer = Layer.objects.all().filter(typename=layer_name)[0]
             style.layer_styles.add(layer)
             style.save()
-        if request.method == 'PUT':  # update style in GN
+        if method == 'PUT':  # update style in GN
             style = Style.objects.all().filter(name=style_name)[0]
             style.sld_body = sld_body
             style.sld_url = url
@@ -1389,10 +1917,12 @@ def style_update(request, url):
             style.save()
             for layer in style.layer_styles.all():
                 layer.save()
-    if request.method == 'DELETE':  # delete style from GN
-        style_name = os.path.basename(request.path)
+    if method == 'DELETE':  # delete style from GN
+        style_name = os.path.basename(path)
         style = Style.objects.all().filter(name=style_name)[0]
         style.delete()
+    if method in ('POST', 'DELETE'):
+        invalidate_style_index()
 
 ogc_server_settings = OGC_Servers_Handler(settings.OGC_SERVER)['default']
 
@@ -1400,25 +1930,45 @@ _wms = None
 _csw = None
 _user, _password = ogc_server_settings.credentials
 
-http_client = httplib2.Http()
-http_client.add_credentials(_user, _password)
-http_client.add_credentials(_user, _password)
 _netloc = urlparse(ogc_server_settings.LOCATION).netloc
-http_client.authorizations.append(
-    httplib2.BasicAuthentication(
-        (_user, _password),
-        _netloc,
-        ogc_server_settings.LOCATION,
-        {},
-        None,
-        None,
-        http_client
+
+
+def _new_http_client():
+    http = httplib2.Http()
+    http.add_credentials(_user, _password)
+    http.authorizations.append(
+        httplib2.BasicAuthentication(
+            (_user, _password),
+            _netloc,
+            ogc_server_settings.LOCATION,
+            {},
+            None,
+            None,
+            http
+        )
     )
-)
+    return http
+
+http_client = _new_http_client()
+_http_clients = local()
+
+
+def thread_http_client():
+    """
+    The GeoServer http client of the current thread, an httplib2.Http can
+    not be used by several threads at the same time.
+    """
+    if not hasattr(_http_clients, 'http'):
+        _http_clients.http = _new_http_client()
+    return _http_clients.http
 
 
 url = ogc_server_settings.rest
-gs_catalog = Catalog(url, _user, _password)
+gs_catalog = GeoNodeCatalog(url, _user, _password, cache_ttl=ogc_server_settings.CATALOG_CACHE_TTL)
+schema.add_credentials(ogc_server_settings.LOCATION, _user, _password)
+# Keep-alive connections for the requests proxied to GeoServer.
+gs_rest_pool = HTTPConnectionPool(ogc_server_settings.LOCATION, _user, _password,
+                                  timeout=ogc_server_settings.TIMEOUT)
 gs_uploader = Client(url, _user, _password)
 
 _punc = re.compile(r"[\.:]")  # regex for punctuation that confuses restconfig
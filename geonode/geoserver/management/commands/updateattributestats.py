@@ -0,0 +1,44 @@
+from optparse import make_option
+import datetime
+import traceback
+
+from django.core.management.base import BaseCommand
+
+from geonode.layers.models import Layer
+from geonode.geoserver.helpers import update_attribute_statistics
+
+
+class Command(BaseCommand):
+    help = ("Refreshes the statistics of the numeric attributes of vector layers.\n\n"
+            "Only attributes whose statistics are older than --max-age days are recomputed.")
+
+    args = '[layer_name ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '-a',
+            '--max-age',
+            dest='max_age',
+            type='float',
+            default=1,
+            help='Recompute statistics older than this number of days, 0 recomputes all of them.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity'))
+        max_age = datetime.timedelta(days=options.get('max_age'))
+
+        layers = Layer.objects.filter(storeType='dataStore')
+        if args:
+            layers = layers.filter(name__in=args)
+
+        for layer in layers:
+            try:
+                update_attribute_statistics(layer, max_age=max_age)
+            except Exception:
+                print 'Failed to update attribute statistics of %s' % layer.typename
+                if verbosity > 1:
+                    print traceback.format_exc()
+            else:
+                if verbosity > 0:
+                    print 'Updated attribute statistics of %s' % layer.typename
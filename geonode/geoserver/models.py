@@ -1,16 +1,28 @@
 from django.db.models import signals
 
+from geonode.base.thumbnails import register_thumbnail_generator
+
 from geonode.layers.models import Layer
+from geonode.layers.signals import layers_deleted, layer_finished
 from geonode.maps.models import Map, MapLayer
 
 from geonode.geoserver.signals import geoserver_pre_save
 from geonode.geoserver.signals import geoserver_pre_delete
+from geonode.geoserver.signals import geoserver_layers_deleted
 from geonode.geoserver.signals import geoserver_post_save
+from geonode.geoserver.signals import geoserver_layer_finished
 from geonode.geoserver.signals import geoserver_post_save_map
 from geonode.geoserver.signals import geoserver_pre_save_maplayer
+from geonode.geoserver.signals import create_layer_thumbnail
+from geonode.geoserver.signals import create_map_thumbnail
 
 signals.pre_save.connect(geoserver_pre_save, sender=Layer)
 signals.pre_delete.connect(geoserver_pre_delete, sender=Layer)
+layers_deleted.connect(geoserver_layers_deleted, sender=Layer)
 signals.post_save.connect(geoserver_post_save, sender=Layer)
+layer_finished.connect(geoserver_layer_finished, sender=Layer)
 signals.pre_save.connect(geoserver_pre_save_maplayer, sender=MapLayer)
 signals.post_save.connect(geoserver_post_save_map, sender=Map)
+
+register_thumbnail_generator(Layer, create_layer_thumbnail)
+register_thumbnail_generator(Map, create_map_thumbnail)
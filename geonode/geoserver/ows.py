@@ -24,13 +24,30 @@ from owslib.wcs import WebCoverageService
 from owslib.coverage.wcsBase import ServiceException
 import urllib
 from geonode import GeoNodeException
-from re import sub
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_EXCLUDE_FORMATS = ['PNG', 'JPEG', 'GIF', 'TIFF']
 
 
+def _wcs_link(wcs_url, identifier, mime, bbox=None, crs=None, height=None, width=None):
+    # The parameters owslib sends with a GetCoverage, without sending it.
+    params = {'version': '1.0.0', 'request': 'GetCoverage', 'service': 'WCS'}
+    params['Coverage'] = identifier
+    if bbox:
+        params['BBox'] = ','.join([x if type(x) is str else repr(x) for x in bbox])
+    else:
+        params['BBox'] = None
+    if crs:
+        params['crs'] = crs
+    params['format'] = mime
+    if width:
+        params['width'] = width
+    if height:
+        params['height'] = height
+    return wcs_url + urllib.urlencode(params)
+
+
 def wcs_links(
         wcs_url,
         identifier,
@@ -40,49 +57,43 @@ def wcs_links(
         width=None,
         exclude_formats=True,
         quiet=True,
-        version='1.0.0'):
-    # FIXME(Ariel): This would only work for layers marked for public view,
-    # what about the ones with permissions enabled?
-
-    try:
-        wcs = WebCoverageService(wcs_url, version=version)
-    except ServiceException as err:
-        err_msg = 'WCS server returned exception: %s' % err
-        if not quiet:
-            logger.warn(err_msg)
-        raise GeoNodeException(err_msg)
-
-    msg = ('Could not create WCS links for layer "%s",'
-           ' it was not in the WCS catalog,'
-           ' the available layers were: "%s"' % (
-               identifier, wcs.contents.keys()))
-
-    output = []
-    formats = []
-
-    if identifier not in wcs.contents:
-        if not quiet:
-            raise RuntimeError(msg)
-        else:
+        version='1.0.0',
+        coverage=None):
+    """
+    Returns the download links of a coverage. The coverage is looked up in
+    the WCS at wcs_url, which only lists the public ones, unless its
+    record is given.
+    """
+    if coverage is None:
+        try:
+            wcs = WebCoverageService(wcs_url, version=version)
+        except ServiceException as err:
+            err_msg = 'WCS server returned exception: %s' % err
+            if not quiet:
+                logger.warn(err_msg)
+            raise GeoNodeException(err_msg)
+
+        msg = ('Could not create WCS links for layer "%s",'
+               ' it was not in the WCS catalog,'
+               ' the available layers were: "%s"' % (
+                   identifier, wcs.contents.keys()))
+
+        if identifier not in wcs.contents:
+            if not quiet:
+                raise RuntimeError(msg)
             logger.warn(msg)
-    else:
+            return []
         coverage = wcs.contents[identifier]
-        formats = coverage.supportedFormats
-        for f in formats:
-            if exclude_formats and f in DEFAULT_EXCLUDE_FORMATS:
-                continue
-            # roundabout, hacky way to accomplish getting a getCoverage url.
-            # nonetheless, it's better than having to load an entire large
-            # coverage just to generate a URL
-            fakeUrl = wcs.getCoverage(identifier=coverage.id, format=f,
-                                      bbox=bbox, crs=crs, height=20,
-                                      width=20).geturl()
-            url = sub(r'(height=)20(\&width=)20', r'\g<1>{0}\g<2>{1}',
-                      fakeUrl).format(height, width)
-            # The outputs are: (ext, name, mime, url)
-            # FIXME(Ariel): Find a way to get proper ext, name and mime
-            # using format as a default for all is not good enough
-            output.append((f, f, f, url))
+
+    output = []
+    for f in coverage.supportedFormats:
+        if exclude_formats and f in DEFAULT_EXCLUDE_FORMATS:
+            continue
+        url = _wcs_link(wcs_url, coverage.id, f, bbox=bbox, crs=crs, height=height, width=width)
+        # The outputs are: (ext, name, mime, url)
+        # FIXME(Ariel): Find a way to get proper ext, name and mime
+        # using format as a default for all is not good enough
+        output.append((f, f, f, url))
     return output
 
 
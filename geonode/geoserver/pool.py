@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Keep-alive connections to GeoServer shared by the threads of a process.
+
+httplib2 opens a new connection for every Http object and only sends the
+credentials after a 401, the pool keeps the connections open and sends
+them up front. Responses can be streamed, the connection goes back to the
+pool once the response has been read.
+"""
+
+import base64
+import httplib
+import socket
+import threading
+
+from urlparse import urlsplit
+
+# Requests that can be sent again when GeoServer dropped the connection
+# without knowing whether it handled them.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class _BodyStream(object):
+
+    def __init__(self, response, chunk_size):
+        self._response = response
+        self._chunk_size = chunk_size
+
+    def __iter__(self):
+        return self._response._chunks(self._chunk_size)
+
+    def close(self):
+        self._response.close()
+
+
+class PooledResponse(object):
+
+    def __init__(self, pool, connection, response):
+        self._pool = pool
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def getheaders(self):
+        return self._response.getheaders()
+
+    def stream(self, chunk_size=64 * 1024):
+        """
+        An iterable over the body in chunks, the connection is given back
+        after the last one or when the iterable is closed.
+        """
+        return _BodyStream(self, chunk_size)
+
+    def _chunks(self, chunk_size):
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def read(self):
+        return ''.join(self.stream())
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(connection)
+        else:
+            # Not read to the end, or GeoServer is closing it.
+            connection.close()
+
+
+class HTTPConnectionPool(object):
+
+    def __init__(self, url, username=None, password=None, size=10, timeout=60):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.size = size
+        self.timeout = timeout
+        self.headers = {}
+        if username is not None:
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode(
+                '%s:%s' % (username, password))
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        klass = httplib.HTTPSConnection if self.scheme == 'https' else httplib.HTTPConnection
+        return klass(self.host, self.port, timeout=self.timeout)
+
+    def _get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request to the host of the pool. The response has to be
+        read, streamed or closed to give the connection back.
+        """
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+
+        connection, reused = self._get()
+        try:
+            connection.request(method, path, body, all_headers)
+            response = connection.getresponse()
+        except (httplib.HTTPException, socket.error):
+            connection.close()
+            if not reused or method.upper() not in IDEMPOTENT_METHODS or hasattr(body, 'read'):
+                raise
+            # GeoServer dropped the idle connection, try once on a new one.
+            connection = self._new_connection()
+            try:
+                connection.request(method, path, body, all_headers)
+                response = connection.getresponse()
+            except:
+                connection.close()
+                raise
+        return PooledResponse(self, connection, response)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Attribute schemas of layers, as described by their OGC services.
+
+A schema is the list of [name, type] pairs stored in the Attribute model.
+Schemas of many layers are fetched with one DescribeFeatureType or
+DescribeCoverage request per workspace, remote layers without WFS are
+described by a WMS GetFeatureInfo. They are kept in the cache under the
+typename and a stamp of the GeoServer resource, so they are only fetched
+again after the resource was modified.
+"""
+
+import hashlib
+import logging
+import threading
+import urllib
+import xml.etree.ElementTree as ET
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse
+
+import httplib2
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a schema, per host and for any other host.
+SCHEMA_FETCH_TIMEOUTS = getattr(settings, 'SCHEMA_FETCH_TIMEOUTS', {})
+SCHEMA_FETCH_TIMEOUT = getattr(settings, 'SCHEMA_FETCH_TIMEOUT', 10)
+# Schemas fetched at the same time when a batched request came back incomplete.
+SCHEMA_FETCH_WORKERS = getattr(settings, 'SCHEMA_FETCH_WORKERS', 4)
+SCHEMA_CACHE_TIMEOUT = getattr(settings, 'SCHEMA_CACHE_TIMEOUT', 60 * 60 * 24)
+# Typenames described by a single request.
+SCHEMA_BATCH_SIZE = 50
+
+_XSD = '{http://www.w3.org/2001/XMLSchema}'
+_WCS = '{http://www.opengis.net/wcs/1.1.1}'
+
+_local = threading.local()
+_credentials = {}
+
+
+def add_credentials(url, username, password):
+    """Authenticate schema requests sent to the host of url"""
+    _credentials[urlparse(url).netloc] = (username, password)
+
+
+def endpoint_timeout(url):
+    return SCHEMA_FETCH_TIMEOUTS.get(urlparse(url).netloc, SCHEMA_FETCH_TIMEOUT)
+
+
+def schema_http(url):
+    """Returns the http client of the current thread for the host of url"""
+    netloc = urlparse(url).netloc
+    clients = _local.__dict__.setdefault('clients', {})
+    if netloc not in clients:
+        http = httplib2.Http(timeout=endpoint_timeout(url))
+        if netloc in _credentials:
+            username, password = _credentials[netloc]
+            http.add_credentials(username, password)
+            http.authorizations.append(
+                httplib2.BasicAuthentication(
+                    (username, password),
+                    netloc,
+                    url,
+                    {},
+                    None,
+                    None,
+                    http
+                )
+            )
+        clients[netloc] = http
+    return clients[netloc]
+
+
+def resource_stamp(resource):
+    """A value that changes whenever the GeoServer resource is modified"""
+    dom = getattr(resource, 'dom', None)
+    if dom is None:
+        return None
+    modified = dom.find('dateModified')
+    if modified is not None and modified.text:
+        return modified.text
+    return hashlib.md5(ET.tostring(dom)).hexdigest()
+
+
+def _cache_key(typename, stamp):
+    return 'layer_schema_%s' % hashlib.md5(
+        ('%s|%s' % (typename, stamp)).encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def prefetched(schemas):
+    """Serve the schemas of the dictionary, keyed by typename, inside the block"""
+    previous = getattr(_local, 'prefetched', None)
+    _local.prefetched = schemas
+    try:
+        yield
+    finally:
+        _local.prefetched = previous
+
+
+def cached_schema(typename, stamp=None):
+    schemas = getattr(_local, 'prefetched', None)
+    if schemas and typename in schemas:
+        return schemas[typename]
+    if stamp is None:
+        return None
+    return cache.get(_cache_key(typename, stamp))
+
+
+def store_schema(typename, stamp, attribute_map):
+    if stamp is not None:
+        cache.set(_cache_key(typename, stamp), attribute_map, SCHEMA_CACHE_TIMEOUT)
+
+
+def parse_feature_types(body):
+    """
+    Returns the attributes of every feature type of a DescribeFeatureType
+    response, keyed by the name of the feature type.
+    """
+    doc = etree.fromstring(body)
+    path = "{xsd}complexContent/{xsd}extension/{xsd}sequence/{xsd}element".format(xsd=_XSD)
+    types = {}
+    for complex_type in doc.findall(_XSD + 'complexType'):
+        types[complex_type.get('name')] = [
+            [n.attrib["name"], n.attrib["type"]] for n in complex_type.findall(path)
+            if n.attrib.get("name") and n.attrib.get("type")]
+
+    schemas = {}
+    for element in doc.findall(_XSD + 'element'):
+        type_name = element.get('type', '').split(':')[-1]
+        if element.get('name') and type_name in types:
+            schemas[element.get('name')] = types[type_name]
+    return schemas
+
+
+def parse_coverages(body):
+    """
+    Returns the keys of every coverage of a DescribeCoverage 1.1 response,
+    keyed by the name of the coverage.
+    """
+    doc = etree.fromstring(body)
+    path = ".//{wcs}Axis/{wcs}AvailableKeys/{wcs}Key".format(wcs=_WCS)
+    schemas = {}
+    for description in doc.findall('.//%sCoverageDescription' % _WCS):
+        identifier = description.find(_WCS + 'Identifier')
+        if identifier is not None and identifier.text:
+            schemas[identifier.text.split(':')[-1]] = [[n.text, "raster"] for n in description.findall(path)]
+    return schemas
+
+
+def parse_feature_info(body):
+    """
+    Returns the attributes of the html table of a GetFeatureInfo response.
+    Their types are unknown and reported as strings.
+    """
+    attribute_map = []
+    soup = BeautifulSoup(body)
+    for field in soup.findAll('th'):
+        if(field.string is None):
+            field_name = field.contents[0].string
+        else:
+            field_name = field.string
+        attribute_map.append([field_name, "xsd:string"])
+    return attribute_map
+
+
+def _describe(url, typenames, parse):
+    response, body = schema_http(url).request(url)
+    if response.status != 200:
+        raise Exception('Error describing %s: %s %s' % (', '.join(typenames), response.status, body))
+    return parse(body)
+
+
+def describe_feature_types_url(wfs_url, typenames):
+    return wfs_url + "?" + urllib.urlencode({
+        "service": "wfs",
+        "version": "1.0.0",
+        "request": "DescribeFeatureType",
+        "typename": ','.join(typenames).encode('utf-8'),
+    })
+
+
+def describe_coverages_url(wcs_url, typenames):
+    return wcs_url + "?" + urllib.urlencode({
+        "service": "wcs",
+        "version": "1.1.0",
+        "request": "DescribeCoverage",
+        "identifiers": ','.join(typenames).encode('utf-8'),
+    })
+
+
+def feature_info_url(wms_url, typename, bbox):
+    return wms_url + "?" + urllib.urlencode({
+        "service": "wms",
+        "version": "1.0.0",
+        "request": "GetFeatureInfo",
+        "bbox": ','.join([str(x) for x in bbox]),
+        "LAYERS": typename.encode('utf-8'),
+        "QUERY_LAYERS": typename.encode('utf-8'),
+        "feature_count": 1,
+        "width": 1,
+        "height": 1,
+        "srs": "EPSG:4326",
+        "info_format": "text/html",
+        "x": 1,
+        "y": 1
+    })
+
+
+def _feature_info_job(wms_url, typename, bbox):
+    def build_url(endpoint, typenames):
+        return feature_info_url(endpoint, typename, bbox)
+
+    def parse(body):
+        return {typename.split(':')[-1]: parse_feature_info(body)}
+    return build_url, wms_url, [typename], parse
+
+
+def _fetch(args):
+    build_url, endpoint, typenames, parse = args
+    try:
+        found = _describe(build_url(endpoint, typenames), typenames, parse)
+    except Exception:
+        logger.debug('Could not describe %s', ', '.join(typenames), exc_info=True)
+        return {}
+    schemas = {}
+    for typename in typenames:
+        name = typename.split(':')[-1]
+        if name in found:
+            schemas[typename] = found[name]
+    return schemas
+
+
+def fetch_schemas(wfs_url, wcs_url, feature_types=(), coverages=(), wms_url=None, bboxes=None):
+    """
+    Describes many typenames with one request per workspace and per
+    SCHEMA_BATCH_SIZE typenames. The typenames missing from those answers
+    are described one by one, SCHEMA_FETCH_WORKERS at a time. The feature
+    types still missing after that and with a bounding box in ``bboxes``
+    are asked for with a GetFeatureInfo to wms_url, on the same threads.
+    Returns the attribute maps found, keyed by typename.
+    """
+    def batches(build_url, endpoint, typenames, parse):
+        by_workspace = {}
+        for typename in typenames:
+            workspace = typename.split(':')[0] if ':' in typename else None
+            by_workspace.setdefault(workspace, []).append(typename)
+        for names in by_workspace.values():
+            for i in range(0, len(names), SCHEMA_BATCH_SIZE):
+                yield build_url, endpoint, names[i:i + SCHEMA_BATCH_SIZE], parse
+
+    jobs = list(batches(describe_feature_types_url, wfs_url, feature_types, parse_feature_types))
+    jobs.extend(batches(describe_coverages_url, wcs_url, coverages, parse_coverages))
+
+    schemas = {}
+    pool = ThreadPool(SCHEMA_FETCH_WORKERS)
+    try:
+        for found in pool.imap_unordered(_fetch, jobs):
+            schemas.update(found)
+
+        retries = [(build_url, endpoint, [typename], parse)
+                   for build_url, endpoint, typenames, parse in jobs if len(typenames) > 1
+                   for typename in typenames if typename not in schemas]
+        for found in pool.imap_unordered(_fetch, retries):
+            schemas.update(found)
+
+        if wms_url is not None and bboxes:
+            fallbacks = [_feature_info_job(wms_url, typename, bboxes[typename])
+                         for typename in feature_types if typename not in schemas and typename in bboxes]
+            for found in pool.imap_unordered(_fetch, fallbacks):
+                schemas.update(found)
+    finally:
+        pool.close()
+        pool.join()
+    return schemas
@@ -1,7 +1,6 @@
 import errno
 import logging
 import urllib
-import json
 
 from urlparse import urlparse, urljoin
 from socket import error as socket_error
@@ -11,19 +10,23 @@ from django.core.files.base import ContentFile
 from django.conf import settings
 
 from geonode import GeoNodeException
+from geonode.base.signals import depends_on
 from geonode.geoserver.ows import wcs_links, wfs_links, wms_links
-from geonode.geoserver.helpers import cascading_delete, set_attributes
-from geonode.geoserver.helpers import set_styles, gs_catalog, get_coverage_grid_extent
-from geonode.geoserver.helpers import ogc_server_settings
+from geonode.geoserver.schema import resource_stamp
+from geonode.geoserver.helpers import cascading_delete, cascading_delete_layers, set_attributes
+from geonode.geoserver.helpers import set_styles, gs_catalog, get_coverage_grid_extent, get_wcs_record
+from geonode.geoserver.helpers import ogc_server_settings, is_local_layer
 from geonode.geoserver.helpers import geoserver_upload
-from geonode.utils import http_client
-from geonode.base.models import Link
+from geonode.geoserver.helpers import thread_http_client as gs_http_client
+from geonode.utils import thread_http_client
+from geonode.base.models import Link, ResourceBase
 from geonode.base.models import Thumbnail
+from geonode.base.thumbnails import queue_thumbnail
 from geonode.layers.models import Layer
-from geonode.layers.utils import create_thumbnail
+from geonode.layers.signals import bulk_delete_in_progress
+from geonode.layers.utils import create_thumbnail, post_processing_deferred
 from geonode.people.models import Profile
 
-from geoserver.layer import Layer as GsLayer
 
 logger = logging.getLogger("geonode.geoserver.signals")
 
@@ -34,9 +37,20 @@ def geoserver_pre_delete(instance, sender, **kwargs):
     # cascading_delete should only be called if
     # ogc_server_settings.BACKEND_WRITE_ENABLED == True
     if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
+        # Layers deleted in bulk are removed together by geoserver_layers_deleted.
+        if bulk_delete_in_progress():
+            return
         cascading_delete(gs_catalog, instance.typename)
 
 
+def geoserver_layers_deleted(layers, **kwargs):
+    """Removes the layers deleted in bulk from GeoServer
+    """
+    if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
+        cascading_delete_layers([layer.typename for layer in layers])
+
+
+@depends_on('title', 'abstract', 'name', 'workspace', 'store', 'charset', 'upload_session', 'poc')
 def geoserver_pre_save(instance, sender, **kwargs):
     """Send information to geoserver.
 
@@ -49,6 +63,10 @@ def geoserver_pre_save(instance, sender, **kwargs):
         * Metadata Links,
         * Point of Contact name and url
     """
+    # Count the REST requests made to save this layer, they are reported
+    # at the end of geoserver_post_save.
+    gs_catalog.reset_stats()
+
     base_file = instance.get_base_file()
 
     # There is no need to process it if there is not file.
@@ -114,8 +132,7 @@ def geoserver_pre_save(instance, sender, **kwargs):
        * Download links (WMS, WCS or WFS and KML)
        * Styles (SLD)
     """
-    gs_resource = gs_catalog.get_resource(instance.name)
-
+    # The resource saved above already holds the bounding box.
     bbox = gs_resource.latlon_bbox
 
     # FIXME(Ariel): Correct srid setting below
@@ -131,6 +148,8 @@ def geoserver_pre_save(instance, sender, **kwargs):
     instance.bbox_y1 = bbox[3]
 
 
+@depends_on('name', 'workspace', 'store', 'storeType', 'typename', 'upload_session', 'default_style',
+            'bbox_x0', 'bbox_x1', 'bbox_y0', 'bbox_y1', 'srid', 'keywords')
 def geoserver_post_save(instance, sender, **kwargs):
     """Save keywords to GeoServer
 
@@ -143,18 +162,7 @@ def geoserver_post_save(instance, sender, **kwargs):
         set_attributes(instance)
         return
 
-    try:
-        gs_resource = gs_catalog.get_resource(
-            instance.name,
-            store=instance.store,
-            workspace=instance.workspace)
-    except socket_error as serr:
-        if serr.errno != errno.ECONNREFUSED:
-            # Not the error we are looking for, re-raise
-            raise serr
-        # If the connection is refused, take it easy.
-        return
-
+    gs_resource = get_layer_resource(instance)
     if gs_resource is None:
         return
 
@@ -166,6 +174,49 @@ def geoserver_post_save(instance, sender, **kwargs):
         if getattr(ogc_server_settings, "BACKEND_WRITE_ENABLED", True):
             gs_catalog.save(gs_resource)
 
+    # Save layer attributes
+    set_attributes(instance, stamp=resource_stamp(gs_resource))
+
+    # Save layer styles
+    set_styles(instance, gs_catalog)
+
+    # Links and thumbnail are generated later on for bulk imports.
+    if post_processing_deferred():
+        return
+
+    set_layer_links(instance, gs_resource)
+
+
+def geoserver_layer_finished(instance, sender, **kwargs):
+    """Create the links and the thumbnail deferred by a bulk import.
+    """
+    if instance.storeType == "remoteStore":
+        return
+
+    gs_resource = get_layer_resource(instance)
+    if gs_resource is not None:
+        set_layer_links(instance, gs_resource)
+
+
+def get_layer_resource(instance):
+    """Get the GeoServer resource of a layer, None if GeoServer is down.
+    """
+    try:
+        return gs_catalog.get_resource(
+            instance.name,
+            store=instance.store,
+            workspace=instance.workspace)
+    except socket_error as serr:
+        if serr.errno != errno.ECONNREFUSED:
+            # Not the error we are looking for, re-raise
+            raise serr
+        # If the connection is refused, take it easy.
+        return None
+
+
+def set_layer_links(instance, gs_resource):
+    """Set the download and OGC links of a layer and queue its thumbnail.
+    """
     bbox = gs_resource.latlon_bbox
     dx = float(bbox[1]) - float(bbox[0])
     dy = float(bbox[3]) - float(bbox[2])
@@ -255,18 +306,14 @@ def geoserver_post_save(instance, sender, **kwargs):
                                        )
 
     elif instance.storeType == 'coverageStore':
-        # FIXME(Ariel): This works for public layers, does it work for restricted too?
-        # would those end up with no geotiff links, like, forever?
-        permissions = instance.get_all_level_info()
-
-        instance.set_permissions(
-            {'users': {'AnonymousUser': ['view_resourcebase']}})
-
+        # The coverage is described with the GeoServer credentials, its
+        # permissions do not matter.
         try:
+            record = get_wcs_record(instance)
             # Potentially 3 dimensions can be returned by the grid if there is a z
             # axis.  Since we only want width/height, slice to the second
             # dimension
-            covWidth, covHeight = get_coverage_grid_extent(instance)[:2]
+            covWidth, covHeight = get_coverage_grid_extent(instance, record)[:2]
         except GeoNodeException as e:
             msg = _('Could not create a download link for layer.')
             logger.warn(msg, e)
@@ -277,7 +324,8 @@ def geoserver_post_save(instance, sender, **kwargs):
                               bbox=gs_resource.native_bbox[:-1],
                               crs=gs_resource.native_bbox[-1],
                               height=str(covHeight),
-                              width=str(covWidth))
+                              width=str(covWidth),
+                              coverage=record)
 
             for ext, name, mime, wcs_url in links:
                 Link.objects.get_or_create(resource=instance.resourcebase_ptr,
@@ -290,8 +338,6 @@ def geoserver_post_save(instance, sender, **kwargs):
                                            )
                                            )
 
-        instance.set_permissions(permissions)
-
     kml_reflector_link_download = ogc_server_settings.public_url + "wms/kml?" + \
         urllib.urlencode({'layers': instance.typename.encode('utf-8'), 'mode': "download"})
 
@@ -361,35 +407,6 @@ def geoserver_post_save(instance, sender, **kwargs):
                                )
                                )
 
-    params = {
-        'layers': instance.typename.encode('utf-8'),
-        'format': 'image/png8',
-        'width': 200,
-        'height': 150,
-    }
-
-    # Avoid using urllib.urlencode here because it breaks the url.
-    # commas and slashes in values get encoded and then cause trouble
-    # with the WMS parser.
-    p = "&".join("%s=%s" % item for item in params.items())
-
-    thumbnail_remote_url = ogc_server_settings.PUBLIC_LOCATION + \
-        "wms/reflect?" + p
-    thumbail_create_url = ogc_server_settings.LOCATION + \
-        "wms/reflect?" + p
-
-    # This is a workaround for development mode where cookies are not shared and the layer is not public so
-    # not visible through geoserver
-    if settings.DEBUG:
-        from geonode.security.views import _perms_info_json
-        current_perms = _perms_info_json(instance.get_self_resource())
-        instance.set_default_permissions()
-
-    create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url)
-
-    if settings.DEBUG:
-        instance.set_permissions(json.loads(current_perms))
-
     legend_url = ogc_server_settings.PUBLIC_LOCATION + 'wms?request=GetLegendGraphic&format=image/png&WIDTH=20&HEIGHT=20&LAYER=' + \
         instance.typename + '&legend_options=fontAntiAliasing:true;fontSize:12;forceLabels:on'
 
@@ -452,11 +469,37 @@ def geoserver_post_save(instance, sender, **kwargs):
                 link.url).hostname:
             link.delete()
 
-    # Save layer attributes
-    set_attributes(instance)
+    # Render the thumbnail last, it depends on the extent and on the style.
+    queue_thumbnail(instance)
 
-    # Save layer styles
-    set_styles(instance, gs_catalog)
+    logger.debug('GeoServer REST requests made to save layer %s: %s',
+                 instance.typename, gs_catalog.stats())
+
+
+def create_layer_thumbnail(instance, force=False):
+    """Render the thumbnail of a layer through the GeoServer WMS reflector.
+    """
+    params = {
+        'layers': instance.typename.encode('utf-8'),
+        'format': 'image/png8',
+        'width': 200,
+        'height': 150,
+    }
+
+    # Avoid using urllib.urlencode here because it breaks the url.
+    # commas and slashes in values get encoded and then cause trouble
+    # with the WMS parser.
+    p = "&".join("%s=%s" % item for item in params.items())
+
+    thumbnail_remote_url = ogc_server_settings.PUBLIC_LOCATION + \
+        "wms/reflect?" + p
+    thumbail_create_url = ogc_server_settings.LOCATION + \
+        "wms/reflect?" + p
+
+    # The image is requested with the GeoServer credentials, that way
+    # restricted layers get a thumbnail too without opening their permissions.
+    create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url,
+                     force=force, http=gs_http_client())
 
 
 def geoserver_pre_save_maplayer(instance, sender, **kwargs):
@@ -466,10 +509,7 @@ def geoserver_pre_save_maplayer(instance, sender, **kwargs):
         return
 
     try:
-        instance.local = isinstance(
-            gs_catalog.get_layer(
-                instance.name),
-            GsLayer)
+        instance.local = is_local_layer(instance.name)
     except EnvironmentError as e:
         if e.errno == errno.ECONNREFUSED:
             msg = 'Could not connect to catalog to verify if layer %s was local' % instance.name
@@ -478,38 +518,63 @@ def geoserver_pre_save_maplayer(instance, sender, **kwargs):
             raise e
 
 
+@depends_on('owner', 'bbox_x0', 'bbox_x1', 'bbox_y0', 'bbox_y1', 'layers')
 def geoserver_post_save_map(instance, sender, **kwargs):
     instance.set_missing_info()
-    local_layers = []
-    for layer in instance.layers:
-        if layer.local:
-            local_layers.append(
-                Layer.objects.get(
-                    typename=layer.name).typename)
 
-    image = None
+    # Only render again when the layers, their styles or the extent changed.
+    thumbnail_remote_url = map_thumbnail_url(instance)
+    if thumbnail_remote_url is None:
+        return
+    if instance.has_thumbnail() and instance.thumbnail.thumb_spec == thumbnail_remote_url:
+        return
+    queue_thumbnail(instance)
+
+
+def map_thumbnail_url(instance):
+    """The GetMap request of the thumbnail of a map, None if it has no local layers.
+    """
+    map_layers = [layer for layer in instance.layers if layer.local]
+    known = set(Layer.objects.filter(
+        typename__in=[layer.name for layer in map_layers]).values_list('typename', flat=True))
+    map_layers = [layer for layer in map_layers if layer.name in known]
 
     # If the map does not have any local layers, do not create the thumbnail.
-    if len(local_layers) > 0:
-        params = {
-            'layers': ",".join(local_layers).encode('utf-8'),
-            'format': 'image/png8',
-            'width': 200,
-            'height': 150,
-        }
-
-        # Add the bbox param only if the bbox is different to [None, None,
-        # None, None]
-        if None not in instance.bbox:
-            params['bbox'] = instance.bbox_string
-
-        # Avoid using urllib.urlencode here because it breaks the url.
-        # commas and slashes in values get encoded and then cause trouble
-        # with the WMS parser.
-        p = "&".join("%s=%s" % item for item in params.items())
-
-        thumbnail_remote_url = ogc_server_settings.LOCATION + \
-            "wms/reflect?" + p
+    if not map_layers:
+        return None
+
+    params = {
+        'layers': ",".join(layer.name for layer in map_layers).encode('utf-8'),
+        'format': 'image/png8',
+        'width': 200,
+        'height': 150,
+    }
+    if any(layer.styles for layer in map_layers):
+        params['styles'] = ",".join(layer.styles or '' for layer in map_layers).encode('utf-8')
+
+    # Add the bbox param only if the bbox is different to [None, None,
+    # None, None]
+    if None not in instance.bbox:
+        params['bbox'] = instance.bbox_string
+
+    # Avoid using urllib.urlencode here because it breaks the url.
+    # commas and slashes in values get encoded and then cause trouble
+    # with the WMS parser.
+    p = "&".join("%s=%s" % item for item in params.items())
+
+    return ogc_server_settings.LOCATION + "wms/reflect?" + p
+
+
+def create_map_thumbnail(instance, force=False):
+    """Render the thumbnail of a map from its local layers.
+    """
+    image = None
+
+    thumbnail_remote_url = map_thumbnail_url(instance)
+    if thumbnail_remote_url is not None:
+        # Same layers over the same extent, keep the current thumbnail.
+        if not force and instance.has_thumbnail() and instance.thumbnail.thumb_spec == thumbnail_remote_url:
+            return
 
         Link.objects.get_or_create(resource=instance.resourcebase_ptr,
                                    url=thumbnail_remote_url,
@@ -522,7 +587,7 @@ def geoserver_post_save_map(instance, sender, **kwargs):
                                    )
 
         # Download thumbnail and save it locally.
-        resp, image = http_client.request(thumbnail_remote_url)
+        resp, image = thread_http_client().request(thumbnail_remote_url)
 
         if 'ServiceException' in image or resp.status < 200 or resp.status > 299:
             msg = 'Unable to obtain thumbnail: %s' % image
@@ -556,3 +621,8 @@ def geoserver_post_save_map(instance, sender, **kwargs):
                                        link_type='image',
                                    )
                                    )
+
+        ResourceBase.objects.filter(id=instance.id).update(
+            thumbnail=instance.thumbnail,
+            thumbnail_url=instance.get_thumbnail_url()
+        )
@@ -0,0 +1,28 @@
+from celery.task import task
+
+from geonode.layers.models import Layer
+
+
+@task(name='geonode.geoserver.tasks.update_attribute_statistics', ignore_result=True)
+def update_attribute_statistics(layer_id, fields=None):
+    from geonode.geoserver.helpers import update_attribute_statistics
+
+    try:
+        layer = Layer.objects.get(id=layer_id)
+    except Layer.DoesNotExist:
+        return
+    update_attribute_statistics(layer, fields)
+
+
+@task(name='geonode.geoserver.tasks.refresh_style_index', ignore_result=True)
+def refresh_style_index():
+    from geonode.geoserver.helpers import refresh_style_index
+
+    refresh_style_index()
+
+
+@task(name='geonode.geoserver.tasks.sync_style', ignore_result=True)
+def sync_style(method, body, path, url):
+    from geonode.geoserver.helpers import sync_style
+
+    sync_style(method, body, path, url)
@@ -1,10 +1,17 @@
+import BaseHTTPServer
 import base64
+import datetime
+import errno
 import json
+import socket
+import threading
+import xml.etree.ElementTree as ET
 
 from django.contrib.auth import get_user_model
 from django.http import HttpRequest
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
+from django.db.models.signals import post_save
 from django.test import TestCase
 from django.core.urlresolvers import reverse
 from django.test.client import Client
@@ -12,10 +19,16 @@ from django.test.utils import override_settings
 
 from guardian.shortcuts import assign_perm, get_anonymous_user
 
+from geonode.geoserver import auth, helpers, schema
+from geonode.geoserver.catalog import GeoNodeCatalog
+from geonode.geoserver.ows import wcs_links
+from geonode.geoserver.pool import HTTPConnectionPool
 from geonode.geoserver.helpers import OGC_Servers_Handler
 from geonode.base.populate_test_data import create_models
 from geonode.layers.populate_layers_data import create_layer_data
-from geonode.layers.models import Layer
+from geonode.layers.models import Layer, Style
+from geonode.maps.models import Map, MapLayer
+from geonode.geoserver.signals import geoserver_pre_save_maplayer, map_thumbnail_url
 
 
 class LayerTests(TestCase):
@@ -43,6 +56,19 @@ class LayerTests(TestCase):
         response = c.get(reverse('layer_style_manage', args=(layer.typename,)))
         self.assertEqual(response.status_code, 200)
 
+    def test_map_thumbnail_url(self):
+        """Verify that the map thumbnail request holds the local layers and their styles
+        """
+        admin = get_user_model().objects.get(username='admin')
+        the_map = Map.objects.create(owner=admin, title='roads', zoom=0, center_x=0, center_y=0)
+        self.assertEquals(None, map_thumbnail_url(the_map))
+
+        layer = Layer.objects.all()[0]
+        MapLayer.objects.create(map=the_map, name=layer.typename, styles='roads', local=True, stack_order=0)
+        url = map_thumbnail_url(the_map)
+        self.assertTrue('layers=%s&' % layer.typename in url + '&')
+        self.assertTrue('styles=roads&' in url + '&')
+
     def test_feature_edit_check(self):
         """Verify that the feature_edit_check view is behaving as expected
         """
@@ -219,6 +245,54 @@ class LayerTests(TestCase):
         self.assertEquals('admin', response_json['fullname'])
         self.assertEquals('', response_json['email'])
 
+    def test_user_acls(self):
+        """Verify that user_acls answers like resolve_user and layer_acls together
+        """
+        auth_headers = {
+            'HTTP_AUTHORIZATION': 'basic ' + base64.b64encode('bobby:bob'),
+        }
+        c = Client()
+        response = c.get(reverse('layer_user_acls'), **auth_headers)
+        response_json = json.loads(response.content)
+        self.assertEquals(
+            json.loads(c.get(reverse('layer_resolve_user'), **auth_headers).content),
+            response_json['user'])
+        self.assertEquals(
+            json.loads(c.get(reverse('layer_acls'), **auth_headers).content),
+            response_json['acls'])
+
+        geoserver_headers = {
+            'HTTP_AUTHORIZATION': 'basic ' + base64.b64encode('%s:%s' % (settings.OGC_SERVER['default']['USER'],
+                                                                         settings.OGC_SERVER['default']['PASSWORD'])),
+        }
+        response_json = json.loads(c.get(reverse('layer_user_acls'), **geoserver_headers).content)
+        self.assertTrue(response_json['user']['geoserver'])
+        self.assertTrue(response_json['acls']['is_superuser'])
+
+    def test_basic_auth_cache(self):
+        """Accepted credentials skip the password check until the password changes
+        """
+        auth.forget()
+        bob = get_user_model().objects.get(username='bobby')
+        self.assertEquals(bob, auth.authenticate_basic('bobby', 'bob'))
+
+        checked = []
+        authenticate = auth.authenticate
+        auth.authenticate = lambda **credentials: checked.append(credentials)
+        try:
+            self.assertEquals(bob, auth.authenticate_basic('bobby', 'bob'))
+            self.assertEquals([], checked)
+
+            self.assertEquals(None, auth.authenticate_basic('bobby', 'wrong'))
+            self.assertEquals([{'username': 'bobby', 'password': 'wrong'}], checked)
+        finally:
+            auth.authenticate = authenticate
+
+        bob.set_password('robert')
+        bob.save()
+        self.assertEquals(None, auth.authenticate_basic('bobby', 'bob'))
+        self.assertEquals(bob, auth.authenticate_basic('bobby', 'robert'))
+
 
 class UtilsTests(TestCase):
 
@@ -238,6 +312,7 @@ class UtilsTests(TestCase):
                 'WPS_ENABLED': False,
                 'DATASTORE': str(),
                 'GEOGIT_DATASTORE_DIR': str(),
+                'CATALOG_CACHE_TTL': 5,
             }
         }
 
@@ -282,6 +357,24 @@ class UtilsTests(TestCase):
             self.assertTrue(ogc_settings.BACKEND_WRITE_ENABLED)
             self.assertFalse(ogc_settings.WPS_ENABLED)
 
+    def test_wcs_links_of_coverage(self):
+        """
+        Tests that the links of a described coverage are built without asking the WCS.
+        """
+        class Coverage(object):
+            id = 'geonode:dem'
+            supportedFormats = ['GeoTIFF', 'PNG', 'ArcGrid']
+
+        links = wcs_links('http://example.com/geoserver/wcs?', 'geonode:dem',
+                          bbox=['0', '0', '10', '10'], crs='EPSG:4326',
+                          height='200', width='100', coverage=Coverage())
+        self.assertEqual(['GeoTIFF', 'ArcGrid'], [link[0] for link in links])
+        url = links[0][3]
+        self.assertTrue(url.startswith('http://example.com/geoserver/wcs?'))
+        for param in ('request=GetCoverage', 'Coverage=geonode%3Adem', 'BBox=0%2C0%2C10%2C10',
+                      'format=GeoTIFF', 'height=200', 'width=100'):
+            self.assertTrue(param in url)
+
     def test_ogc_server_defaults(self):
         """
         Tests that OGC_SERVER_SETTINGS are built if they do not exist in the settings.
@@ -336,6 +429,363 @@ class UtilsTests(TestCase):
             OGC_Servers_Handler(ogc_server_settings)['default']
 
 
+class CatalogTests(TestCase):
+
+    class FakeHttp(object):
+
+        def __init__(self):
+            self.requests = []
+
+        def request(self, uri, method='GET', *args, **kwargs):
+            self.requests.append((method, uri))
+            return type('Response', (object,), {'status': 200})(), '<layer><name>foo</name></layer>'
+
+    def setUp(self):
+        self.catalog = GeoNodeCatalog('http://localhost:8080/geoserver/rest', cache_ttl=5)
+        self.http = self.catalog.http._http = self.FakeHttp()
+
+    def test_reads_are_cached(self):
+        url = 'http://localhost:8080/geoserver/rest/layers/foo.xml'
+        self.catalog.get_xml(url)
+        self.catalog.get_xml(url)
+        self.assertEqual(1, len(self.http.requests))
+        self.assertEqual(1, self.catalog.stats()['reads'])
+        self.assertEqual(1, self.catalog.stats()['cached'])
+
+    def test_write_invalidates(self):
+        foo = 'http://localhost:8080/geoserver/rest/layers/foo.xml'
+        bar = 'http://localhost:8080/geoserver/rest/layers/bar.xml'
+        self.catalog.get_xml(foo)
+        self.catalog.get_xml(bar)
+
+        # Updating foo keeps bar around
+        self.catalog.http.request(foo, 'PUT', '<layer/>')
+        self.catalog.get_xml(foo)
+        self.catalog.get_xml(bar)
+        self.assertEqual(['GET', 'GET', 'PUT', 'GET'], [method for method, uri in self.http.requests])
+
+        # Anything else drops everything
+        self.catalog.http.request(foo, 'DELETE')
+        self.catalog.get_xml(bar)
+        self.assertEqual(('GET', bar), self.http.requests[-1])
+        self.assertEqual(2, self.catalog.stats()['writes'])
+
+    def test_expired_responses_dropped(self):
+        foo = 'http://localhost:8080/geoserver/rest/layers/foo.xml'
+        bar = 'http://localhost:8080/geoserver/rest/layers/bar.xml'
+        self.catalog.get_xml(foo)
+        self.catalog._responses[foo] = (0, self.catalog._responses[foo][1])
+        self.catalog.get_xml(bar)
+        self.assertEqual([bar], self.catalog._responses.keys())
+
+
+class LocalLayerTests(TestCase):
+
+    def setUp(self):
+        self.listed = []
+        self.get_layers = helpers.gs_catalog.get_layers
+
+        def get_layers():
+            self.listed.append(True)
+            return [type('Layer', (object,), {'name': name})() for name in ('geonode:roads', 'rivers')]
+        helpers.gs_catalog.get_layers = get_layers
+        helpers._layer_names = None
+        helpers._layer_name_misses.clear()
+
+    def tearDown(self):
+        helpers.gs_catalog.get_layers = self.get_layers
+        helpers._layer_names = None
+        helpers._layer_name_misses.clear()
+
+    def test_layer_names_read_once(self):
+        self.assertTrue(helpers.is_local_layer('geonode:roads'))
+        self.assertTrue(helpers.is_local_layer('roads'))
+        self.assertTrue(helpers.is_local_layer('rivers'))
+        self.assertFalse(helpers.is_local_layer(None))
+        self.assertEqual(1, len(self.listed))
+
+    def test_layer_names_read_again_on_miss(self):
+        self.assertFalse(helpers.is_local_layer('geonode:lakes'))
+        self.assertEqual(1, len(self.listed))
+        # The workspace has to match when there is one
+        self.assertFalse(helpers.is_local_layer('osm:roads'))
+        self.assertEqual(2, len(self.listed))
+
+    def test_layer_name_misses_remembered(self):
+        self.assertFalse(helpers.is_local_layer('mapnik'))
+        self.assertFalse(helpers.is_local_layer('geonode:lakes'))
+        self.assertEqual(2, len(self.listed))
+        with helpers.local_layers(['mapnik', 'geonode:lakes', 'rivers']):
+            self.assertFalse(helpers.is_local_layer('mapnik'))
+        self.assertFalse(helpers.is_local_layer('geonode:lakes'))
+        self.assertEqual(2, len(self.listed))
+
+        # Until they expire
+        for name in helpers._layer_name_misses:
+            helpers._layer_name_misses[name] -= helpers.GEOSERVER_LAYER_NAMES_TIMEOUT + 1
+        self.assertFalse(helpers.is_local_layer('mapnik'))
+        self.assertEqual(3, len(self.listed))
+        self.assertEqual(['mapnik'], helpers._layer_name_misses.keys())
+
+    def test_map_layers_catalog_down(self):
+        def get_layers():
+            raise socket.error(errno.ECONNREFUSED, 'Connection refused')
+        helpers.gs_catalog.get_layers = get_layers
+
+        names = ['geonode:roads', 'rivers']
+        with helpers.local_layers(names):
+            # Each map layer is saved without knowing whether it is local
+            map_layer = MapLayer(name='geonode:roads', local=False)
+            geoserver_pre_save_maplayer(map_layer, MapLayer)
+            self.assertFalse(map_layer.local)
+
+    def test_map_layers_resolved_together(self):
+        names = ['geonode:roads', 'rivers', 'geonode:lakes', 'osm:roads', None]
+        with self.assertNumQueries(1):
+            with helpers.local_layers(names):
+                local = [helpers.is_local_layer(name) for name in names]
+        self.assertEqual([True, True, False, False, False], local)
+        self.assertEqual(1, len(self.listed))
+
+
+class AttributeStatisticsTests(TestCase):
+
+    def setUp(self):
+        create_models(type='layer')
+        self.layer = Layer.objects.all()[0]
+        self.layer.storeType = 'dataStore'
+        self.layer.save()
+        self.layer.attribute_set.all().delete()
+        self.old = self.layer.attribute_set.create(
+            attribute='population', attribute_type='xsd:int',
+            last_stats_updated=datetime.datetime.now() - datetime.timedelta(days=7))
+        self.recent = self.layer.attribute_set.create(attribute='area', attribute_type='xsd:double')
+        self.layer.attribute_set.create(attribute='name', attribute_type='xsd:string')
+
+        self.requested = []
+        self._get_statistics = helpers.get_layer_attribute_statistics
+
+        def get_statistics(layer, fields):
+            self.requested.append(fields)
+            stats = dict(Count=2, Min='1', Max='3', Average='2', Median='2',
+                         StandardDeviation='1', Sum='4', unique_values='1,3')
+            return dict((f, stats) for f in fields)
+        helpers.get_layer_attribute_statistics = get_statistics
+
+    def tearDown(self):
+        helpers.get_layer_attribute_statistics = self._get_statistics
+
+    def test_all_fields_in_one_request(self):
+        helpers.update_attribute_statistics(self.layer)
+        self.assertEqual(1, len(self.requested))
+        self.assertEqual(set(['population', 'area']), set(self.requested[0]))
+        self.assertEqual('3', self.layer.attribute_set.get(attribute='population').max)
+        self.assertEqual('NA', self.layer.attribute_set.get(attribute='name').max)
+
+    def test_incremental_refresh(self):
+        helpers.update_attribute_statistics(self.layer, max_age=datetime.timedelta(days=1))
+        self.assertEqual([['population']], self.requested)
+        self.assertEqual('NA', self.layer.attribute_set.get(attribute='area').max)
+
+    def test_reconcile_attributes(self):
+        self.old.attribute_label = 'People'
+        self.old.display_order = 5
+        self.old.visible = False
+        self.old.save()
+        self.layer.attribute_set.filter(attribute='name').update(display_order=9)
+
+        helpers.reconcile_attributes(self.layer, [
+            ('population', 'xsd:long'),
+            ('the_geom', 'gml:MultiPolygonPropertyType'),
+            ('area', 'xsd:double'),
+        ])
+
+        attributes = dict((la.attribute, la) for la in self.layer.attribute_set.all())
+        self.assertEqual(['area', 'population', 'the_geom'], sorted(attributes))
+        self.assertEqual('xsd:long', attributes['population'].attribute_type)
+        self.assertEqual('People', attributes['population'].attribute_label)
+        self.assertEqual(5, attributes['population'].display_order)
+        self.assertTrue(attributes['population'].visible)
+        # Numbered after the attributes that are kept, not the removed one
+        self.assertEqual(6, attributes['the_geom'].display_order)
+        self.assertFalse(attributes['the_geom'].visible)
+        # Only the attribute whose type changed needs new statistics
+        self.assertEqual([['population']], self.requested)
+
+
+class SchemaTests(TestCase):
+
+    def test_parse_feature_types(self):
+        body = """<?xml version="1.0" encoding="UTF-8"?>
+<xsd:schema xmlns:gml="http://www.opengis.net/gml" xmlns:geonode="http://www.geonode.org/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema" targetNamespace="http://www.geonode.org/">
+  <xsd:complexType name="roadsType">
+    <xsd:complexContent>
+      <xsd:extension base="gml:AbstractFeatureType">
+        <xsd:sequence>
+          <xsd:element name="the_geom" type="gml:MultiLineStringPropertyType"/>
+          <xsd:element name="lanes" type="xsd:int"/>
+        </xsd:sequence>
+      </xsd:extension>
+    </xsd:complexContent>
+  </xsd:complexType>
+  <xsd:element name="roads" substitutionGroup="gml:_Feature" type="geonode:roadsType"/>
+  <xsd:complexType name="riversType">
+    <xsd:complexContent>
+      <xsd:extension base="gml:AbstractFeatureType">
+        <xsd:sequence>
+          <xsd:element name="name" type="xsd:string"/>
+        </xsd:sequence>
+      </xsd:extension>
+    </xsd:complexContent>
+  </xsd:complexType>
+  <xsd:element name="rivers" substitutionGroup="gml:_Feature" type="geonode:riversType"/>
+</xsd:schema>"""
+        self.assertEqual({
+            'roads': [['the_geom', 'gml:MultiLineStringPropertyType'], ['lanes', 'xsd:int']],
+            'rivers': [['name', 'xsd:string']],
+        }, schema.parse_feature_types(body))
+
+    def test_prefetched(self):
+        with schema.prefetched({'geonode:roads': [['lanes', 'xsd:int']]}):
+            self.assertEqual([['lanes', 'xsd:int']], schema.cached_schema('geonode:roads'))
+            self.assertEqual(None, schema.cached_schema('geonode:rivers'))
+        self.assertEqual(None, schema.cached_schema('geonode:roads'))
+
+    def test_feature_info_fallback(self):
+        requested = []
+
+        def describe(url, typenames, parse):
+            requested.append(url.split('request=')[1].split('&')[0])
+            if 'GetFeatureInfo' not in url:
+                raise Exception('WFS is not supported')
+            return parse('<table><tr><th>name</th><th><span>pop</span></th></tr></table>')
+        _describe = schema._describe
+        schema._describe = describe
+        try:
+            found = schema.fetch_schemas(
+                'http://example.com/wfs', None, ['states', 'rivers'],
+                wms_url='http://example.com/wms', bboxes={'states': [-180, -90, 180, 90]})
+        finally:
+            schema._describe = _describe
+        self.assertEqual({'states': [['name', 'xsd:string'], ['pop', 'xsd:string']]}, found)
+        # One batch, one request per typename, one GetFeatureInfo
+        self.assertEqual(['DescribeFeatureType'] * 3 + ['GetFeatureInfo'], sorted(requested))
+
+
+class StyleSyncTests(TestCase):
+
+    SLD = """<?xml version="1.0" encoding="UTF-8"?>
+<sld:StyledLayerDescriptor xmlns:sld="http://www.opengis.net/sld" version="1.0.0">
+  <sld:NamedLayer>
+    <sld:Name>roads</sld:Name>
+    <sld:UserStyle>
+      <sld:Name>roads_style</sld:Name>
+      <sld:Title>Roads</sld:Title>
+    </sld:UserStyle>
+  </sld:NamedLayer>
+</sld:StyledLayerDescriptor>"""
+
+    class FakeStyle(object):
+
+        def __init__(self, body):
+            self.name = self.fqn = 'roads_style'
+            self.dom = ET.fromstring('<style><name>roads_style</name></style>')
+            self.requests = 0
+            self.catalog = self
+            self.http = self
+            self.body = body
+
+        def body_href(self):
+            return 'http://localhost:8080/geoserver/rest/styles/roads_style.sld'
+
+        def request(self, uri):
+            self.requests += 1
+            return None, self.body
+
+    def test_unchanged_style_is_not_saved(self):
+        saves = []
+
+        def count_saves(sender, instance, **kwargs):
+            saves.append(instance.name)
+        post_save.connect(count_saves, sender=Style)
+        try:
+            style = helpers.save_style(self.FakeStyle(self.SLD))
+            self.assertEqual('roads_style', style.name)
+            self.assertEqual('Roads', style.sld_title)
+
+            helpers.save_style(self.FakeStyle(self.SLD))
+            self.assertEqual(['roads_style'], saves)
+
+            helpers.save_style(self.FakeStyle(self.SLD.replace('Roads', 'Streets')))
+            self.assertEqual(['roads_style', 'roads_style'], saves)
+        finally:
+            post_save.disconnect(count_saves, sender=Style)
+
+
+class ConnectionPoolTests(TestCase):
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.server.clients.add(self.client_address)
+            self.server.authorizations.append(self.headers.get('Authorization'))
+            body = '<styles/>' * 10000
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), self.Handler)
+        self.server.clients = set()
+        self.server.authorizations = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/geoserver/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        pool = HTTPConnectionPool(self.url, 'admin', 'geoserver')
+        for i in range(3):
+            response = pool.request('GET', self.url + 'rest/styles.xml')
+            self.assertEqual(200, response.status)
+            self.assertEqual('application/xml', response.getheader('content-type'))
+            self.assertEqual(90000, len(''.join(response.stream(4096))))
+        self.assertEqual(1, len(self.server.clients))
+        self.assertEqual(['Basic YWRtaW46Z2Vvc2VydmVy'] * 3, self.server.authorizations)
+
+    def test_stale_connections(self):
+        class StaleConnection(object):
+            def request(self, *args):
+                raise socket.error(errno.EPIPE, 'Broken pipe')
+
+            def close(self):
+                pass
+
+        pool = HTTPConnectionPool(self.url, 'admin', 'geoserver')
+
+        # Reads are sent again on a new connection
+        pool._release(StaleConnection())
+        response = pool.request('GET', self.url + 'rest/styles.xml')
+        self.assertEqual(200, response.status)
+        self.assertEqual(90000, len(response.read()))
+
+        # Writes GeoServer may have handled are not
+        pool._release(StaleConnection())
+        self.assertRaises(socket.error, pool.request, 'POST', self.url + 'rest/styles', '<style/>')
+        self.assertEqual(1, len(self.server.authorizations))
+
+
 class SecurityTest(TestCase):
 
     """
@@ -55,6 +55,9 @@ urlpatterns = patterns('geonode.geoserver.views',
                        url(r'^resolve_user/?$',
                            'resolve_user',
                            name='layer_resolve_user'),
+                       url(r'^user_acls/?$',
+                           'user_acls',
+                           name='layer_user_acls'),
                        url(r'^download$',
                            'layer_batch_download',
                            name='layer_batch_download'),
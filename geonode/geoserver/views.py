@@ -1,10 +1,8 @@
 import json
 import logging
-import httplib2
 
-from django.contrib.auth import authenticate
 from django.utils import simplejson
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, render_to_response
 from django.conf import settings
@@ -25,7 +23,9 @@ from geonode.geoserver.signals import gs_catalog
 from geonode.utils import json_response, _get_basic_auth_info
 from geoserver.catalog import FailedRequestError, ConflictingDataError
 from lxml import etree
-from .helpers import get_stores, gs_slurp, ogc_server_settings, set_styles, style_update
+from .helpers import get_stores, gs_slurp, ogc_server_settings, set_styles, queue_style_update
+from .helpers import get_style_names, invalidate_style_index, gs_rest_pool
+from .auth import authenticate_basic
 
 logger = logging.getLogger(__name__)
 
@@ -139,6 +139,7 @@ def layer_style_upload(req, layername):
         try:
             cat = gs_catalog
             cat.create_style(name, sld)
+            invalidate_style_index()
             layer.styles = layer.styles + \
                 [type('style', (object,), {'name': name})]
             cat.save(layer.publishing)
@@ -171,10 +172,7 @@ def layer_style_manage(req, layername):
                 logger.warn(
                     'Unable to set the default style.  Ensure Geoserver is running and that this layer exists.')
 
-            all_available_gs_styles = cat.get_styles()
-            gs_styles = []
-            for style in all_available_gs_styles:
-                gs_styles.append(style.name)
+            gs_styles = get_style_names()
 
             current_layer_styles = layer.styles.all()
             layer_styles = []
@@ -277,30 +275,28 @@ def geoserver_rest_proxy(request, proxy_path, downstream_path):
     path = strip_prefix(request.get_full_path(), proxy_path)
     url = "".join([ogc_server_settings.LOCATION, downstream_path, path])
 
-    http = httplib2.Http()
-    http.add_credentials(*(ogc_server_settings.credentials))
     headers = dict()
 
     if request.method in ("POST", "PUT") and "CONTENT_TYPE" in request.META:
         headers["Content-Type"] = request.META["CONTENT_TYPE"]
 
-    response, content = http.request(
-        url, request.method,
+    response = gs_rest_pool.request(
+        request.method, url,
         body=request.body or None,
         headers=headers)
 
     # we need to sync django here
     # we should remove this geonode dependency calling layers.views straight
     # from GXP, bypassing the proxy
-    if downstream_path == 'rest/styles' and len(request.body) > 0:
+    if downstream_path == 'rest/styles' and len(request.body) > 0 and response.status < 400:
         # for some reason sometime gxp sends a put with empty request
         # need to figure out with Bart
-        style_update(request, url)
+        queue_style_update(request, url)
 
-    return HttpResponse(
-        content=content,
+    return StreamingHttpResponse(
+        response.stream(),
         status=response.status,
-        mimetype=response.get("content-type", "text/plain"))
+        content_type=response.getheader("content-type", "text/plain"))
 
 
 def layer_batch_download(request):
@@ -358,79 +354,56 @@ def layer_batch_download(request):
         return HttpResponse(content, status=resp.status)
 
 
-def resolve_user(request):
-    user = None
-    geoserver = False
-    superuser = False
-    acl_user = request.user
-    if 'HTTP_AUTHORIZATION' in request.META:
+def _callback_user(request):
+    """
+    Returns the user GeoServer calls back for and whether it is the
+    GeoServer administrator, who is not a django user. Basic credentials
+    win over the session, None is returned when they are not valid.
+    """
+    if 'HTTP_AUTHORIZATION' not in request.META:
+        return request.user, False
+    try:
         username, password = _get_basic_auth_info(request)
-        acl_user = authenticate(username=username, password=password)
-        if acl_user:
-            user = acl_user.username
-            superuser = acl_user.is_superuser
-        elif _get_basic_auth_info(request) == ogc_server_settings.credentials:
-            geoserver = True
-            superuser = True
-        else:
-            return HttpResponse(_("Bad HTTP Authorization Credentials."),
-                                status=401,
-                                mimetype="text/plain")
-
-    if not any([user, geoserver, superuser]
-               ) and not request.user.is_anonymous():
-        user = request.user.username
-        superuser = request.user.is_superuser
+    except Exception:
+        return None
+    acl_user = authenticate_basic(username, password)
+    if acl_user is not None:
+        return acl_user, False
+    if (username, password) == ogc_server_settings.credentials:
+        return None, True
+    return None
 
+
+def _bad_credentials():
+    return HttpResponse(_("Bad HTTP Authorization Credentials."),
+                        status=401,
+                        mimetype="text/plain")
+
+
+def _user_identity(acl_user, geoserver):
+    if geoserver:
+        return {'user': None, 'geoserver': True, 'superuser': True}
     resp = {
-        'user': user,
-        'geoserver': geoserver,
-        'superuser': superuser,
+        'user': None if acl_user.is_anonymous() else acl_user.username,
+        'geoserver': False,
+        'superuser': acl_user.is_superuser,
     }
-
-    if acl_user and acl_user.is_authenticated():
+    if acl_user.is_authenticated():
         resp['fullname'] = acl_user.first_name
         resp['email'] = acl_user.email
-    return HttpResponse(json.dumps(resp))
-
-
-def layer_acls(request):
-    """
-    returns json-encoded lists of layer identifiers that
-    represent the sets of read-write and read-only layers
-    for the currently authenticated user.
-    """
-    # the layer_acls view supports basic auth, and a special
-    # user which represents the geoserver administrator that
-    # is not present in django.
-    acl_user = request.user
-    if 'HTTP_AUTHORIZATION' in request.META:
-        try:
-            username, password = _get_basic_auth_info(request)
-            acl_user = authenticate(username=username, password=password)
-
-            # Nope, is it the special geoserver user?
-            if (acl_user is None and
-                    username == ogc_server_settings.USER and
-                    password == ogc_server_settings.PASSWORD):
-                # great, tell geoserver it's an admin.
-                result = {
-                    'rw': [],
-                    'ro': [],
-                    'name': username,
-                    'is_superuser': True,
-                    'is_anonymous': False
-                }
-                return HttpResponse(
-                    json.dumps(result),
-                    mimetype="application/json")
-        except Exception:
-            pass
-
-        if acl_user is None:
-            return HttpResponse(_("Bad HTTP Authorization Credentials."),
-                                status=401,
-                                mimetype="text/plain")
+    return resp
+
+
+def _layer_acls(acl_user, geoserver):
+    if geoserver:
+        # tell geoserver its administrator can do anything.
+        return {
+            'rw': [],
+            'ro': [],
+            'name': ogc_server_settings.USER,
+            'is_superuser': True,
+            'is_anonymous': False
+        }
 
     # Include permissions on the anonymous user
     all_readable = get_objects_for_user(acl_user, 'base.view_resourcebase')
@@ -456,5 +429,41 @@ def layer_acls(request):
     if acl_user.is_authenticated():
         result['fullname'] = acl_user.first_name
         result['email'] = acl_user.email
+    return result
+
+
+def resolve_user(request):
+    found = _callback_user(request)
+    if found is None:
+        return _bad_credentials()
+    return HttpResponse(json.dumps(_user_identity(*found)))
+
+
+def layer_acls(request):
+    """
+    returns json-encoded lists of layer identifiers that
+    represent the sets of read-write and read-only layers
+    for the currently authenticated user.
+    """
+    # the layer_acls view supports basic auth, and a special
+    # user which represents the geoserver administrator that
+    # is not present in django.
+    found = _callback_user(request)
+    if found is None:
+        return _bad_credentials()
+    return HttpResponse(json.dumps(_layer_acls(*found)), mimetype="application/json")
 
+
+def user_acls(request):
+    """
+    What resolve_user and layer_acls return, in a single response: the
+    identity of the user under 'user' and the layer lists under 'acls'.
+    """
+    found = _callback_user(request)
+    if found is None:
+        return _bad_credentials()
+    result = {
+        'user': _user_identity(*found),
+        'acls': _layer_acls(*found),
+    }
     return HttpResponse(json.dumps(result), mimetype="application/json")
@@ -74,24 +74,28 @@ class GroupMemberForm(forms.Form):
 
     def clean_user_identifiers(self):
         value = self.cleaned_data["user_identifiers"]
-        new_members, errors = [], []
-
-        for ui in value.split(","):
-            ui = ui.strip()
+        identifiers = [ui.strip() for ui in value.split(",") if ui.strip()]
+        emails, usernames = set(), set()
 
+        for ui in identifiers:
             try:
                 validate_email(ui)
-                try:
-                    new_members.append(get_user_model().objects.get(email=ui))
-                except get_user_model().DoesNotExist:
-                    new_members.append(ui)
+                emails.add(ui)
             except ValidationError:
-                try:
-                    new_members.append(
-                        get_user_model().objects.get(
-                            username=ui))
-                except get_user_model().DoesNotExist:
-                    errors.append(ui)
+                usernames.add(ui)
+
+        # Resolve all the identifiers with a query for emails and one for usernames
+        by_email = dict((user.email, user) for user in get_user_model().objects.filter(email__in=emails))
+        by_username = dict((user.username, user) for user in get_user_model().objects.filter(username__in=usernames))
+
+        new_members, errors = [], []
+        for ui in identifiers:
+            if ui in emails:
+                new_members.append(by_email.get(ui, ui))
+            elif ui in by_username:
+                new_members.append(by_username[ui])
+            else:
+                errors.append(ui)
 
         if errors:
             message = (
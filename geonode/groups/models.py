@@ -2,13 +2,41 @@ import datetime
 import hashlib
 
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
 from django.contrib.auth import get_user_model
-from django.db import models, IntegrityError
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import Count
 from django.utils.translation import ugettext_lazy as _
 from taggit.managers import TaggableManager
 
-from guardian.shortcuts import get_objects_for_group
+from guardian.models import GroupObjectPermission
+from guardian.shortcuts import get_objects_for_user
+
+from geonode.base.models import ResourceBase
+
+
+def _memberships(user):
+    # The memberships looked up for this user object, i.e. during a request
+    try:
+        return user._group_memberships
+    except AttributeError:
+        user._group_memberships = {}
+        return user._group_memberships
+
+
+def _forget_memberships(users):
+    # Drop what user objects remember about their groups and permissions
+    for user in users:
+        for name in ('_group_memberships', '_group_perm_cache', '_perm_cache'):
+            if hasattr(user, name):
+                delattr(user, name)
+
+
+def _user_groups():
+    # The model of the table of the groups of users and its two columns
+    field = get_user_model()._meta.get_field('groups')
+    return field.rel.through, field.m2m_field_name(), field.m2m_reverse_field_name()
 
 
 class GroupProfile(models.Model):
@@ -62,25 +90,48 @@ class GroupProfile(models.Model):
         """
         return [kw.name for kw in self.keywords.all()]
 
-    def resources(self, resource_type=None):
+    def resources(self, resource_type=None, user=None):
         """
-        Returns a generator of objects that this group has permissions on.
+        Returns a queryset of the resources this group can view or change.
 
         :param resource_type: Filter's the queryset to objects with the same type.
+        :param user: Only returns the resources this user can view as well.
         """
-
-        queryset = get_objects_for_group(
-            self.group, [
-                'base.view_resourcebase', 'base.change_resourcebase'], any_perm=True)
+        qn = connection.ops.quote_name
+        tables = dict(
+            perms=qn(GroupObjectPermission._meta.db_table),
+            permission=qn(Permission._meta.db_table),
+            resource=qn(ResourceBase._meta.db_table))
+        # object_pk is a string, the grants of the group are cast to ids so
+        # that they drive the query instead of a scan of every resource.
+        granted = (
+            '%(resource)s.id IN (SELECT CAST(%(perms)s.object_pk AS integer)'
+            ' FROM %(perms)s INNER JOIN %(permission)s'
+            ' ON %(permission)s.id = %(perms)s.permission_id'
+            ' WHERE %(perms)s.group_id = %%s AND %(perms)s.content_type_id = %%s'
+            ' AND %(permission)s.codename IN (%%s, %%s))' % tables)
+        queryset = ResourceBase.objects.extra(
+            where=[granted],
+            params=[self.group.id,
+                    ContentType.objects.get_for_model(ResourceBase).id,
+                    'view_resourcebase',
+                    'change_resourcebase'])
 
         if resource_type:
-            queryset = [
-                item for item in queryset if hasattr(
-                    item,
-                    resource_type)]
+            queryset = queryset.filter(polymorphic_ctype__model=resource_type)
+        if user is not None:
+            queryset = queryset.filter(
+                id__in=get_objects_for_user(user, 'base.view_resourcebase').values('id'))
+        return queryset
 
-        for resource in queryset:
-            yield resource
+    def resource_counts(self, user=None):
+        """
+        Returns the number of resources of each type this group can view or
+        change, e.g. {'layer': 10, 'map': 2}, only counting the ones user can
+        view as well when given.
+        """
+        return dict(self.resources(user=user).order_by().values_list(
+            'polymorphic_ctype__model').annotate(Count('id')))
 
     def member_queryset(self):
         return self.groupmember_set.all()
@@ -98,12 +149,18 @@ class GroupProfile(models.Model):
     def user_is_member(self, user):
         if not user.is_authenticated():
             return False
-        return user.id in self.member_queryset().values_list("user", flat=True)
+        memberships = _memberships(user)
+        if (self.id, None) not in memberships:
+            memberships[(self.id, None)] = self.member_queryset().filter(user=user).exists()
+        return memberships[(self.id, None)]
 
     def user_is_role(self, user, role):
         if not user.is_authenticated():
             return False
-        return self.member_queryset().filter(user=user, role=role).exists()
+        memberships = _memberships(user)
+        if (self.id, role) not in memberships:
+            memberships[(self.id, role)] = self.member_queryset().filter(user=user, role=role).exists()
+        return memberships[(self.id, role)]
 
     def can_view(self, user):
         if self.access == "private":
@@ -121,6 +178,42 @@ class GroupProfile(models.Model):
             raise ValueError("The invited user cannot be anonymous")
         GroupMember(group=self, user=user, **kwargs).save()
         user.groups.add(self.group)
+        _forget_memberships([user])
+
+    @transaction.atomic
+    def add_members(self, users, role="member"):
+        """
+        Makes users members of the group with a few queries for all of them,
+        the ones already members are given the role.
+        """
+        user_ids = set(user.id for user in users) - set([settings.ANONYMOUS_USER_ID])
+        if not user_ids:
+            return
+        members = set(self.member_queryset().filter(
+            user__in=user_ids).values_list('user', flat=True))
+        self.member_queryset().filter(user__in=members).update(role=role)
+        GroupMember.objects.bulk_create([
+            GroupMember(group=self, user_id=user_id, role=role) for user_id in user_ids - members])
+
+        through, user_column, group_column = _user_groups()
+        in_group = set(through.objects.filter(**{
+            group_column: self.group,
+            user_column + '__in': user_ids}).values_list(user_column, flat=True))
+        through.objects.bulk_create([
+            through(**{user_column + '_id': user_id, group_column + '_id': self.group.id})
+            for user_id in user_ids - in_group])
+        _forget_memberships(users)
+
+    @transaction.atomic
+    def remove_members(self, users):
+        """
+        Removes users from the group with a query for all of them.
+        """
+        user_ids = [user.id for user in users]
+        self.member_queryset().filter(user__in=user_ids).delete()
+        through, user_column, group_column = _user_groups()
+        through.objects.filter(**{group_column: self.group, user_column + '__in': user_ids}).delete()
+        _forget_memberships(users)
 
     def invite(self, user, from_user, role="member", send=True):
         params = dict(role=role, from_user=from_user)
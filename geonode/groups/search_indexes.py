@@ -5,6 +5,7 @@ from django.conf import settings
 from haystack import indexes
 
 from geonode.groups.models import GroupProfile
+from geonode.security.models import PUBLIC_PRINCIPAL, group_principal
 
 
 class GroupIndex(indexes.SearchIndex, indexes.Indexable):
@@ -16,10 +17,15 @@ class GroupIndex(indexes.SearchIndex, indexes.Indexable):
     oid = indexes.IntegerField(model_attr='id')
     type = indexes.CharField(faceted=True)
     json = indexes.CharField(indexed=False)
+    acl = indexes.MultiValueField(null=True)
 
     def get_model(self):
         return GroupProfile
 
+    def index_queryset(self, using=None):
+        # Keywords are loaded once for each batch.
+        return self.get_model().objects.prefetch_related('keywords')
+
     def prepare_title(self, obj):
         return str(obj)
 
@@ -29,13 +35,18 @@ class GroupIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare_type(self, obj):
         return "group"
 
+    def prepare_acl(self, obj):
+        if obj.access == 'private':
+            return [group_principal(obj.group_id)]
+        return [PUBLIC_PRINCIPAL]
+
     def prepare_json(self, obj):
         data = {
             "_type": self.prepare_type(obj),
 
             "title": obj.title,
             "description": obj.description,
-            "keywords": [keyword.name for keyword in obj.keywords.all()] if obj.keywords else [],
+            "keywords": obj.keyword_list(),
             "thumb": settings.STATIC_URL + "static/img/contact.png",
             "detail": None,
         }
@@ -105,6 +105,7 @@ class SmokeTest(TestCase):
         self.assertTrue(
             map.get_self_resource() not in self.bar.resources(
                 resource_type='layer'))
+        self.assertEqual(self.bar.resource_counts(), {'layer': 1, 'map': 1})
 
         # Revoke permissions on the layer from the self.bar group
         layer.set_permissions("{}")
@@ -112,6 +113,66 @@ class SmokeTest(TestCase):
         # Ensure the layer is no longer returned in the groups resources
         self.assertFalse(layer.get_self_resource() in self.bar.resources())
 
+    def test_group_detail_resources_private(self):
+        """
+        Tests the group page only lists the resources of the group the
+        visitor can view.
+        """
+        layer = Layer.objects.exclude(owner=self.norman)[0]
+        layer.set_permissions({'groups': {'bar': ['view_resourcebase']}})
+        url = reverse('group_detail', args=['bar'])
+
+        # Neither anonymous users nor users outside the group see the layer
+        c = Client()
+        response = c.get(url)
+        self.assertEqual([], list(response.context['resources']))
+        self.assertEqual({}, response.context['resource_counts'])
+        self.assertNotContains(response, layer.detail_url)
+
+        self.assertTrue(c.login(username="norman", password="norman"))
+        response = c.get(url)
+        self.assertEqual([], list(response.context['resources']))
+        self.assertEqual({}, response.context['resource_counts'])
+
+        # Members of the group do
+        self.bar.join(self.norman)
+        response = c.get(url)
+        self.assertEqual([layer.id], [r.id for r in response.context['resources']])
+        self.assertEqual({'layer': 1}, response.context['resource_counts'])
+
+    def test_group_detail_resources(self):
+        """
+        Tests the list, the links and the pages of the group resources.
+        """
+        layers = list(Layer.objects.all()[:3])
+        map = Map.objects.all()[0]
+        for resource in layers + [map]:
+            resource.set_permissions({'groups': {'bar': ['view_resourcebase']}})
+        url = reverse('group_detail', args=['bar'])
+
+        c = Client()
+        self.assertTrue(c.login(username="admin", password="admin"))
+        with self.settings(GROUP_RESOURCES_PAGE_SIZE=2):
+            response = c.get(url)
+            self.assertEqual({'layer': 3, 'map': 1}, response.context['resource_counts'])
+            resources = response.context['resources']
+            self.assertEqual(2, len(resources))
+            self.assertTrue(resources.has_next())
+            for resource in resources:
+                self.assertTrue(resource.detail_url)
+                self.assertContains(response, 'href="%s"' % resource.detail_url)
+
+            # The layers only, across both of their pages
+            listed = []
+            for page in (1, 2):
+                response = c.get(url, {'type': 'layer', 'resources_page': page})
+                listed.extend(resource.id for resource in response.context['resources'])
+            self.assertEqual(sorted(layer.id for layer in layers), sorted(listed))
+
+            # Pages out of range show the last one
+            response = c.get(url, {'type': 'layer', 'resources_page': 99})
+            self.assertEqual(2, response.context['resources'].number)
+
     def test_perms_info(self):
         """
         Tests the perms_info function (which passes permissions to the response context).
@@ -132,6 +193,22 @@ class SmokeTest(TestCase):
             json.loads(perms_info)['groups'], {
                 'bar': ['view_resourcebase']})
 
+    def test_user_perms(self):
+        """
+        Tests the permissions of the current user passed to the detail pages.
+        """
+        layer = Layer.objects.all()[0]
+        layer.set_permissions({'groups': {'bar': ['view_resourcebase', 'change_resourcebase']}})
+
+        self.assertEqual(layer.get_user_perms(get_anonymous_user()), [])
+        self.assertEqual(layer.get_user_perms(self.norman), [])
+
+        self.bar.join(self.norman)
+        self.assertEqual(
+            sorted(layer.get_user_perms(self.norman)),
+            ['change_resourcebase', 'view_resourcebase'])
+        self.assertTrue('change_resourcebase_permissions' in layer.get_user_perms(layer.owner))
+
     def test_resource_permissions(self):
         """
         Tests that the client can get and set group permissions through the test_resource_permissions view.
@@ -239,6 +316,77 @@ class SmokeTest(TestCase):
             # Assert the bar group no longer has permissions
             self.assertDictEqual(permissions['groups'], {})
 
+    def test_resource_permissions_pages(self):
+        """
+        Tests the summary and the pages of the resource_permissions view.
+        """
+        c = Client()
+        self.assertTrue(c.login(username="admin", password="admin"))
+
+        layer = Layer.objects.all()[0]
+        layer.set_default_permissions()
+        layer.set_permissions({
+            'users': {'AnonymousUser': ['view_resourcebase'], 'norman': ['change_resourcebase']},
+            'groups': {'bar': ['view_resourcebase']}})
+        url = reverse('resource_permissions', kwargs=dict(resource_id=layer.id))
+        users = get_user_model().objects.count()
+
+        summary = json.loads(c.get(url, {'summary': 1}).content)['summary']
+        self.assertTrue(summary['public'])
+        self.assertEqual(summary['users']['view_resourcebase'], users)
+        self.assertEqual(summary['users']['change_resourcebase'], 2)
+        self.assertEqual(summary['groups'], {'view_resourcebase': 1})
+
+        permissions = json.loads(c.get(url, {'page': 1, 'page_size': 2}).content)['permissions']
+        self.assertEqual(permissions['count'], users)
+        self.assertEqual(len(permissions['users']), 2)
+        self.assertEqual(permissions['groups'], {'bar': ['view_resourcebase']})
+
+        permissions = json.loads(c.get(url, {'username': 'norm'}).content)['permissions']
+        self.assertEqual(permissions['count'], 1)
+        self.assertEqual(
+            sorted(permissions['users']['norman']),
+            ['change_resourcebase', 'view_resourcebase'])
+
+    def test_batch_permissions(self):
+        """
+        Tests granting and revoking a permission on many resources at once.
+        """
+        layers = list(Layer.objects.all())
+        url = reverse('batch_permissions')
+        spec = {
+            'resources': [layer.id for layer in layers],
+            'groups': ['bar'],
+            'permissions': ['change_resourcebase']}
+
+        c = Client()
+        self.assertEqual(c.post(url, data=json.dumps(spec), content_type="application/json").status_code, 401)
+        self.assertTrue(c.login(username="norman", password="norman"))
+        results = json.loads(
+            c.post(url, data=json.dumps(spec), content_type="application/json").content)['resources']
+        self.assertEqual(set(results.values()), set(['forbidden']))
+
+        self.assertTrue(c.login(username="admin", password="admin"))
+        results = json.loads(
+            c.post(url, data=json.dumps(spec), content_type="application/json").content)['resources']
+        self.assertEqual(results, dict((str(layer.id), 1) for layer in layers))
+        for layer in layers:
+            self.assertEqual(layer.get_all_level_info()['groups'][self.bar.group], ['change_resourcebase'])
+
+        # Granting it again changes nothing
+        results = json.loads(
+            c.post(url, data=json.dumps(spec), content_type="application/json").content)['resources']
+        self.assertEqual(set(results.values()), set([0]))
+
+        spec['action'] = 'revoke'
+        results = json.loads(
+            c.post(url, data=json.dumps(spec), content_type="application/json").content)['resources']
+        self.assertEqual(set(results.values()), set([1]))
+        self.assertFalse(self.bar.resources())
+
+        spec['permissions'] = ['not_a_permission']
+        self.assertEqual(c.post(url, data=json.dumps(spec), content_type="application/json").status_code, 400)
+
     def test_create_new_group(self):
         """
         Tests creating a group through the group_create route.
@@ -393,6 +541,33 @@ class MembershipTest(TestCase):
         self.assert_(group.user_is_member(normal))
         self.assertRaises(ValueError, lambda: group.join(anon))
 
+    def test_group_add_members(self):
+        "Test adding and removing many users at once"
+
+        anon = get_anonymous_user()
+        admin = get_user_model().objects.get(username="admin")
+        normal = get_user_model().objects.get(username="norman")
+        group = GroupProfile.objects.get(slug="bar")
+        self.assert_(not group.user_is_member(normal))
+
+        group.add_members([anon, admin, normal], role="member")
+        self.assert_(group.user_is_member(normal))
+        self.assert_(not group.user_is_member(anon))
+        self.assert_(group.user_is_role(admin, "member"))
+        self.assertEqual(group.member_queryset().filter(user=admin).count(), 1)
+        self.assert_(group.group in normal.groups.all())
+
+        group.remove_members([normal])
+        self.assert_(not group.user_is_member(normal))
+        self.assert_(group.group not in normal.groups.all())
+
+        # The membership is looked up once per user object
+        admin = get_user_model().objects.get(username="admin")
+        self.assert_(group.user_is_member(admin))
+        group.member_queryset().filter(user=admin).delete()
+        self.assert_(group.user_is_member(admin))
+        self.assert_(not group.user_is_member(get_user_model().objects.get(username="admin")))
+
 
 class InvitationTest(TestCase):
 
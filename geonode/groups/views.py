@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.http import Http404, HttpResponseForbidden, HttpResponseRedirect, HttpResponseNotAllowed
 from django.shortcuts import render_to_response, get_object_or_404, redirect
@@ -8,7 +10,7 @@ from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView
 
 from geonode.groups.forms import GroupInviteForm, GroupForm, GroupUpdateForm, GroupMemberForm
-from geonode.groups.models import GroupProfile, GroupInvitation, GroupMember
+from geonode.groups.models import GroupProfile, GroupInvitation
 
 
 @login_required
@@ -80,8 +82,21 @@ class GroupDetailView(ListView):
     def get_context_data(self, **kwargs):
         context = super(GroupDetailView, self).get_context_data(**kwargs)
         context['object'] = self.group
-        context['maps'] = self.group.resources(resource_type='map')
-        context['layers'] = self.group.resources(resource_type='layer')
+
+        # A page of the resources of the group the visitor can view, of one
+        # type if asked for
+        paginator = Paginator(
+            self.group.resources(
+                resource_type=self.request.GET.get('type'),
+                user=self.request.user).order_by('-date'),
+            getattr(settings, 'GROUP_RESOURCES_PAGE_SIZE', 25))
+        try:
+            context['resources'] = paginator.page(self.request.GET.get('resources_page'))
+        except PageNotAnInteger:
+            context['resources'] = paginator.page(1)
+        except EmptyPage:
+            context['resources'] = paginator.page(paginator.num_pages)
+        context['resource_counts'] = self.group.resource_counts(user=self.request.user)
         context['is_member'] = self.group.user_is_member(self.request.user)
         context['is_manager'] = self.group.user_is_role(
             self.request.user,
@@ -127,16 +142,11 @@ def group_members_add(request, slug):
     form = GroupMemberForm(request.POST)
 
     if form.is_valid():
-        role = form.cleaned_data["role"]
-        for user in form.cleaned_data["user_identifiers"]:
-            # dont add them if already a member, just update the role
-            try:
-                gm = GroupMember.objects.get(user=user, group=group)
-                gm.role = role
-                gm.save()
-            except:
-                gm = GroupMember(user=user, group=group, role=role)
-                gm.save()
+        # Members already in the group are only given the role, email
+        # addresses of people without an account can not be added.
+        group.add_members(
+            [user for user in form.cleaned_data["user_identifiers"] if isinstance(user, get_user_model())],
+            role=form.cleaned_data["role"])
     return redirect("group_detail", slug=group.slug)
 
 
@@ -148,8 +158,7 @@ def group_member_remove(request, slug, username):
     if not group.user_is_role(request.user, role="manager"):
         return HttpResponseForbidden()
     else:
-        GroupMember.objects.get(group=group, user=user).delete()
-        user.groups.remove(group.group)
+        group.remove_members([user])
         return redirect("group_detail", slug=group.slug)
 
 
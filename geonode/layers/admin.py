@@ -19,10 +19,12 @@
 #########################################################################
 
 from django.contrib import admin
+from django.contrib.admin import actions
 
 from geonode.base.admin import MediaTranslationAdmin
 from geonode.layers.models import Layer, Attribute, Style
 from geonode.layers.models import LayerFile, UploadSession
+from geonode.layers.signals import bulk_delete
 
 import autocomplete_light
 
@@ -31,6 +33,17 @@ class AttributeInline(admin.TabularInline):
     model = Attribute
 
 
+def delete_selected(modeladmin, request, queryset):
+    """
+    Same as the default delete action, with the layers removed from
+    the backend all together once they are gone from the database.
+    """
+    with bulk_delete():
+        return actions.delete_selected(modeladmin, request, queryset)
+
+delete_selected.short_description = actions.delete_selected.short_description
+
+
 class LayerAdmin(MediaTranslationAdmin):
     list_display = (
         'id',
@@ -48,6 +61,7 @@ class LayerAdmin(MediaTranslationAdmin):
     date_hierarchy = 'date'
     readonly_fields = ('uuid', 'typename', 'workspace')
     inlines = [AttributeInline]
+    actions = [delete_selected]
     form = autocomplete_light.modelform_factory(Layer)
 
 
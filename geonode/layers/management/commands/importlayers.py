@@ -60,7 +60,29 @@ class Command(BaseCommand):
             default="",
             help="""The default keywords, separated by comma, for the
                     imported layer(s). Will be the same for all imported layers
-                    if multiple imports are done in one command""")
+                    if multiple imports are done in one command"""),
+        make_option(
+            '-j',
+            '--jobs',
+            dest='jobs',
+            type='int',
+            default=1,
+            help="Number of files uploaded to GeoServer at the same time (defaults 1)"),
+        make_option(
+            '--journal',
+            dest='journal',
+            default=None,
+            help="""File where completed files are recorded. Files listed
+                    in it are skipped, so an interrupted import can be resumed
+                    by running the same command again"""),
+        make_option(
+            '-d',
+            '--deferred',
+            dest='deferred',
+            default=False,
+            action="store_true",
+            help="""Generate thumbnails, catalogue records and links after
+                    all the files have been uploaded""")
         )
 
     def handle(self, *args, **options):
@@ -92,7 +114,10 @@ class Command(BaseCommand):
                 skip=skip,
                 keywords=keywords,
                 verbosity=verbosity,
-                console=console)
+                console=console,
+                jobs=options.get('jobs'),
+                journal=options.get('journal'),
+                deferred=options.get('deferred'))
             output.extend(out)
 
         updated = [dict_['file']
@@ -114,9 +139,13 @@ class Command(BaseCommand):
             for dict_ in output:
                 if dict_['status'] == 'failed':
                     print "\n\n", dict_['file'], "\n================"
-                    traceback.print_exception(dict_['exception_type'],
-                                              dict_['error'],
-                                              dict_['traceback'])
+                    if dict_['exception_type'] is None:
+                        # Reported by a worker process, already formatted.
+                        print dict_['traceback']
+                    else:
+                        traceback.print_exception(dict_['exception_type'],
+                                                  dict_['error'],
+                                                  dict_['traceback'])
 
         if verbosity > 0:
             print "\n\nFinished processing %d layers in %s seconds.\n" % (
@@ -33,6 +33,7 @@ from django.core.urlresolvers import reverse
 from geonode.base.models import ResourceBase, ResourceBaseManager, resourcebase_post_save
 from geonode.people.utils import get_valid_user
 from agon_ratings.models import OverallRating
+from geonode.layers.signals import bulk_delete_in_progress, record_bulk_delete
 
 logger = logging.getLogger("geonode.layers.models")
 
@@ -478,6 +479,9 @@ def post_delete_layer(instance, sender, **kwargs):
         name=instance.typename,
         ows_url=instance.ows_url).delete()
 
+    if bulk_delete_in_progress():
+        record_bulk_delete(instance)
+
     if instance.service:
         return
     logger.debug(
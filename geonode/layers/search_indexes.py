@@ -1,12 +1,14 @@
 from agon_ratings.models import OverallRating
 from dialogos.models import Comment
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db.models import Avg
 from haystack import indexes
 from geonode.maps.models import Layer
+from geonode.security.search_indexes import ViewPrincipalsMixin
 
 
-class LayerIndex(indexes.SearchIndex, indexes.Indexable):
+class LayerIndex(ViewPrincipalsMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.EdgeNgramField(document=True, use_template=True)
     oid = indexes.CharField(model_attr='resourcebase_ptr_id')
     uuid = indexes.CharField(model_attr='uuid')
@@ -46,10 +48,33 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
     num_ratings = indexes.IntegerField()
     num_comments = indexes.IntegerField()
     thumbnail_url = indexes.CharField(model_attr="thumbnail_url", null=True)
+    acl = indexes.MultiValueField(null=True)
 
     def get_model(self):
         return Layer
 
+    def index_queryset(self, using=None):
+        """Fetch what the prepare methods need along with each batch of layers
+
+           Ratings and comments are counted by subqueries of the same select,
+           related rows, keywords and view grants are loaded once per batch.
+        """
+        qn = connection.ops.quote_name
+        ct = ContentType.objects.get_for_model(Layer)
+        pk = '%s.%s' % (qn(Layer._meta.db_table), qn(Layer._meta.pk.column))
+
+        def subquery(select, model):
+            return 'SELECT %s FROM %s WHERE %s.object_id = %s AND %s.content_type_id = %d' % (
+                select, qn(model._meta.db_table), qn(model._meta.db_table), pk, qn(model._meta.db_table), ct.id)
+
+        return self.view_principals_queryset(self.get_model().objects.select_related(
+            'owner', 'category', 'service'
+        ).prefetch_related('keywords')).extra(select={
+            'index_rating': subquery('AVG(rating)', OverallRating),
+            'index_num_ratings': subquery('COUNT(*)', OverallRating),
+            'index_num_comments': subquery('COUNT(*)', Comment),
+        })
+
     def prepare_type(self, obj):
         return "layer"
 
@@ -77,6 +102,8 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
             return None
 
     def prepare_rating(self, obj):
+        if hasattr(obj, 'index_rating'):
+            return float(str(obj.index_rating or "0"))
         ct = ContentType.objects.get_for_model(obj)
         try:
             rating = OverallRating.objects.filter(
@@ -88,6 +115,8 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
             return 0.0
 
     def prepare_num_ratings(self, obj):
+        if hasattr(obj, 'index_num_ratings'):
+            return obj.index_num_ratings
         ct = ContentType.objects.get_for_model(obj)
         try:
             return OverallRating.objects.filter(
@@ -98,6 +127,8 @@ class LayerIndex(indexes.SearchIndex, indexes.Indexable):
             return 0
 
     def prepare_num_comments(self, obj):
+        if hasattr(obj, 'index_num_comments'):
+            return obj.index_num_comments
         try:
             return Comment.objects.filter(
                 object_id=obj.pk,
@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from threading import local
+
+from django.db import transaction
+from django.dispatch import Signal
+
+# Sent once for all the layers removed inside a bulk_delete block.
+layers_deleted = Signal(providing_args=['layers'])
+
+# Sent by finish_layer for a layer saved with its post processing deferred.
+layer_finished = Signal(providing_args=['instance'])
+
+_bulk_delete = local()
+
+
+def bulk_delete_in_progress():
+    """True while the layers being deleted are cleaned up together later on.
+    """
+    return getattr(_bulk_delete, 'layers', None) is not None
+
+
+def record_bulk_delete(layer):
+    _bulk_delete.layers.append(layer)
+
+
+@contextmanager
+def bulk_delete():
+    """Hold the backend cleanup of the layers deleted in the block.
+
+       The block runs in a transaction. layers_deleted is sent with all
+       the layers once it is committed, so backends can remove them with
+       as few requests as possible. Nothing is sent if the block fails,
+       its deletes are rolled back and the layers are kept.
+    """
+    if bulk_delete_in_progress():
+        yield
+        return
+
+    _bulk_delete.layers = []
+    try:
+        with transaction.atomic():
+            yield
+        layers = _bulk_delete.layers
+    finally:
+        _bulk_delete.layers = None
+
+    if layers:
+        from geonode.layers.models import Layer
+        layers_deleted.send(sender=Layer, layers=layers)
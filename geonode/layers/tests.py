@@ -21,7 +21,9 @@
 import os
 import shutil
 import tempfile
+import unittest
 
+from django.conf import settings
 from django.test import TestCase
 from django.test.client import Client
 from django.utils import simplejson as json
@@ -29,8 +31,9 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.forms import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.db.models import Count
+from django.db.models import Count, signals
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from agon_ratings.models import OverallRating
 
 from guardian.shortcuts import get_anonymous_user, assign_perm
@@ -38,12 +41,16 @@ from guardian.shortcuts import get_anonymous_user, assign_perm
 from geonode import GeoNodeException
 
 from geonode.layers.models import Layer, Style
+from geonode.layers.signals import layers_deleted, layer_finished, bulk_delete
+from geonode.layers import utils as layer_utils
 from geonode.layers.utils import layer_type, get_files, get_valid_name, \
-    get_valid_layer_name
+    get_valid_layer_name, upload, defer_post_processing, post_processing_deferred, \
+    delete_layers, _read_journal
 from geonode.people.utils import get_valid_user
 from geonode.base.models import TopicCategory
 from geonode.base.populate_test_data import create_models
 from geonode.layers.forms import JSONField, LayerUploadForm
+from geonode.security.models import PUBLIC_PRINCIPAL, get_user_principals, user_principal, view_grants
 from .populate_layers_data import create_layer_data
 
 
@@ -161,6 +168,31 @@ class LayersTest(TestCase):
             user = get_user_model().objects.get(username=username)
             self.assertTrue(user.has_perm(perm, layer.get_self_resource()))
 
+    def test_layer_view_principals(self):
+        """Verify the ACL indexed for searching follows the view permission
+        """
+        layer = Layer.objects.all()[0]
+        admin = get_user_model().objects.get(username='admin')
+
+        layer.set_default_permissions()
+        self.assertEqual([PUBLIC_PRINCIPAL], layer.get_view_principals())
+
+        layer.set_permissions(self.perm_spec)
+        self.assertEqual(
+            set([user_principal(admin.id), user_principal(layer.owner.id)]),
+            set(layer.get_view_principals()))
+
+        self.assertEqual([PUBLIC_PRINCIPAL], get_user_principals(AnonymousUser()))
+        self.assertIn(user_principal(admin.id), get_user_principals(admin))
+
+        # The grants of many layers are read with one query per guardian table
+        layers = list(Layer.objects.all())
+        with self.assertNumQueries(2):
+            grants = view_grants([l.id for l in layers])
+        with self.assertNumQueries(0):
+            principals = [set(l.get_view_principals(grants)) for l in layers]
+        self.assertEqual([set(l.get_view_principals()) for l in layers], principals)
+
     def test_ajax_layer_permissions(self):
         """Verify that the ajax_layer_permissions view is behaving as expected
         """
@@ -724,6 +756,114 @@ class LayersTest(TestCase):
         self.assertRaises(GeoNodeException, get_valid_layer_name, 12, False)
         self.assertRaises(GeoNodeException, get_valid_layer_name, 12, True)
 
+    def test_upload_journal(self):
+        d = tempfile.mkdtemp()
+        try:
+            shp = os.path.join(d, 'foo.shp')
+            with open(shp, 'w') as f:
+                f.write(' ')
+            journal = os.path.join(d, 'journal.txt')
+            with open(journal, 'w') as f:
+                f.write('%s\tcreated\tfoo\n' % os.path.abspath(shp))
+                f.write('truncated line\n')
+
+            self.assertEquals(['foo'], [e['name'] for e in _read_journal(journal).values()])
+
+            # Files listed in the journal are not uploaded again.
+            output = upload(d, journal=journal, verbosity=0)
+            self.assertEquals([{'file': os.path.abspath(shp), 'status': 'skipped', 'name': 'foo'}], output)
+
+            # Files imported without being post processed only get post processed.
+            layer = Layer.objects.all()[0]
+            with open(journal, 'w') as f:
+                f.write('%s\timported\t%s\n' % (os.path.abspath(shp), layer.name))
+            finished = []
+            finish_layer = layer_utils.finish_layer
+            layer_utils.finish_layer = finished.append
+            try:
+                output = upload(d, journal=journal, verbosity=0)
+            finally:
+                layer_utils.finish_layer = finish_layer
+            self.assertEquals([layer], finished)
+            self.assertEquals([{'file': os.path.abspath(shp), 'status': 'finished', 'name': layer.name}], output)
+            self.assertEquals('finished', _read_journal(journal)[os.path.abspath(shp)]['status'])
+        finally:
+            shutil.rmtree(d)
+
+    @unittest.skipUnless(getattr(settings, 'HAYSTACK_SEARCH', False), 'haystack is not configured')
+    def test_layer_index_batch_prepare(self):
+        from geonode.layers.search_indexes import LayerIndex
+        layer = Layer.objects.all()[0]
+        ct = ContentType.objects.get_for_model(layer)
+        OverallRating.objects.create(object_id=layer.id, content_type=ct, rating=3)
+
+        index = LayerIndex()
+        batched = index.index_queryset().get(id=layer.id)
+        for field in ('rating', 'num_ratings', 'num_comments', 'keywords'):
+            self.assertEquals(index.full_prepare(layer)[field], index.full_prepare(batched)[field])
+        self.assertEquals(3.0, index.prepare_rating(batched))
+
+    def test_defer_post_processing(self):
+        self.assertFalse(post_processing_deferred())
+        with defer_post_processing():
+            self.assertTrue(post_processing_deferred())
+            with defer_post_processing():
+                self.assertTrue(post_processing_deferred())
+            self.assertTrue(post_processing_deferred())
+        self.assertFalse(post_processing_deferred())
+
+    def test_finish_layer(self):
+        sent = []
+
+        def receiver(sender, instance, **kwargs):
+            sent.append((sender, instance))
+        layer_finished.connect(receiver)
+        signals.post_save.connect(receiver, sender=Layer)
+        try:
+            layer = Layer.objects.all()[0]
+            layer_utils.finish_layer(layer)
+        finally:
+            layer_finished.disconnect(receiver)
+            signals.post_save.disconnect(receiver, sender=Layer)
+        # Only the deferred steps run, the layer is not saved again.
+        self.assertEquals([(Layer, layer)], sent)
+
+    def test_delete_layers(self):
+        deleted = []
+
+        def receiver(sender, layers, **kwargs):
+            deleted.append([layer.typename for layer in layers])
+        layers_deleted.connect(receiver)
+        try:
+            layers = list(Layer.objects.all()[:2])
+            self.assertEqual(2, delete_layers(layers))
+        finally:
+            layers_deleted.disconnect(receiver)
+
+        # The backend is told once about all of them
+        self.assertEqual([[layer.typename for layer in layers]], deleted)
+        self.assertFalse(Layer.objects.filter(id__in=[layer.id for layer in layers]).exists())
+
+    def test_delete_layers_failed(self):
+        deleted = []
+
+        def receiver(sender, layers, **kwargs):
+            deleted.append(layers)
+        layers_deleted.connect(receiver)
+        layer = Layer.objects.all()[0]
+        layer_id = layer.id
+        try:
+            with self.assertRaises(ValueError):
+                with bulk_delete():
+                    layer.delete()
+                    raise ValueError()
+        finally:
+            layers_deleted.disconnect(receiver)
+
+        # The delete is rolled back and the backend is left alone
+        self.assertEqual([], deleted)
+        self.assertTrue(Layer.objects.filter(id=layer_id).exists())
+
     # NOTE: we don't care about file content for many of these tests (the
     # forms under test validate based only on file name, and leave actual
     # content inspection to GeoServer) but Django's form validation will omit
@@ -1044,142 +1184,126 @@ class LayersTest(TestCase):
 
         #Now add permission edit_resourcebase_Style
 
-         assign_perm('edit_resourcebase_style', bob, layer.get_self_resource())
+        assign_perm('edit_resourcebase_style', bob, layer.get_self_resource())
 
-         self.assertTrue(
+        self.assertTrue(
             bob.has_perm(
                 'edit_resourcebase_style',
                 layer.get_self_resource()))
 
-        def test_edit_resourcebase_data(self):
-            layer = Layer.objects.all()[0]
-
-            # grab bobby
-            bob = get_user_model().objects.get(username='bobby')
-
-            #First case when user bobby does not has the permission to edit
-            #Setting permission for bobby 
-
-            perms = {
-            "users": {
-                "admin": [
-                    "view_resourcebase",
-                    "change_resourcebase_permissions",
-                    "edit_resourcebase_style",
-                    "edit_resourcebase_data",
-                    "download_resourcebase",
-                    "download_resourcebase_metadata"],
-                "bobby":[
-                    "view_resourcebase"
-                    ]},
-            "groups": {}}
-
-            layer.set_permissions(perms)
-
-            self.assertFalse(
-                bob.has_perm(
-                    'edit_resourcebase_data',
-                    layer.get_self_resource()))
-
-            #Now add permission edit_resourcebase_data
-
-            assign_perm('edit_resourcebase_data', bob, layer.get_self_resource())
-
-            self.assertTrue(
-                bob.has_perm(
-                    'edit_resourcebase_data',
-                    layer.get_self_resource()))
-
-        def test_download_resourcebase_metadata(self):
-            layer = Layer.objects.all()[0]
-
-            # grab bobby
-            bob = get_user_model().objects.get(username='bobby')
-
-            #First case when user bobby does not has the permission to download
-            #Setting permission for bobby 
-
-            perms = {
-            "users": {
-                "admin": [
-                    "view_resourcebase",
-                    "change_resourcebase_permissions",
-                    "edit_resourcebase_style",
-                    "edit_resourcebase_data",
-                    "download_resourcebase",
-                    "download_resourcebase_metadata"],
-                "bobby":[
-                    "view_resourcebase"
-                    ]},
-            "groups": {}}
-
-            layer.set_permissions(perms)
-
-            self.assertFalse(
-                bob.has_perm(
-                    'download_resourcebase_metadata',
-                    layer.get_self_resource()))
-
-            #Now add permission download_resourcebase_metadata
-
-             assign_perm('download_resourcebase_metadata', bob, layer.get_self_resource())
+    def test_edit_resourcebase_data(self):
+        layer = Layer.objects.all()[0]
 
-             self.assertTrue(
-                bob.has_perm(
-                    'download_resourcebase_metadata',
-                    layer.get_self_resource()))
+        # grab bobby
+        bob = get_user_model().objects.get(username='bobby')
 
-        def test_download_resourcebase(self):
-            layer = Layer.objects.all()[0]
+        #First case when user bobby does not has the permission to edit
+        #Setting permission for bobby 
 
-            # grab bobby
-            bob = get_user_model().objects.get(username='bobby')
+        perms = {
+        "users": {
+            "admin": [
+                "view_resourcebase",
+                "change_resourcebase_permissions",
+                "edit_resourcebase_style",
+                "edit_resourcebase_data",
+                "download_resourcebase",
+                "download_resourcebase_metadata"],
+            "bobby":[
+                "view_resourcebase"
+                ]},
+        "groups": {}}
 
-            #First case when user bobby does not has the permission to download
-            #Setting permission for bobby 
+        layer.set_permissions(perms)
 
-            perms = {
-            "users": {
-                "admin": [
-                    "view_resourcebase",
-                    "change_resourcebase_permissions",
-                    "edit_resourcebase_style",
-                    "edit_resourcebase_data",
-                    "download_resourcebase",
-                    "download_resourcebase_metadata"],
-                "bobby":[
-                    "view_resourcebase"
-                    ]},
-            "groups": {}}
+        self.assertFalse(
+            bob.has_perm(
+                'edit_resourcebase_data',
+                layer.get_self_resource()))
 
-            layer.set_permissions(perms)
+        #Now add permission edit_resourcebase_data
 
-            self.assertFalse(
-                bob.has_perm(
-                    'download_resourcebase',
-                    layer.get_self_resource()))
+        assign_perm('edit_resourcebase_data', bob, layer.get_self_resource())
 
-            #Now add permission download_resourcebase
+        self.assertTrue(
+            bob.has_perm(
+                'edit_resourcebase_data',
+                layer.get_self_resource()))
 
-             assign_perm('download_resourcebase', bob, layer.get_self_resource())
+    def test_download_resourcebase_metadata(self):
+        layer = Layer.objects.all()[0]
 
-             self.assertTrue(
-                bob.has_perm(
-                    'download_resourcebase',
-                    layer.get_self_resource()))
+        # grab bobby
+        bob = get_user_model().objects.get(username='bobby')
 
+        #First case when user bobby does not has the permission to download
+        #Setting permission for bobby 
 
+        perms = {
+        "users": {
+            "admin": [
+                "view_resourcebase",
+                "change_resourcebase_permissions",
+                "edit_resourcebase_style",
+                "edit_resourcebase_data",
+                "download_resourcebase",
+                "download_resourcebase_metadata"],
+            "bobby":[
+                "view_resourcebase"
+                ]},
+        "groups": {}}
 
+        layer.set_permissions(perms)
 
+        self.assertFalse(
+            bob.has_perm(
+                'download_resourcebase_metadata',
+                layer.get_self_resource()))
 
+        #Now add permission download_resourcebase_metadata
 
+        assign_perm('download_resourcebase_metadata', bob, layer.get_self_resource())
 
+        self.assertTrue(
+            bob.has_perm(
+                'download_resourcebase_metadata',
+                layer.get_self_resource()))
 
+    def test_download_resourcebase(self):
+        layer = Layer.objects.all()[0]
 
+        # grab bobby
+        bob = get_user_model().objects.get(username='bobby')
 
+        #First case when user bobby does not has the permission to download
+        #Setting permission for bobby 
 
+        perms = {
+        "users": {
+            "admin": [
+                "view_resourcebase",
+                "change_resourcebase_permissions",
+                "edit_resourcebase_style",
+                "edit_resourcebase_data",
+                "download_resourcebase",
+                "download_resourcebase_metadata"],
+            "bobby":[
+                "view_resourcebase"
+                ]},
+        "groups": {}}
 
+        layer.set_permissions(perms)
 
+        self.assertFalse(
+            bob.has_perm(
+                'download_resourcebase',
+                layer.get_self_resource()))
 
+        #Now add permission download_resourcebase
 
+        assign_perm('download_resourcebase', bob, layer.get_self_resource())
 
+        self.assertTrue(
+            bob.has_perm(
+                'download_resourcebase',
+                layer.get_self_resource()))
@@ -22,6 +22,8 @@ from django.conf.urls import patterns, url
 from django.conf import settings
 from django.views.generic import TemplateView
 
+from geonode.utils import batch_delete, batch_permissions
+
 js_info_dict = {
     'packages': ('geonode.layers',),
 }
@@ -38,9 +40,9 @@ urlpatterns = patterns(
     url(r'^(?P<layername>[^/]*)/remove$', 'layer_remove', name="layer_remove"),
     url(r'^(?P<layername>[^/]*)/replace$', 'layer_replace',
         name="layer_replace"),
-    # url(r'^api/batch_permissions/?$', 'batch_permissions',
-    #    name='batch_permssions'),
-    # url(r'^api/batch_delete/?$', 'batch_delete', name='batch_delete'),
+    url(r'^api/batch_permissions/?$', batch_permissions,
+        name='batch_permissions'),
+    url(r'^api/batch_delete/?$', batch_delete, name='batch_delete'),
 )
 
 # -- Deprecated url routes for Geoserver authentication -- remove after GeoNode 2.1
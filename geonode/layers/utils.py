@@ -27,6 +27,11 @@ import re
 import os
 import glob
 import sys
+import traceback
+
+from contextlib import contextmanager
+from multiprocessing import Pool
+from threading import local
 
 from osgeo import gdal
 
@@ -37,15 +42,17 @@ from django.template.defaultfilters import slugify
 from django.core.files import File
 from django.core.files.base import ContentFile
 from django.conf import settings
+from django.db import connection
 
 # Geonode functionality
 from geonode import GeoNodeException
 from geonode.people.utils import get_valid_user
 from geonode.layers.models import Layer, UploadSession
+from geonode.layers.signals import bulk_delete, layer_finished
 from geonode.base.models import (Link, ResourceBase, Thumbnail,
                                  SpatialRepresentationType, TopicCategory)
 from geonode.layers.models import shp_exts, csv_exts, vec_exts, cov_exts
-from geonode.utils import http_client
+from geonode.utils import thread_http_client
 from geonode.layers.metadata import set_metadata
 
 from urlparse import urljoin
@@ -385,15 +392,171 @@ def file_upload(filename, name=None, user=None, title=None, abstract=None,
     return layer
 
 
+_deferred = local()
+
+
+def post_processing_deferred():
+    """True while the layers being saved should skip their post processing.
+    """
+    return getattr(_deferred, 'active', False)
+
+
+@contextmanager
+def defer_post_processing():
+    """Skip thumbnails, catalogue records and links for layers saved in the block.
+
+       The layers have to be completed later on with finish_layer.
+    """
+    previous = post_processing_deferred()
+    _deferred.active = True
+    try:
+        yield
+    finally:
+        _deferred.active = previous
+
+
+def finish_layer(layer):
+    """Run the post processing skipped by defer_post_processing for a layer.
+
+       Only the deferred steps run, the layer itself is not saved again.
+    """
+    layer_finished.send(sender=Layer, instance=layer)
+
+
+def delete_layers(layers):
+    """Delete many layers, cleaning up their backend for all of them at once.
+    """
+    deleted = 0
+    with bulk_delete():
+        for layer in layers:
+            layer.delete()
+            deleted += 1
+    return deleted
+
+
+def _upload_file(filename, basename, user=None, overwrite=False,
+                 keywords=(), skip=True, ignore_errors=True,
+                 verbosity=1, deferred=False):
+    """Upload one file and return its entry for the upload report
+    """
+    existing_layers = Layer.objects.filter(name=basename)
+
+    if existing_layers.count() > 0:
+        existed = True
+    else:
+        existed = False
+
+    if existed and skip:
+        save_it = False
+        status = 'skipped'
+        layer = existing_layers[0]
+        if verbosity > 0:
+            msg = ('Stopping process because '
+                   '--overwrite was not set '
+                   'and a layer with this name already exists.')
+            print >> sys.stderr, msg
+    else:
+        save_it = True
+
+    if save_it:
+        try:
+            if deferred:
+                with defer_post_processing():
+                    layer = file_upload(filename,
+                                        user=user,
+                                        overwrite=overwrite,
+                                        keywords=keywords,
+                                        )
+            else:
+                layer = file_upload(filename,
+                                    user=user,
+                                    overwrite=overwrite,
+                                    keywords=keywords,
+                                    )
+            if not existed:
+                status = 'created'
+            else:
+                status = 'updated'
+
+        except Exception as e:
+            if ignore_errors:
+                status = 'failed'
+                exception_type, error, tb = sys.exc_info()
+            else:
+                if verbosity > 0:
+                    msg = ('Stopping process because '
+                           '--ignore-errors was not set '
+                           'and an error was found.')
+                    print >> sys.stderr, msg
+                    msg = 'Failed to process %s' % filename
+                    raise Exception(msg, e), None, sys.exc_info()[2]
+                raise
+
+    info = {'file': filename, 'status': status}
+    if status == 'failed':
+        info['traceback'] = tb
+        info['exception_type'] = exception_type
+        info['error'] = error
+    else:
+        info['name'] = layer.name
+    return info
+
+
+def _upload_worker(args):
+    """Entry point of the worker processes started by upload
+    """
+    filename, basename, kwargs = args
+    info = _upload_file(filename, basename, ignore_errors=True, **kwargs)
+    if info['status'] == 'failed':
+        # Tracebacks can not be sent back to the parent process.
+        info['traceback'] = ''.join(traceback.format_exception(
+            info['exception_type'], info['error'], info['traceback']))
+        info['exception_type'] = None
+        info['error'] = unicode(info['error'])
+    return info
+
+
+def _finish_worker(name):
+    try:
+        finish_layer(Layer.objects.get(name=name))
+    except Exception:
+        return name, traceback.format_exc()
+    return name, None
+
+
+def _read_journal(journal):
+    """Return the entries of a journal written by a previous upload run
+    """
+    done = {}
+    if journal is None or not os.path.exists(journal):
+        return done
+    with open(journal) as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) == 3:
+                filename, status, name = parts
+                done[filename] = {'file': filename, 'status': status, 'name': name}
+    return done
+
+
 def upload(incoming, user=None, overwrite=False,
            keywords=(), skip=True, ignore_errors=True,
-           verbosity=1, console=None):
+           verbosity=1, console=None, jobs=1, journal=None,
+           deferred=False):
     """Upload a directory of spatial data files to GeoNode
 
        This function also verifies that each layer is in GeoServer.
 
        Supported extensions are: .shp, .tif, and .zip (of a shapefile).
        It catches GeoNodeExceptions and gives a report per file
+
+       Files are processed by ``jobs`` worker processes, which is also
+       the maximum number of uploads GeoServer receives at the same time.
+       When a ``journal`` file is given, completed files are written to it
+       and skipped by later runs. With ``deferred`` the thumbnails,
+       catalogue records and links are generated once all the files
+       have been uploaded, until then the files are journaled as
+       ``imported`` and a later run only generates those for them.
     """
     if verbosity > 1:
         print >> console, "Verifying that GeoNode is running ..."
@@ -432,74 +595,125 @@ def upload(incoming, user=None, overwrite=False,
         print >> console, msg
 
     output = []
-    for i, file_pair in enumerate(potential_files):
-        basename, filename = file_pair
-
-        existing_layers = Layer.objects.filter(name=basename)
+    uploaded = []
+    done = _read_journal(journal)
+    if done:
+        pending = []
+        for basename, filename in potential_files:
+            entry = done.get(os.path.abspath(filename))
+            if entry is None:
+                pending.append((basename, filename))
+            elif entry['status'] == 'imported':
+                # Uploaded by a run that stopped before post processing it.
+                uploaded.append(dict(entry, status='finished'))
+            else:
+                output.append(dict(entry, status='skipped'))
+        if verbosity > 0:
+            print >> console, "Skipping %d files found in %s." % (len(output), journal)
+        potential_files = pending
+
+    journal_file = open(journal, 'a') if journal is not None else None
+
+    def record(info):
+        if journal_file is not None and info['status'] != 'failed':
+            journal_file.write('%s\t%s\t%s\n' % (
+                os.path.abspath(info['file']), info['status'], info['name']))
+            journal_file.flush()
+
+    kwargs = dict(user=user, overwrite=overwrite, keywords=keywords, skip=skip,
+                  verbosity=verbosity, deferred=deferred)
+
+    pool = None
+    if jobs > 1:
+        # The workers are forked, each one has to open its own connection.
+        connection.close()
+        pool = Pool(jobs)
+        results = pool.imap_unordered(
+            _upload_worker,
+            [(filename, basename, kwargs) for basename, filename in potential_files])
+    else:
+        results = (_upload_file(filename, basename, ignore_errors=ignore_errors, **kwargs)
+                   for basename, filename in potential_files)
 
-        if existing_layers.count() > 0:
-            existed = True
-        else:
-            existed = False
+    try:
+        for i, info in enumerate(results):
+            if info['status'] == 'failed' and not ignore_errors:
+                msg = 'Failed to process %s' % info['file']
+                raise Exception(msg, info['error'])
+
+            if deferred and info['status'] in ('created', 'updated'):
+                record(dict(info, status='imported'))
+                uploaded.append(info)
+            else:
+                record(info)
 
-        if existed and skip:
-            save_it = False
-            status = 'skipped'
-            layer = existing_layers[0]
+            msg = "[%s] Layer for '%s' (%d/%d)" % (info['status'], info['file'], i + 1, len(potential_files))
+            output.append(info)
             if verbosity > 0:
-                msg = ('Stopping process because '
-                       '--overwrite was not set '
-                       'and a layer with this name already exists.')
-                print >> sys.stderr, msg
-        else:
-            save_it = True
-
-        if save_it:
-            try:
-                layer = file_upload(filename,
-                                    user=user,
-                                    overwrite=overwrite,
-                                    keywords=keywords,
-                                    )
-                if not existed:
-                    status = 'created'
-                else:
-                    status = 'updated'
+                print >> console, msg
 
-            except Exception as e:
-                if ignore_errors:
-                    status = 'failed'
-                    exception_type, error, traceback = sys.exc_info()
-                else:
+        if uploaded:
+            if verbosity > 0:
+                print >> console, "Generating thumbnails, links and metadata for %d layers ..." % len(uploaded)
+            by_name = dict((info['name'], info) for info in uploaded)
+            names = by_name.keys()
+            if pool is not None:
+                finished = pool.imap_unordered(_finish_worker, names)
+            else:
+                finished = (_finish_worker(name) for name in names)
+            for name, error in finished:
+                if error is not None:
+                    logger.error('Could not finish layer %s: %s', name, error)
                     if verbosity > 0:
-                        msg = ('Stopping process because '
-                               '--ignore-errors was not set '
-                               'and an error was found.')
-                        print >> sys.stderr, msg
-                        msg = 'Failed to process %s' % filename
-                        raise Exception(msg, e), None, sys.exc_info()[2]
-
-        msg = "[%s] Layer for '%s' (%d/%d)" % (status, filename, i + 1, number)
-        info = {'file': filename, 'status': status}
-        if status == 'failed':
-            info['traceback'] = traceback
-            info['exception_type'] = exception_type
-            info['error'] = error
-        else:
-            info['name'] = layer.name
+                        print >> console, "[failed] Post processing of '%s'" % name
+                else:
+                    record(by_name[name])
+                    if by_name[name]['status'] == 'finished':
+                        output.append(by_name[name])
+    except:
+        if pool is not None:
+            pool.terminate()
+            pool = None
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if journal_file is not None:
+            journal_file.close()
 
-        output.append(info)
-        if verbosity > 0:
-            print >> console, msg
     return output
 
 
-def create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url=None):
+def thumbnail_spec(instance, thumbnail_remote_url):
+    """Describe what the thumbnail of ``instance`` is rendered from.
+
+    The reflector urls do not carry the extent nor the style of the layer,
+    add them so a change in either of them triggers a new thumbnail.
+    """
+    default_style = getattr(instance, 'default_style', None)
+    return '%s#bbox=%s&style=%s' % (
+        thumbnail_remote_url,
+        instance.bbox_string,
+        default_style.name if default_style else '')
+
+
+def create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url=None,
+                     force=False, http=None):
     BBOX_DIFFERENCE_THRESHOLD = 1e-5
 
     if not thumbail_create_url:
         thumbail_create_url = thumbnail_remote_url
 
+    if http is None:
+        http = thread_http_client()
+
+    thumb_spec = thumbnail_spec(instance, thumbnail_remote_url)
+
+    # Nothing changed since the last time, keep the current thumbnail.
+    if not force and instance.has_thumbnail() and instance.thumbnail.thumb_spec == thumb_spec:
+        return
+
     # Check if the bbox is invalid
     valid_x = (
         float(
@@ -526,7 +740,7 @@ def create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url=None):
         )
 
         # Download thumbnail and save it locally.
-        resp, image = http_client.request(thumbail_create_url)
+        resp, image = http.request(thumbail_create_url)
         if 'ServiceException' in image or resp.status < 200 or resp.status > 299:
             msg = 'Unable to obtain thumbnail: %s' % image
             logger.debug(msg)
@@ -543,7 +757,7 @@ def create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url=None):
             'layer-%s-thumb.png' %
             instance.id,
             ContentFile(image))
-        instance.thumbnail.thumb_spec = thumbnail_remote_url
+        instance.thumbnail.thumb_spec = thumb_spec
         instance.thumbnail.save()
 
         thumbnail_url = urljoin(
@@ -560,5 +774,6 @@ def create_thumbnail(instance, thumbnail_remote_url, thumbail_create_url=None):
                                    )
                                    )
     ResourceBase.objects.filter(id=instance.id).update(
+        thumbnail=instance.thumbnail,
         thumbnail_url=instance.get_thumbnail_url()
     )
@@ -42,6 +42,7 @@ from geonode.base.forms import CategoryForm
 from geonode.layers.models import Layer, Attribute
 from geonode.base.enumerations import CHARSETS
 from geonode.base.models import TopicCategory
+from geonode.base.popularity import count_view
 from geonode.layers.models import Layer
 
 from geonode.utils import default_map_config, llbbox_to_mercator
@@ -50,7 +51,6 @@ from geonode.utils import GXPMap
 from geonode.layers.utils import file_upload
 from geonode.utils import resolve_object
 from geonode.people.forms import ProfileForm, PocForm
-from geonode.security.views import _perms_info_json
 from geonode.documents.models import get_related_documents
 
 
@@ -220,10 +220,7 @@ def layer_detail(request, layername, template='layers/layer_detail.html'):
             layer_params=json.dumps(config))
 
     # Update count for popularity ranking.
-    Layer.objects.filter(
-        id=layer.id).update(
-        popular_count=layer.popular_count +
-        1)
+    count_view(layer)
 
     # center/zoom don't matter; the viewer will center on the layer bounds
     map_obj = GXPMap(projection="EPSG:900913")
@@ -234,7 +231,7 @@ def layer_detail(request, layername, template='layers/layer_detail.html'):
         name__in=settings.DOWNLOAD_FORMATS_METADATA)
     context_dict = {
         "resource": layer,
-        "permissions_json": _perms_info_json(layer),
+        "resource_perms": layer.get_user_perms(request.user),
         "documents": get_related_documents(layer),
         "metadata": metadata,
     }
@@ -343,11 +340,14 @@ def layer_metadata(request, layername, template='layers/layer_metadata.html'):
             la.save()
 
         if new_poc is not None and new_author is not None:
-            the_layer = layer_form.save()
+            # Saved once, so GeoServer and the catalogue are updated once.
+            the_layer = layer_form.save(commit=False)
+            layer_form.save_m2m()
             the_layer.poc = new_poc
             the_layer.metadata_author = new_author
             the_layer.keywords.clear()
             the_layer.keywords.add(*new_keywords)
+            the_layer.mark_changed('keywords')
             the_layer.category = new_category
             the_layer.save()
             return HttpResponseRedirect(
@@ -18,11 +18,15 @@
 #
 #########################################################################
 
+import hashlib
 import logging
 import uuid
+import zlib
+
+from contextlib import contextmanager
 
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import signals
 from django.utils import simplejson as json
 from django.contrib.contenttypes.models import ContentType
@@ -32,7 +36,7 @@ from django.core.urlresolvers import reverse
 from django.template.defaultfilters import slugify
 from django.core.cache import cache
 
-from geonode.layers.models import Layer
+from geonode.layers.models import Attribute, Layer
 from geonode.base.models import ResourceBase, resourcebase_post_save
 from geonode.maps.signals import map_changed_signal
 from geonode.utils import GXPMapBase
@@ -42,10 +46,23 @@ from geonode.utils import default_map_config
 from geonode.utils import num_encode
 
 from agon_ratings.models import OverallRating
+from guardian.shortcuts import get_objects_for_user
 
 logger = logging.getLogger("geonode.maps.models")
 
 
+@contextmanager
+def resolve_map_layers(names):
+    """Tell the local map layers saved in the block apart all at once.
+    """
+    if 'geonode.geoserver' in settings.INSTALLED_APPS:
+        from geonode.geoserver.helpers import local_layers
+        with local_layers(names):
+            yield
+    else:
+        yield
+
+
 class Map(ResourceBase, GXPMapBase):
 
     """
@@ -179,12 +196,14 @@ class Map(ResourceBase, GXPMapBase):
             layer.delete()
 
         self.keywords.add(*conf['map'].get('keywords', []))
+        self.mark_changed('keywords', 'layers')
 
-        for ordering, layer in enumerate(layers):
-            self.layer_set.add(
-                layer_from_viewer_config(
-                    MapLayer, layer, source_for(layer), ordering
-                ))
+        with resolve_map_layers([l.get('name') for l in layers]):
+            for ordering, layer in enumerate(layers):
+                self.layer_set.add(
+                    layer_from_viewer_config(
+                        MapLayer, layer, source_for(layer), ordering
+                    ))
 
         self.save()
 
@@ -235,31 +254,33 @@ class Map(ResourceBase, GXPMapBase):
         # used below for the maplayers.
         self.save()
 
-        for layer in layers:
-            if not isinstance(layer, Layer):
-                try:
-                    layer = Layer.objects.get(typename=layer)
-                except ObjectDoesNotExist:
+        names = [l.typename if isinstance(l, Layer) else l for l in layers]
+        with resolve_map_layers(names):
+            for layer in layers:
+                if not isinstance(layer, Layer):
+                    try:
+                        layer = Layer.objects.get(typename=layer)
+                    except ObjectDoesNotExist:
+                        raise Exception(
+                            'Could not find layer with name %s' %
+                            layer)
+
+                if not user.has_perm(
+                        'base.view_resourcebase',
+                        obj=layer.resourcebase_ptr):
+                    # invisible layer, skip inclusion or raise Exception?
                     raise Exception(
-                        'Could not find layer with name %s' %
-                        layer)
-
-            if not user.has_perm(
-                    'base.view_resourcebase',
-                    obj=layer.resourcebase_ptr):
-                # invisible layer, skip inclusion or raise Exception?
-                raise Exception(
-                    'User %s tried to create a map with layer %s without having premissions' %
-                    (user, layer))
-            MapLayer.objects.create(
-                map=self,
-                name=layer.typename,
-                ows_url=layer.get_ows_url(),
-                stack_order=index,
-                visibility=True
-            )
-
-            index += 1
+                        'User %s tried to create a map with layer %s without having premissions' %
+                        (user, layer))
+                MapLayer.objects.create(
+                    map=self,
+                    name=layer.typename,
+                    ows_url=layer.get_ows_url(),
+                    stack_order=index,
+                    visibility=True
+                )
+
+                index += 1
 
         # Set bounding box based on all layers extents.
         bbox = self.get_bbox_from_layers(self.local_layers)
@@ -280,9 +301,22 @@ class Map(ResourceBase, GXPMapBase):
     def snapshots(self):
         snapshots = MapSnapshot.objects.exclude(
             user=None).filter(
-            map__id=self.map.id)
+            map=self.id).select_related('user').only(
+            'id', 'map', 'created_dttm', 'user', 'user__username')
         return [snapshot for snapshot in snapshots]
 
+    def layer_configs(self, layers, user=None):
+        """
+        The viewer configurations of map layers. The layers of GeoNode shown
+        by the map layers not in the cache are looked up all together.
+        """
+        keys = [l.config_cache_key(user) for l in layers]
+        cached = cache.get_many([key for key in keys if key is not None])
+        missing = [l for l, key in zip(layers, keys) if key not in cached]
+        local_layers = local_layer_info(missing, user)
+        return [cached[key] if key in cached else l.build_layer_config(user, local_layers)
+                for l, key in zip(layers, keys)]
+
     @property
     def is_public(self):
         """
@@ -432,49 +466,49 @@ class MapLayer(models.Model, GXPLayerBase):
     local = models.BooleanField(default=False)
     # True if this layer is served by the local geoserver
 
+    def local_key(self):
+        """The key of the layer of GeoNode shown in local_layer_info"""
+        return (self.name, None if self.local else self.ows_url)
+
+    def config_cache_key(self, user=None):
+        if not self.id:
+            return None
+        return "layer_config" + str(self.id) + "_" + str(0 if user is None else user.id)
+
     def layer_config(self, user=None):
         # Try to use existing user-specific cache of layer config
-        if self.id:
-            cfg = cache.get("layer_config" +
-                            str(self.id) +
-                            "_" +
-                            str(0 if user is None else user.id))
+        key = self.config_cache_key(user)
+        if key is not None:
+            cfg = cache.get(key)
             if cfg is not None:
                 return cfg
+        return self.build_layer_config(user)
 
+    def build_layer_config(self, user=None, local_layers=None):
+        """
+        ``local_layers`` is what local_layer_info returned for map layers
+        including this one, the layer is looked up alone when not given.
+        """
         cfg = GXPLayerBase.layer_config(self, user=user)
+        if local_layers is None:
+            local_layers = local_layer_info([self], user)
         # if this is a local layer, get the attribute configuration that
         # determines display order & attribute labels
-        if Layer.objects.filter(typename=self.name).exists():
-            try:
-                if self.local:
-                    layer = Layer.objects.get(typename=self.name)
-                else:
-                    layer = Layer.objects.get(
-                        typename=self.name,
-                        service__base_url=self.ows_url)
-                attribute_cfg = layer.attribute_config()
-                if "getFeatureInfo" in attribute_cfg:
-                    cfg["getFeatureInfo"] = attribute_cfg["getFeatureInfo"]
-                if not user.has_perm(
-                        'base.view_resourcebase',
-                        obj=layer.resourcebase_ptr):
-                    cfg['disabled'] = True
-                    cfg['visibility'] = False
-            except:
-                # shows maplayer with pink tiles,
-                # and signals that there is problem
-                # TODO: clear orphaned MapLayers
-                layer = None
-
-        if self.id:
+        info = local_layers.get(self.local_key())
+        if info is not None:
+            attribute_cfg, viewable = info
+            if "getFeatureInfo" in attribute_cfg:
+                cfg["getFeatureInfo"] = attribute_cfg["getFeatureInfo"]
+            if user is not None and not viewable:
+                cfg['disabled'] = True
+                cfg['visibility'] = False
+
+        key = self.config_cache_key(user)
+        if key is not None:
             # Create temporary cache of maplayer config, should not last too long in case
             # local layer permissions or configuration values change (default
             # is 5 minutes)
-            cache.set("layer_config" +
-                      str(self.id) +
-                      "_" +
-                      str(0 if user is None else user.id), cfg)
+            cache.set(key, cfg)
         return cfg
 
     @property
@@ -502,6 +536,60 @@ class MapLayer(models.Model, GXPLayerBase):
         return '%s?layers=%s' % (self.ows_url, self.name)
 
 
+def local_layer_info(map_layers, user=None):
+    """
+    Looks up the layers of GeoNode shown by map layers with a query for the
+    layers, one for their visible attributes and one for the permissions
+    of user. Returns a dict from the local_key of a map layer to the
+    attribute configuration of its layer and whether user can view it.
+    """
+    names = set(l.name for l in map_layers if l.name)
+    if not names:
+        return {}
+
+    layers = {}
+    for layer_id, typename, base_url in Layer.objects.filter(
+            typename__in=names).values_list('id', 'typename', 'service__base_url'):
+        layers.setdefault(typename, []).append((layer_id, base_url))
+
+    matches = {}
+    for map_layer in map_layers:
+        key = map_layer.local_key()
+        if key in matches or map_layer.name not in layers:
+            continue
+        if map_layer.local:
+            found = [layer_id for layer_id, base_url in layers[map_layer.name] if base_url is None]
+        else:
+            found = [layer_id for layer_id, base_url in layers[map_layer.name]
+                     if base_url is not None and base_url == map_layer.ows_url]
+        if len(found) == 1:
+            matches[key] = found[0]
+    if not matches:
+        return {}
+
+    ids = set(matches.values())
+    attributes = {}
+    for layer_id, attribute, label in Attribute.objects.filter(
+            layer__in=ids, visible=True).order_by(
+            'display_order').values_list('layer', 'attribute', 'attribute_label'):
+        attributes.setdefault(layer_id, []).append((attribute, label))
+    viewable = set()
+    if user is not None:
+        viewable = set(get_objects_for_user(user, 'base.view_resourcebase').filter(
+            id__in=ids).values_list('id', flat=True))
+
+    info = {}
+    for key, layer_id in matches.items():
+        attribute_cfg = {}
+        if layer_id in attributes:
+            attribute_cfg["getFeatureInfo"] = {
+                "fields": [attribute for attribute, label in attributes[layer_id]],
+                "propertyNames": dict(attributes[layer_id])
+            }
+        info[key] = (attribute_cfg, layer_id in viewable)
+    return info
+
+
 def pre_delete_map(instance, sender, **kwrargs):
     ct = ContentType.objects.get_for_model(instance)
     OverallRating.objects.filter(
@@ -509,15 +597,65 @@ def pre_delete_map(instance, sender, **kwrargs):
         object_id=instance.id).delete()
 
 
+class SnapshotConfig(models.Model):
+
+    """
+    A map configuration saved by snapshots. Every distinct configuration is
+    stored once, compressed, under the SHA-1 of its content.
+    """
+
+    hash = models.CharField(max_length=40, unique=True)
+
+    data = models.BinaryField()
+    """
+    The JSON configuration compressed with zlib
+    """
+
+    @property
+    def config(self):
+        return zlib.decompress(self.data).decode('utf-8')
+
+
+class MapSnapshotManager(models.Manager):
+
+    def snapshot(self, map_obj, config, user=None):
+        """
+        Saves the JSON configuration of map_obj as a snapshot. A configuration
+        saved before shares its content, and if it is the last snapshot of
+        the map by the same user that snapshot is returned.
+        """
+        data = config.encode('utf-8') if isinstance(config, unicode) else config
+        digest = hashlib.sha1(data).hexdigest()
+        blob = SnapshotConfig.objects.filter(hash=digest).only('id').first()
+        if blob is None:
+            try:
+                with transaction.atomic():
+                    blob = SnapshotConfig.objects.create(hash=digest, data=zlib.compress(data))
+            except IntegrityError:
+                # Saved by a concurrent request
+                blob = SnapshotConfig.objects.only('id').get(hash=digest)
+
+        user_id = getattr(user, 'id', None)
+        latest = self.filter(map=map_obj).defer('config').order_by('-id').first()
+        if latest is not None and latest.blob_id == blob.id and latest.user_id == user_id:
+            return latest
+        return self.create(map=map_obj, blob=blob, user=user)
+
+
 class MapSnapshot(models.Model):
     map = models.ForeignKey(Map, related_name="snapshot_set")
     """
     The ID of the map this snapshot was generated from.
     """
 
-    config = models.TextField(_('JSON Configuration'))
+    blob = models.ForeignKey(SnapshotConfig, blank=True, null=True, on_delete=models.PROTECT)
+    """
+    Map configuration, shared by the snapshots with the same one
+    """
+
+    config = models.TextField(_('JSON Configuration'), blank=True, default='')
     """
-    Map configuration in JSON format
+    Map configuration in JSON format of snapshots saved before blob
     """
 
     created_dttm = models.DateTimeField(auto_now_add=True)
@@ -530,9 +668,17 @@ class MapSnapshot(models.Model):
     The user who created the snapshot.
     """
 
+    objects = MapSnapshotManager()
+
+    def get_config(self):
+        """The map configuration in JSON format"""
+        if self.blob_id is not None:
+            return self.blob.config
+        return self.config
+
     def json(self):
         return {
-            "map": self.map.id,
+            "map": self.map_id,
             "created": self.created_dttm.isoformat(),
             "user": self.user.username if self.user else None,
             "url": num_encode(self.id)
@@ -1,8 +1,9 @@
 from haystack import indexes
 from geonode.maps.models import Map
+from geonode.security.search_indexes import ViewPrincipalsMixin
 
 
-class MapIndex(indexes.SearchIndex, indexes.Indexable):
+class MapIndex(ViewPrincipalsMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
     title = indexes.CharField(model_attr="title", boost=2)
     # https://github.com/toastdriven/django-haystack/issues/569 - Necessary for sorting
@@ -20,10 +21,16 @@ class MapIndex(indexes.SearchIndex, indexes.Indexable):
     popular_count = indexes.IntegerField(model_attr="popular_count", default=0)
     keywords = indexes.MultiValueField(model_attr="keyword_list", null=True, faceted=True)
     thumbnail_url = indexes.CharField(model_attr="thumbnail_url", null=True)
+    acl = indexes.MultiValueField(null=True)
 
     def get_model(self):
         return Map
 
+    def index_queryset(self, using=None):
+        # Owners, keywords and view grants are loaded once for each batch.
+        return self.view_principals_queryset(
+            self.get_model().objects.select_related('owner').prefetch_related('keywords'))
+
     def prepare_type(self, obj):
         return "map"
 
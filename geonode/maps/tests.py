@@ -29,8 +29,9 @@ from agon_ratings.models import OverallRating
 from django.contrib.auth import get_user_model
 
 from geonode.layers.models import Layer
-from geonode.maps.models import Map
-from geonode.utils import default_map_config
+from geonode.maps.models import Map, MapSnapshot, SnapshotConfig
+from geonode.maps.views import snapshot_config
+from geonode.utils import default_map_config, num_encode
 from geonode.base.populate_test_data import create_models
 from geonode.maps.populate_maplayers import create_maplayers
 
@@ -207,6 +208,30 @@ community."
         self.assertEquals(cfg["about"]["title"], 'GeoNode Default Map')
         self.assertEquals(len(cfg["map"]["layers"]), 5)
 
+    def test_map_snapshots(self):
+        """Test snapshots share their compressed configuration"""
+        map_obj = Map.objects.get(id=1)
+        admin = get_user_model().objects.get(username=self.user)
+        bobby = get_user_model().objects.get(username='bobby')
+        config = json.dumps(map_obj.viewer_json(admin))
+
+        first = MapSnapshot.objects.snapshot(map_obj, config, user=admin)
+        self.assertEquals(first.get_config(), config)
+        self.assertTrue(len(first.blob.data) < len(config))
+
+        # Saving it again keeps the last snapshot
+        self.assertEquals(MapSnapshot.objects.snapshot(map_obj, config, user=admin).id, first.id)
+
+        second = MapSnapshot.objects.snapshot(map_obj, config, user=bobby)
+        self.assertNotEquals(second.id, first.id)
+        self.assertEquals(second.blob_id, first.blob_id)
+        self.assertEquals(SnapshotConfig.objects.count(), 1)
+
+        history = [snapshot.json() for snapshot in map_obj.snapshots]
+        self.assertEquals(sorted(s['user'] for s in history), ['admin', 'bobby'])
+        layers = snapshot_config(num_encode(first.id), map_obj, admin)['map']['layers']
+        self.assertEquals([l['name'] for l in layers], [l['name'] for l in json.loads(config)['map']['layers']])
+
     def test_map_to_json(self):
         """ Make some assertions about the data structure produced for serialization
             to a JSON map configuration"""
@@ -17,7 +17,6 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 #########################################################################
-import ast
 import math
 import logging
 
@@ -45,14 +44,13 @@ from geonode.utils import resolve_object
 from geonode.utils import http_client
 from geonode.utils import layer_from_viewer_config
 from geonode.maps.forms import MapForm
-from geonode.security.views import _perms_info_json
 from geonode.base.forms import CategoryForm
 from geonode.base.models import TopicCategory
+from geonode.base.popularity import count_view
 
 from geonode.documents.models import get_related_documents
 from geonode.people.forms import ProfileForm
 from geonode.utils import num_encode, num_decode
-from guardian.utils import get_anonymous_user
 
 if 'geonode.geoserver' in settings.INSTALLED_APPS:
     # FIXME: The post service providing the map_status object
@@ -141,8 +139,7 @@ def map_detail(request, mapid, snapshot=None, template='maps/map_detail.html'):
             'base.view_resourcebase',
             _PERMISSION_MSG_VIEW)
 
-    map_obj.popular_count += 1
-    map_obj.save()
+    count_view(map_obj)
 
     if snapshot is None:
         config = map_obj.viewer_json(request.user)
@@ -151,16 +148,12 @@ def map_detail(request, mapid, snapshot=None, template='maps/map_detail.html'):
 
     config = json.dumps(config)
     layers = MapLayer.objects.filter(map=map_obj.id)
-    all_perms = ast.literal_eval(_perms_info_json(map_obj))
-    user = request.user.username if request.user.is_authenticated() else get_anonymous_user().username
-    perms_dict = all_perms['users'][user]
     return render_to_response(template, RequestContext(request, {
         'config': config,
         'resource': map_obj,
         'layers': layers,
-        'permissions_json': _perms_info_json(map_obj),
         "documents": get_related_documents(map_obj),
-        'perms_dict': perms_dict,
+        'perms_dict': map_obj.get_user_perms(request.user),
     }))
 
 
@@ -230,14 +223,16 @@ def map_metadata(request, mapid, template='maps/map_metadata.html'):
                 new_author = author_form.save()
 
         if new_poc is not None and new_author is not None:
-            the_map = map_form.save()
+            # Saved once, so the map is synchronized once.
+            the_map = map_form.save(commit=False)
+            map_form.save_m2m()
             the_map.poc = new_poc
             the_map.metadata_author = new_author
             the_map.title = new_title
             the_map.abstract = new_abstract
-            the_map.save()
             the_map.keywords.clear()
             the_map.keywords.add(*new_keywords)
+            the_map.mark_changed('keywords')
             the_map.category = new_category
             the_map.save()
             return HttpResponseRedirect(
@@ -435,10 +430,9 @@ def map_json(request, mapid, snapshot=None):
             map_obj = _resolve_map(request, mapid, 'base.change_resourcebase')
         try:
             map_obj.update_from_viewer(request.body)
-            MapSnapshot.objects.create(
-                config=clean_config(
-                    request.body),
-                map=map_obj,
+            MapSnapshot.objects.snapshot(
+                map_obj,
+                clean_config(request.body),
                 user=request.user)
             return HttpResponse(json.dumps(map_obj.viewer_json(request.user)))
         except ValueError as e:
@@ -515,9 +509,9 @@ def new_map_json(request):
 
         try:
             map_obj.update_from_viewer(body)
-            MapSnapshot.objects.create(
-                config=clean_config(body),
-                map=map_obj,
+            MapSnapshot.objects.snapshot(
+                map_obj,
+                clean_config(body),
                 user=request.user)
         except ValueError as e:
             return HttpResponse(str(e), status=400)
@@ -881,8 +875,7 @@ def snapshot_config(snapshot, map_obj, user):
         return None
 
     # Set up the proper layer configuration
-    def snaplayer_config(layer, sources, user):
-        cfg = layer.layer_config()
+    def snaplayer_config(layer, cfg, sources):
         src_cfg = layer.source_config()
         source = snapsource_lookup(src_cfg, sources)
         if source:
@@ -896,9 +889,9 @@ def snapshot_config(snapshot, map_obj, user):
         return cfg
 
     decodedid = num_decode(snapshot)
-    snapshot = get_object_or_404(MapSnapshot, pk=decodedid)
-    if snapshot.map == map_obj.map:
-        config = json.loads(clean_config(snapshot.config))
+    snapshot = get_object_or_404(MapSnapshot.objects.select_related('blob'), pk=decodedid)
+    if snapshot.map_id == map_obj.id:
+        config = json.loads(clean_config(snapshot.get_config()))
         layers = [l for l in config["map"]["layers"]]
         sources = config["sources"]
         maplayers = []
@@ -915,10 +908,10 @@ def snapshot_config(snapshot, map_obj, user):
         config['map']['layers'] = [
             snaplayer_config(
                 l,
-                sources,
-                user) for l in maplayers]
+                cfg,
+                sources) for l, cfg in zip(maplayers, map_obj.layer_configs(maplayers, user=user))]
     else:
-        config = map_obj.viewer_json()
+        config = map_obj.viewer_json(user)
     return config
 
 
@@ -970,10 +963,9 @@ def snapshot_create(request):
 
     if isinstance(conf, basestring):
         config = json.loads(conf)
-        snapshot = MapSnapshot.objects.create(
-            config=clean_config(conf),
-            map=Map.objects.get(
-                id=config['id']))
+        snapshot = MapSnapshot.objects.snapshot(
+            Map.objects.get(id=config['id']),
+            clean_config(conf))
         return HttpResponse(num_encode(snapshot.id), mimetype="text/plain")
     else:
         return HttpResponse("Invalid JSON", mimetype="text/plain", status=500)
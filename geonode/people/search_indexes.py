@@ -1,5 +1,6 @@
 from haystack import indexes
 from geonode.people.models import Profile
+from geonode.security.models import PUBLIC_PRINCIPAL
 
 
 class ProfileIndex(indexes.SearchIndex, indexes.Indexable):
@@ -12,6 +13,7 @@ class ProfileIndex(indexes.SearchIndex, indexes.Indexable):
     position = indexes.CharField(model_attr='position', null=True)
     text = indexes.CharField(document=True, use_template=True)
     type = indexes.CharField(faceted=True)
+    acl = indexes.MultiValueField(null=True)
 
     def get_model(self):
         return Profile
@@ -24,3 +26,6 @@ class ProfileIndex(indexes.SearchIndex, indexes.Indexable):
 
     def prepare_type(self, obj):
         return "user"
+
+    def prepare_acl(self, obj):
+        return [PUBLIC_PRINCIPAL]
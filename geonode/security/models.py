@@ -18,13 +18,28 @@
 #
 #########################################################################
 
+import logging
+import uuid
+
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
 from django.contrib.auth import login
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import get_model, signals
 
+from guardian.core import ObjectPermissionChecker
 from guardian.shortcuts import assign_perm, remove_perm, \
-    get_groups_with_perms, get_users_with_perms
+    get_anonymous_user, get_groups_with_perms, get_users_with_perms
+
+logger = logging.getLogger(__name__)
 
 ADMIN_PERMISSIONS = [
     'view_resourcebase',
@@ -34,10 +49,214 @@ ADMIN_PERMISSIONS = [
 ]
 
 
+PUBLIC_PRINCIPAL = 'public'
+
+
 class PermissionLevelError(Exception):
     pass
 
 
+def user_principal(user_id):
+    return 'user%d' % user_id
+
+
+def group_principal(group_id):
+    return 'group%d' % group_id
+
+
+def get_user_principals(user):
+    """
+    Returns the principals a user is acting as, resources listing any
+    of them in their ACL are visible to the user.
+    """
+    principals = [PUBLIC_PRINCIPAL]
+    if user.is_authenticated():
+        principals.append(user_principal(user.id))
+        principals.extend(group_principal(group_id)
+                          for group_id in user.groups.values_list('id', flat=True))
+    return principals
+
+
+def view_grants(resource_ids):
+    """
+    Returns the ids of the users, and of the groups, allowed to view each
+    of the resources, keyed by resource id, with one query per guardian
+    table.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+
+    lookup = dict(
+        content_type__app_label='base',
+        content_type__model='resourcebase',
+        permission__codename='view_resourcebase',
+        object_pk__in=[str(resource_id) for resource_id in resource_ids])
+
+    users = {}
+    for object_pk, user_id in UserObjectPermission.objects.filter(**lookup).values_list('object_pk', 'user_id'):
+        users.setdefault(int(object_pk), set()).add(user_id)
+    groups = {}
+    for object_pk, group_id in GroupObjectPermission.objects.filter(**lookup).values_list('object_pk', 'group_id'):
+        groups.setdefault(int(object_pk), set()).add(group_id)
+    return users, groups
+
+
+def _permissions_version_key(resource_id):
+    return 'resource_permissions_version_%d' % resource_id
+
+
+# Versions the superusers and the names of the users and groups, listed in
+# the permissions of every resource.
+PRINCIPALS_VERSION_KEY = 'resource_permissions_principals_version'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version):
+            version = cache.get(key) or version
+    return version
+
+
+def get_permissions_version(resource_id):
+    """
+    A stamp changing whenever the permissions of the resource change, to
+    version what is cached about them. It changes as well when a superuser,
+    a user name or a group name changes.
+    """
+    return '%s_%s' % (_get_version(_permissions_version_key(resource_id)),
+                      _get_version(PRINCIPALS_VERSION_KEY))
+
+
+def bump_permissions_version(resource_ids):
+    cache.set_many(dict((_permissions_version_key(resource_id), uuid.uuid4().hex)
+                        for resource_id in resource_ids))
+
+
+_acl_updates = local()
+
+
+@contextmanager
+def acl_update_batch():
+    """
+    Collect the resources whose permissions change inside the block, bump
+    their permissions version and update their search ACL once at the end.
+    """
+    if getattr(_acl_updates, 'pending', None) is not None:
+        yield
+        return
+
+    _acl_updates.pending = set()
+    _acl_updates.changed = set()
+    try:
+        yield
+    finally:
+        pending, _acl_updates.pending = _acl_updates.pending, None
+        changed, _acl_updates.changed = _acl_updates.changed, None
+        if changed:
+            bump_permissions_version(changed)
+        if pending:
+            update_search_acl(pending)
+
+
+def batch_acl_updates(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with acl_update_batch():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def update_search_acl(resource_ids):
+    """
+    Reindex the given resources so the search backend sees their new ACL,
+    with one update per type of resource.
+    """
+    from haystack import connections
+    from haystack.exceptions import NotHandled
+    from geonode.base.models import ResourceBase
+
+    unified_index = connections['default'].get_unified_index()
+    grants = view_grants(resource_ids)
+    by_type = {}
+    for resource in ResourceBase.objects.polymorphic_queryset().filter(id__in=resource_ids):
+        resource.index_view_grants = grants
+        by_type.setdefault(type(resource), []).append(resource)
+
+    for model, resources in by_type.items():
+        try:
+            index = unified_index.get_index(model)
+        except NotHandled:
+            continue
+        backend = index._get_backend(None)
+        if backend is None:
+            continue
+        try:
+            backend.update(index, [resource for resource in resources if index.should_update(resource)])
+        except Exception:
+            logger.exception('Could not update the search ACL of resources %s',
+                             ', '.join(str(resource.id) for resource in resources))
+
+
+def apply_permissions(resource_ids, perms, user_ids=(), group_ids=(), grant=True):
+    """
+    Grants, or revokes if grant is False, permissions on resources to users
+    and groups, with one INSERT or DELETE per guardian table in a single
+    transaction. Returns the number of permissions added or removed by
+    resource id.
+
+    New rows are inserted without signals and the revoked ones deleted in
+    the update batch, the permissions version and the search ACL of the
+    resources changed are updated once at the end.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+
+    ctype = ContentType.objects.get_by_natural_key('base', 'resourcebase')
+    permissions = dict(Permission.objects.filter(
+        content_type=ctype, codename__in=perms).values_list('id', 'codename'))
+    unknown = set(perms) - set(permissions.values())
+    if unknown:
+        raise PermissionLevelError('Unknown permissions: %s' % ', '.join(sorted(unknown)))
+
+    resource_ids = set(int(resource_id) for resource_id in resource_ids)
+    user_ids, group_ids = set(user_ids), set(group_ids)
+    object_pks = [str(resource_id) for resource_id in resource_ids]
+    changes = dict((resource_id, 0) for resource_id in resource_ids)
+    with acl_update_batch():
+        with transaction.atomic():
+            for model, principal, principal_ids in ((UserObjectPermission, 'user', user_ids),
+                                                    (GroupObjectPermission, 'group', group_ids)):
+                if not principal_ids or not object_pks or not permissions:
+                    continue
+                rows = model.objects.filter(**{
+                    'content_type': ctype,
+                    'object_pk__in': object_pks,
+                    'permission__in': permissions.keys(),
+                    principal + '__in': principal_ids})
+                existing = set(rows.values_list('object_pk', 'permission', principal))
+                if grant:
+                    added = [(object_pk, permission_id, principal_id)
+                             for object_pk in object_pks
+                             for permission_id in permissions
+                             for principal_id in principal_ids
+                             if (object_pk, permission_id, principal_id) not in existing]
+                    model.objects.bulk_create([
+                        model(content_type=ctype, object_pk=object_pk, permission_id=permission_id,
+                              **{principal + '_id': principal_id})
+                        for object_pk, permission_id, principal_id in added], batch_size=1000)
+                else:
+                    added = existing
+                    rows.delete()
+                for object_pk, permission_id, principal_id in added:
+                    changes[int(object_pk)] += 1
+
+        changed = [resource_id for resource_id, count in changes.items() if count]
+        _acl_updates.changed.update(changed)
+        if 'view_resourcebase' in permissions.values() and getattr(settings, 'HAYSTACK_SEARCH', False):
+            _acl_updates.pending.update(changed)
+    return changes
+
+
 class PermissionLevelMixin(object):
 
     """
@@ -61,11 +280,43 @@ class PermissionLevelMixin(object):
                 attach_perms=True)}
         return info
 
+    def get_view_principals(self, grants=None):
+        """
+        Returns the ACL stored in the search index: the public principal if
+        the anonymous user can view the resource, or the users and groups
+        allowed to view it. grants are the view grants of many resources
+        read beforehand with view_grants, they are read for this resource
+        when not given.
+        """
+        if grants is None:
+            grants = view_grants([self.id])
+        users, groups = grants
+
+        user_ids = set(users.get(self.id, ()))
+        if settings.ANONYMOUS_USER_ID in user_ids:
+            return [PUBLIC_PRINCIPAL]
+
+        user_ids.add(self.owner_id)
+        principals = [user_principal(user_id) for user_id in user_ids if user_id is not None]
+        principals.extend(group_principal(group_id) for group_id in groups.get(self.id, ()))
+        return principals
+
+    def get_user_perms(self, user):
+        """
+        The codenames of the permissions user has on the resource, given to
+        the user or to a group of the user. Anonymous users get the ones of
+        the anonymous user.
+        """
+        if not user.is_authenticated():
+            user = get_anonymous_user()
+        return ObjectPermissionChecker(user).get_perms(self.get_self_resource())
+
     def get_self_resource(self):
         return self.resourcebase_ptr if hasattr(
             self,
             'resourcebase_ptr') else self
 
+    @batch_acl_updates
     def remove_all_permissions(self):
         """
         Remove all the permissions for users and groups except for the resource owner
@@ -79,6 +330,7 @@ class PermissionLevelMixin(object):
             for perm in perms:
                 remove_perm(perm, group, self.get_self_resource())
 
+    @batch_acl_updates
     def set_default_permissions(self):
         """
         Remove all the permissions except for the owner and assign the
@@ -90,6 +342,7 @@ class PermissionLevelMixin(object):
         for perm in ADMIN_PERMISSIONS:
             assign_perm(perm, self.owner, self.get_self_resource())
 
+    @batch_acl_updates
     def set_permissions(self, perm_spec):
         """
         Sets an object's the permission levels based on the perm_spec JSON.
@@ -143,5 +396,87 @@ def autologin(sender, **kwargs):
     # This login function does not need password.
     login(request, user)
 
+_view_permission = {}
+
+
+def _view_permission_id():
+    if 'id' not in _view_permission:
+        _view_permission['id'] = Permission.objects.get(
+            content_type__app_label='base',
+            codename='view_resourcebase').id
+    return _view_permission['id']
+
+
+def object_permission_changed(instance, sender, **kwargs):
+    """
+    Bump the permissions version of the resource, and keep the ACL stored
+    in the search index in sync with the view permission.
+    """
+    if kwargs.get('raw', False):
+        return
+    if instance.content_type_id != ContentType.objects.get_by_natural_key('base', 'resourcebase').id:
+        return
+
+    resource_id = int(instance.object_pk)
+    changed = getattr(_acl_updates, 'changed', None)
+    if changed is not None:
+        changed.add(resource_id)
+    else:
+        bump_permissions_version([resource_id])
+
+    if not getattr(settings, 'HAYSTACK_SEARCH', False):
+        return
+    if instance.permission_id != _view_permission_id():
+        return
+
+    pending = getattr(_acl_updates, 'pending', None)
+    if pending is not None:
+        pending.add(resource_id)
+    else:
+        update_search_acl([resource_id])
+
+
+def principals_changed(instance, sender, **kwargs):
+    """
+    Bump the permissions version of every resource when a superuser, a user
+    name or a group name changes, they are listed in their permissions.
+    """
+    if kwargs.get('raw', False):
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not set(update_fields) & set(['username', 'is_superuser', 'name']):
+        return
+    # A new user only shows up in the permissions of resources as a superuser.
+    if kwargs.get('created', False) and not getattr(instance, 'is_superuser', False):
+        return
+    cache.set(PRINCIPALS_VERSION_KEY, uuid.uuid4().hex)
+
+
+def connect_permission_signals(sender, **kwargs):
+    opts = sender._meta
+    if opts.app_label == 'guardian' and opts.object_name in OBJECT_PERMISSION_MODELS:
+        signals.post_save.connect(object_permission_changed, sender=sender)
+        signals.post_delete.connect(object_permission_changed, sender=sender)
+    elif '%s.%s' % (opts.app_label, opts.object_name) == settings.AUTH_USER_MODEL:
+        signals.post_save.connect(principals_changed, sender=sender)
+        signals.post_delete.connect(principals_changed, sender=sender)
+
+
+# Importing guardian.models here loads the user model, and with it every app,
+# while geonode.base.models is still being imported. The handlers are connected
+# to the object permission models and to the user model when they are defined
+# instead, or right away if they already are.
+OBJECT_PERMISSION_MODELS = ('UserObjectPermission', 'GroupObjectPermission')
+signals.class_prepared.connect(connect_permission_signals)
+PERMISSION_SIGNAL_MODELS = [('guardian', name) for name in OBJECT_PERMISSION_MODELS]
+PERMISSION_SIGNAL_MODELS.append(tuple(settings.AUTH_USER_MODEL.split('.')))
+for app_label, model_name in PERMISSION_SIGNAL_MODELS:
+    model = get_model(app_label, model_name, seed_cache=False, only_installed=False)
+    if model is not None:
+        connect_permission_signals(model)
+
+signals.post_save.connect(principals_changed, sender=Group)
+signals.post_delete.connect(principals_changed, sender=Group)
+
 # FIXME(Ariel): Replace this signal with the one from django-user-accounts
 # user_activated.connect(autologin)
@@ -0,0 +1,38 @@
+from geonode.security.models import view_grants
+
+
+class ViewGrantsQuerySetMixin(object):
+
+    """Reads the view grants of each batch of resources loaded at once"""
+
+    def iterator(self):
+        resources = list(super(ViewGrantsQuerySetMixin, self).iterator())
+        grants = view_grants([resource.id for resource in resources])
+        for resource in resources:
+            resource.index_view_grants = grants
+            yield resource
+
+
+_view_grants_querysets = {}
+
+
+class ViewPrincipalsMixin(object):
+
+    """Prepare the acl field of resource indexes
+
+       The view grants of the resources loaded by the index queryset are
+       read once for every batch Haystack prepares instead of once per
+       resource.
+    """
+
+    def view_principals_queryset(self, queryset):
+        klass = type(queryset)
+        if klass not in _view_grants_querysets:
+            _view_grants_querysets[klass] = type(
+                'ViewGrants%s' % klass.__name__, (ViewGrantsQuerySetMixin, klass), {})
+        queryset = queryset.all()
+        queryset.__class__ = _view_grants_querysets[klass]
+        return queryset
+
+    def prepare_acl(self, obj):
+        return obj.get_view_principals(getattr(obj, 'index_view_grants', None))
@@ -18,12 +18,24 @@
 #
 #########################################################################
 
+from django.conf import settings
 from django.utils import simplejson as json
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.db.models import Count
 from geonode.utils import resolve_object
 from django.http import HttpResponse
 
+from guardian.models import UserObjectPermission, GroupObjectPermission
+
 from geonode.base.models import ResourceBase
+from geonode.security.models import get_permissions_version
+
+# Users listed per page of the permissions of a resource, when paged.
+PERMISSIONS_PAGE_SIZE = getattr(settings, 'PERMISSIONS_PAGE_SIZE', 100)
+PERMISSIONS_MAX_PAGE_SIZE = getattr(settings, 'PERMISSIONS_MAX_PAGE_SIZE', 1000)
 
 
 def _perms_info(obj):
@@ -33,13 +45,76 @@ def _perms_info(obj):
 
 
 def _perms_info_json(obj):
+    # Cached until the permissions of the resource, the superusers or the
+    # names of the users and groups change
+    resource_id = obj.get_self_resource().id
+    key = 'resource_permissions_%d_%s' % (resource_id, get_permissions_version(resource_id))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
     info = _perms_info(obj)
     info['users'] = dict([(u.username, perms)
                           for u, perms in info['users'].items()])
     info['groups'] = dict([(g.name, perms)
                            for g, perms in info['groups'].items()])
 
-    return json.dumps(info)
+    info = json.dumps(info)
+    cache.set(key, info)
+    return info
+
+
+def _object_perms(model, resource):
+    # The rows of a guardian table granting permissions on the resource
+    return model.objects.filter(
+        content_type=ContentType.objects.get_by_natural_key('base', 'resourcebase'),
+        object_pk=str(resource.id))
+
+
+def _perms_summary(resource):
+    """
+    The number of users and groups given each permission on the resource,
+    superusers are only counted when the permission was given to them.
+    """
+    users = _object_perms(UserObjectPermission, resource)
+    groups = _object_perms(GroupObjectPermission, resource)
+    return {
+        'public': users.filter(
+            user=settings.ANONYMOUS_USER_ID,
+            permission__codename='view_resourcebase').exists(),
+        'users': dict(users.order_by().values_list('permission__codename').annotate(Count('id'))),
+        'groups': dict(groups.order_by().values_list('permission__codename').annotate(Count('id'))),
+    }
+
+
+def _perms_page(resource, username=None, page=1, page_size=PERMISSIONS_PAGE_SIZE):
+    """
+    A page of the users given permissions on the resource ordered by
+    username, only the ones whose username starts with username if given,
+    and all the groups.
+    """
+    users = _object_perms(UserObjectPermission, resource)
+    if username:
+        users = users.filter(user__username__istartswith=username)
+    paginator = Paginator(
+        users.order_by('user__username').values_list('user__username', flat=True).distinct(),
+        page_size)
+    try:
+        current = paginator.page(page)
+    except PageNotAnInteger:
+        current = paginator.page(1)
+    except EmptyPage:
+        current = paginator.page(paginator.num_pages)
+
+    info = {'users': {}, 'groups': {}}
+    for name, codename in users.filter(
+            user__username__in=list(current.object_list)).values_list('user__username', 'permission__codename'):
+        info['users'].setdefault(name, []).append(codename)
+    for name, codename in _object_perms(GroupObjectPermission, resource).values_list(
+            'group__name', 'permission__codename'):
+        info['groups'].setdefault(name, []).append(codename)
+    info.update(count=paginator.count, page=current.number, pages=paginator.num_pages)
+    return info
 
 
 def resource_permissions(request, resource_id):
@@ -65,6 +140,29 @@ def resource_permissions(request, resource_id):
             mimetype='text/plain'
         )
 
+    elif request.method == 'GET' and 'summary' in request.GET:
+        return HttpResponse(
+            json.dumps({'success': True, 'summary': _perms_summary(resource)}),
+            status=200,
+            mimetype='text/plain'
+        )
+
+    elif request.method == 'GET' and any(p in request.GET for p in ('page', 'page_size', 'username')):
+        try:
+            page_size = min(int(request.GET.get('page_size', PERMISSIONS_PAGE_SIZE)), PERMISSIONS_MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = PERMISSIONS_PAGE_SIZE
+        permissions = _perms_page(
+            resource,
+            username=request.GET.get('username'),
+            page=request.GET.get('page', 1),
+            page_size=max(page_size, 1))
+        return HttpResponse(
+            json.dumps({'success': True, 'permissions': permissions}),
+            status=200,
+            mimetype='text/plain'
+        )
+
     elif request.method == 'GET':
         permission_spec = _perms_info_json(resource)
         return HttpResponse(
@@ -52,7 +52,8 @@ from geonode.utils import bbox_to_wkt
 from geonode.services.forms import CreateServiceForm, ServiceForm
 from geonode.utils import mercator_to_llbbox
 from geonode.layers.utils import create_thumbnail
-from geonode.geoserver.helpers import set_attributes
+from geonode.geoserver import schema
+from geonode.geoserver.helpers import fetch_remote_attribute_maps, set_attributes
 from geonode.base.models import Link
 
 logger = logging.getLogger("geonode.core.layers.views")
@@ -583,6 +584,12 @@ def _register_indexed_layers(service, wms=None, verbosity=False):
     if re.match("WMS|OWS", service.type):
         wms = wms or WebMapService(service.base_url)
         count = 0
+        # Describe the attributes of the new layers all at once.
+        existing = set(Layer.objects.filter(service=service).values_list('typename', flat=True))
+        schemas = fetch_remote_attribute_maps(service.base_url, [
+            (wms[layer].name, list(wms[layer].boundingBoxWGS84 or (-179.0, -89.0, 179.0, 89.0)))
+            for layer in list(wms.contents)
+            if wms[layer] is not None and wms[layer].name is not None and wms[layer].name not in existing])
         for layer in list(wms.contents):
             wms_layer = wms[layer]
             if wms_layer is None or wms_layer.name is None:
@@ -620,41 +627,42 @@ def _register_indexed_layers(service, wms=None, verbosity=False):
             bbox = list(
                 wms_layer.boundingBoxWGS84 or (-179.0, -89.0, 179.0, 89.0))
 
-            # Need to check if layer already exists??
-            saved_layer, created = Layer.objects.get_or_create(
-                typename=wms_layer.name,
-                service=service,
-                defaults=dict(
-                    name=wms_layer.name,
-                    store=service.name,  # ??
-                    storeType="remoteStore",
-                    workspace="remoteWorkspace",
-                    title=wms_layer.title or wms_layer.name,
-                    abstract=abstract or _("Not provided"),
-                    uuid=layer_uuid,
-                    owner=None,
-                    srid=srid,
-                    bbox_x0=bbox[0],
-                    bbox_x1=bbox[2],
-                    bbox_y0=bbox[1],
-                    bbox_y1=bbox[3]
-                )
-            )
-            if created:
-                saved_layer.save()
-                saved_layer.set_default_permissions()
-                saved_layer.keywords.add(*keywords)
-                set_attributes(saved_layer)
-
-                service_layer, created = ServiceLayer.objects.get_or_create(
+            with schema.prefetched(schemas):
+                # Need to check if layer already exists??
+                saved_layer, created = Layer.objects.get_or_create(
                     typename=wms_layer.name,
-                    service=service
+                    service=service,
+                    defaults=dict(
+                        name=wms_layer.name,
+                        store=service.name,  # ??
+                        storeType="remoteStore",
+                        workspace="remoteWorkspace",
+                        title=wms_layer.title or wms_layer.name,
+                        abstract=abstract or _("Not provided"),
+                        uuid=layer_uuid,
+                        owner=None,
+                        srid=srid,
+                        bbox_x0=bbox[0],
+                        bbox_x1=bbox[2],
+                        bbox_y0=bbox[1],
+                        bbox_y1=bbox[3]
+                    )
                 )
-                service_layer.layer = saved_layer
-                service_layer.title = wms_layer.title
-                service_layer.description = wms_layer.abstract
-                service_layer.styles = wms_layer.styles
-                service_layer.save()
+                if created:
+                    saved_layer.save()
+                    saved_layer.set_default_permissions()
+                    saved_layer.keywords.add(*keywords)
+                    set_attributes(saved_layer)
+
+                    service_layer, created = ServiceLayer.objects.get_or_create(
+                        typename=wms_layer.name,
+                        service=service
+                    )
+                    service_layer.layer = saved_layer
+                    service_layer.title = wms_layer.title
+                    service_layer.description = wms_layer.abstract
+                    service_layer.styles = wms_layer.styles
+                    service_layer.save()
             count += 1
         message = "%d Layers Registered" % count
         return_dict = {'status': 'ok', 'msg': message}
@@ -406,7 +406,8 @@ OGC_SERVER = {
         'WPS_ENABLED': True,
         # Set to name of database in DATABASES dictionary to enable
         'DATASTORE': '',  # 'datastore',
-        'TIMEOUT': 10  # number of seconds to allow for HTTP requests
+        'TIMEOUT': 10,  # number of seconds to allow for HTTP requests
+        'CATALOG_CACHE_TTL': 5  # number of seconds REST catalog reads are reused
     }
 }
 
@@ -585,6 +586,8 @@ HAYSTACK_SEARCH = False
 SKIP_PERMS_FILTER = False
 # Update facet counts from Haystack
 HAYSTACK_FACET_COUNTS = False
+# Seconds the search facets of anonymous users are cached, 0 disables it
+HAYSTACK_FACET_CACHE_TIME = 0
 # HAYSTACK_CONNECTIONS = {
 #    'default': {
 #        'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
@@ -22,6 +22,7 @@ import base64
 import math
 import copy
 import string
+import threading
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
@@ -43,6 +44,17 @@ BASE = len(ALPHABET)
 SIGN_CHARACTER = '$'
 
 http_client = httplib2.Http()
+_http_clients = threading.local()
+
+
+def thread_http_client():
+    """
+    The http client of the current thread, an httplib2.Http can not be
+    used by several threads at the same time.
+    """
+    if not hasattr(_http_clients, 'http'):
+        _http_clients.http = httplib2.Http()
+    return _http_clients.http
 
 
 def _get_basic_auth_info(request):
@@ -56,14 +68,117 @@ def _get_basic_auth_info(request):
     return username, password
 
 
+def _batch_resources(spec):
+    """
+    The resources of a batch request, by id with "resources": [...], or
+    matching a search with "filter": {"type":, "title":, "owner":,
+    "category":, "keywords": [...]}.
+    """
+    from geonode.base.models import ResourceBase
+    from geonode.documents.models import Document
+    from geonode.layers.models import Layer
+    from geonode.maps.models import Map
+
+    if 'resources' in spec:
+        return ResourceBase.objects.filter(id__in=[int(i) for i in spec['resources']])
+
+    search = spec['filter']
+    resources = ResourceBase.objects.all()
+    if search.get('type'):
+        resources = resources.instance_of({'layer': Layer, 'map': Map, 'document': Document}[search['type']])
+    if search.get('title'):
+        resources = resources.filter(title__icontains=search['title'])
+    if search.get('owner'):
+        resources = resources.filter(owner__username=search['owner'])
+    if search.get('category'):
+        resources = resources.filter(category__identifier=search['category'])
+    if search.get('keywords'):
+        resources = resources.filter(keywords__slug__in=search['keywords']).distinct()
+    return resources
+
+
 def batch_permissions(request):
-    # TODO
-    pass
+    """
+    Grant or revoke permissions on many resources at once, posted as
+    {"action": "grant" or "revoke", "permissions": [...], "users": [...],
+    "groups": [...]} with the resources, see _batch_resources. Responds
+    with the result for each resource: the number of permissions changed,
+    or "forbidden" if the user can not change its permissions.
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Group
+    from guardian.shortcuts import get_objects_for_user
+    from geonode.security.models import PermissionLevelError, apply_permissions
+
+    if request.method != 'POST':
+        return HttpResponse('Batch permissions requires a POST', status=405)
+    if not request.user.is_authenticated():
+        return HttpResponse('You must be logged in to change permissions', status=401)
+
+    try:
+        spec = json.loads(request.body)
+        if spec.get('action', 'grant') not in ('grant', 'revoke'):
+            raise ValueError(spec['action'])
+        resource_ids = set(_batch_resources(spec).values_list('id', flat=True))
+        usernames = set(spec.get('users', []))
+        user_ids = set(get_user_model().objects.filter(
+            username__in=usernames).values_list('id', flat=True))
+        group_names = set(spec.get('groups', []))
+        group_ids = set(Group.objects.filter(name__in=group_names).values_list('id', flat=True))
+        perms = list(spec['permissions'])
+    except (ValueError, AttributeError, TypeError, KeyError):
+        return HttpResponse('Invalid batch permissions request', status=400)
+    if len(user_ids) != len(usernames) or len(group_ids) != len(group_names):
+        return HttpResponse('Unknown users or groups', status=400)
+
+    allowed = set(get_objects_for_user(
+        request.user,
+        'base.change_resourcebase_permissions').filter(id__in=resource_ids).values_list('id', flat=True))
+    try:
+        changes = apply_permissions(
+            allowed, perms, user_ids, group_ids, grant=spec.get('action', 'grant') == 'grant')
+    except PermissionLevelError as e:
+        return HttpResponse(str(e), status=400)
+
+    results = dict((resource_id, changes.get(resource_id, 'forbidden')) for resource_id in resource_ids)
+    return HttpResponse(json.dumps({'success': True, 'resources': results}), mimetype='application/json')
 
 
 def batch_delete(request):
-    # TODO
-    pass
+    """
+    Delete the layers and maps whose ids are posted as
+    {"layers": [...], "maps": [...]}, the user has to be allowed to
+    delete every one of them.
+    """
+    from geonode.layers.models import Layer
+    from geonode.layers.utils import delete_layers
+    from geonode.maps.models import Map
+
+    if request.method != 'POST':
+        return HttpResponse('Batch delete requires a POST', status=405)
+    if not request.user.is_authenticated():
+        return HttpResponse('You must be logged in to delete resources', status=401)
+
+    try:
+        spec = json.loads(request.body)
+        layers = list(Layer.objects.filter(id__in=spec.get('layers', [])))
+        maps = list(Map.objects.filter(id__in=spec.get('maps', [])))
+    except (ValueError, AttributeError, TypeError):
+        return HttpResponse('Invalid batch delete request', status=400)
+
+    for resource in layers + maps:
+        if not request.user.has_perm('base.delete_resourcebase', obj=resource.get_self_resource()):
+            return HttpResponse(
+                'You are not allowed to delete %s' % resource.title,
+                status=403)
+
+    deleted_layers = delete_layers(layers)
+    for m in maps:
+        m.delete()
+
+    return HttpResponse(
+        json.dumps({'layers': deleted_layers, 'maps': len(maps)}),
+        mimetype='application/json')
 
 
 def _split_query(query):
@@ -183,6 +298,13 @@ def layer_from_viewer_config(model, layer, source, ordering):
 
 class GXPMapBase(object):
 
+    def layer_configs(self, layers, user=None):
+        """
+        The viewer configurations of layers, to be overridden by maps able
+        to look them up together.
+        """
+        return [l.layer_config(user=user) for l in layers]
+
     def viewer_json(self, user, *added_layers):
         """
         Convert this map to a nested dictionary structure matching the JSON
@@ -237,8 +359,7 @@ class GXPMapBase(object):
                     return k
             return None
 
-        def layer_config(l, user=None):
-            cfg = l.layer_config(user=user)
+        def layer_config(l, cfg):
             src_cfg = l.source_config()
             source = source_lookup(src_cfg)
             if source:
@@ -271,6 +392,7 @@ class GXPMapBase(object):
                 sources[
                     str(int(max(sources.keys(), key=int)) + 1)] = lyr["source"]
 
+        layer_configs = self.layer_configs(layers, user=user)
         config = {
             'id': self.id,
             'about': {
@@ -280,7 +402,7 @@ class GXPMapBase(object):
             'defaultSourceType': "gxp_wmscsource",
             'sources': sources,
             'map': {
-                'layers': [layer_config(l, user=user) for l in layers],
+                'layers': [layer_config(l, layer_cfg) for l, layer_cfg in zip(layers, layer_configs)],
                 'center': [self.center_x, self.center_y],
                 'projection': self.projection,
                 'zoom': self.zoom